@@ -22,6 +22,7 @@ class Settings(BaseSettings):
     LOGS_DIR: Path = BASE_DIR / "logs"              # 日志文件目录
     EXAMPLES_DIR: Path = BASE_DIR / "examples"      # 代码示例存储目录
     CONFIG_DIR: Path = BASE_DIR / "config"          # 系统，用户提示词存储目录
+    ARTIFACTS_DIR: Path = BASE_DIR / "artifacts"    # 单元格输出图片存储目录
     
     # CORS配置
     CORS_ORIGINS: List[str] = ["*"]
@@ -39,6 +40,64 @@ class Settings(BaseSettings):
     SILICONFLOW_API_KEY: str = Field(default="", env="SILICONFLOW_API_KEY")
     SILICONFLOW_API_BASE: str = Field(default="https://api.siliconflow.com/v1", env="SILICONFLOW_API_BASE")
     
+    # 代码执行配置
+    # 会话运行模式: "inprocess" 在服务进程内执行, "process" 每个会话使用独立的工作进程
+    SESSION_MODE: str = Field(default="inprocess", env="SESSION_MODE")
+    # 执行代码的线程池大小，即同时执行的会话数上限
+    EXECUTION_WORKERS: int = Field(default=8, env="EXECUTION_WORKERS")
+    # 单元格执行超时时间（秒），0 表示不限制。
+    # inprocess 模式下超时和中断只能打断Python代码，正在进行的C扩展调用（如time.sleep、大型merge）返回后才会中断
+    EXECUTION_TIMEOUT: float = Field(default=1800, env="EXECUTION_TIMEOUT")
+    # 编译代码缓存的条数上限，0 表示不缓存
+    CODE_CACHE_SIZE: int = Field(default=256, env="CODE_CACHE_SIZE")
+    # 预先创建并预热的空闲会话数（process 模式下为工作进程数），打开笔记本时直接取用，0 表示不预先创建
+    SESSION_POOL_SIZE: int = Field(default=2, env="SESSION_POOL_SIZE")
+    # 超时中断后等待工作进程响应的秒数，超时后强制终止工作进程（仅 process 模式）
+    EXECUTION_KILL_GRACE: float = Field(default=5, env="EXECUTION_KILL_GRACE")
+    # 每个会话工作进程的内存上限（MB）和单元格CPU时间上限（秒），0 表示不限制。
+    # 只在 process 模式下生效，inprocess 模式下所有会话共用服务进程，这两项限制不起作用
+    SESSION_MEMORY_LIMIT_MB: int = Field(default=0, env="SESSION_MEMORY_LIMIT_MB")
+    SESSION_CPU_TIME_LIMIT: int = Field(default=0, env="SESSION_CPU_TIME_LIMIT")
+    # 会话回收配置：空闲多久（秒）后回收会话，0 表示不回收
+    SESSION_IDLE_TIMEOUT: float = Field(default=7200, env="SESSION_IDLE_TIMEOUT")
+    # 所有会话DataFrame的内存总预算（MB），超出时按最近最少使用顺序回收会话，0 表示不限制
+    SESSION_MEMORY_BUDGET_MB: int = Field(default=0, env="SESSION_MEMORY_BUDGET_MB")
+    # 后台检查空闲会话和内存预算的间隔（秒）
+    SESSION_REAPER_INTERVAL: float = Field(default=60, env="SESSION_REAPER_INTERVAL")
+    # 回收会话前是否将变量保存到 TEMP_DIR，下次使用该会话时恢复
+    SESSION_SPILL_ENABLED: bool = Field(default=True, env="SESSION_SPILL_ENABLED")
+    # 单元格执行后在后台预先计算的DataFrame统计信息层（逗号分隔，可选 basic,nulls,summary,preview），为空表示不预先计算
+    DATAFRAME_PROFILE_PREFETCH: str = Field(default="basic", env="DATAFRAME_PROFILE_PREFETCH")
+    # 会话中 load_data 读取的数据文件缓存的内存上限（MB），0 表示不缓存。
+    # 只有 SESSION_MODE 为 inprocess 时各会话共享同一缓存；process 模式下每个工作进程各有一份缓存，上限按进程计算
+    DATA_CACHE_MAX_MB: int = Field(default=1024, env="DATA_CACHE_MAX_MB")
+    # 开启详细性能分析时返回的耗时最多的函数个数
+    PROFILE_TOP_N: int = Field(default=15, env="PROFILE_TOP_N")
+    # 流式输出配置：合并推送的时间间隔（秒）、每条消息的最大字符数、待发送消息队列长度
+    STREAM_FLUSH_INTERVAL: float = Field(default=0.1, env="STREAM_FLUSH_INTERVAL")
+    STREAM_BATCH_SIZE: int = Field(default=8192, env="STREAM_BATCH_SIZE")
+    STREAM_QUEUE_SIZE: int = Field(default=64, env="STREAM_QUEUE_SIZE")
+    # 执行结果中保留的输出开头和结尾字符数，超出部分省略，0 表示不限制输出长度
+    OUTPUT_HEAD_CHARS: int = Field(default=50000, env="OUTPUT_HEAD_CHARS")
+    OUTPUT_TAIL_CHARS: int = Field(default=50000, env="OUTPUT_TAIL_CHARS")
+    # 被省略的输出保存到 TEMP_DIR 时每个输出文件的最大大小（MB），0 表示不限制
+    OUTPUT_SPILL_MAX_MB: int = Field(default=256, env="OUTPUT_SPILL_MAX_MB")
+    # matplotlib图形的输出格式（png、webp、svg）
+    FIGURE_FORMAT: str = Field(default="png", env="FIGURE_FORMAT")
+    # 是否将图形以base64内联在输出中，否则保存到 ARTIFACTS_DIR 并通过URL引用
+    FIGURE_INLINE: bool = Field(default=False, env="FIGURE_INLINE")
+    # ARTIFACTS_DIR 的总大小上限（MB）和产物最近一次使用后的保留天数，超出时由后台回收任务删除最久未使用的产物，
+    # 已保存的笔记本、笔记本数据和导出文件引用的产物以及尚未删除的会话生成的产物总是保留；0 表示不限制
+    ARTIFACTS_MAX_MB: int = Field(default=1024, env="ARTIFACTS_MAX_MB")
+    ARTIFACTS_MAX_AGE_DAYS: float = Field(default=30, env="ARTIFACTS_MAX_AGE_DAYS")
+    # 折线图点数超过该值时在捕获图形时使用LTTB降采样，0 表示不降采样；降采样后保留的点数
+    PLOT_DOWNSAMPLE_THRESHOLD: int = Field(default=20000, env="PLOT_DOWNSAMPLE_THRESHOLD")
+    PLOT_DOWNSAMPLE_POINTS: int = Field(default=4000, env="PLOT_DOWNSAMPLE_POINTS")
+    # plotly散点图点数超过该值时聚合为密度热力图，0 表示不聚合；聚合网格的横向和纵向格子数
+    PLOT_RASTER_THRESHOLD: int = Field(default=200000, env="PLOT_RASTER_THRESHOLD")
+    PLOT_RASTER_WIDTH: int = Field(default=400, env="PLOT_RASTER_WIDTH")
+    PLOT_RASTER_HEIGHT: int = Field(default=300, env="PLOT_RASTER_HEIGHT")
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -58,6 +117,7 @@ class Settings(BaseSettings):
         self.TEMP_DIR.mkdir(exist_ok=True)
         self.LOGS_DIR.mkdir(exist_ok=True)  # 创建日志目录
         self.EXAMPLES_DIR.mkdir(exist_ok=True)  # 创建示例目录
+        self.ARTIFACTS_DIR.mkdir(exist_ok=True)  # 创建输出图片目录
         
     @property
     def cors_settings(self):
@@ -1,25 +1,33 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.core.config import settings
+from app.services.code_executor.note_executor import get_executor
 
 logger = logging.getLogger(__name__)
 
-async def startup_event():
+async def startup_event(app: FastAPI):
     """服务启动事件"""
     logger.info("服务启动...")
     if not settings.DEEPSEEK_API_KEY:
         logger.warning("DEEPSEEK_API_KEY 环境变量未设置")
     settings.setup_directories()
+    # 在后台预热空闲会话
+    get_executor().start_session_pool()
+    # 启动后台会话回收任务
+    app.state.session_reaper = asyncio.create_task(get_executor().run_reaper())
     logger.info("服务启动完成")
 
-async def shutdown_event():
+async def shutdown_event(app: FastAPI):
     """服务关闭事件"""
     logger.info("应用程序关闭...")
+    app.state.session_reaper.cancel()
+    get_executor().shutdown()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """生命周期管理"""
-    await startup_event()
+    await startup_event(app)
     yield
-    await shutdown_event()
\ No newline at end of file
+    await shutdown_event(app)
\ No newline at end of file
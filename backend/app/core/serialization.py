@@ -0,0 +1,217 @@
+"""
+JSON序列化模块
+
+DataFrame的预览、统计和分页数据中含有 NaN、无穷大、Timestamp 和 NumPy 标量，
+标准的JSON编码器无法处理。这里按列转换：数值列用向量化的掩码把空值和无穷大替换为None，
+日期列一次性格式化为ISO字符串，只有object等混合类型的列才逐个检查取值。
+FastJSONResponse 使用 orjson（已列在 requirements.txt 中，未安装时使用标准库 json，两者的编码结果相同）编码响应，所有路由共用。
+"""
+import datetime
+import json
+import math
+from typing import Any, Dict, List, Union
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+# 无需转换即可JSON序列化的类型
+_JSON_SCALARS = (str, int, bool, type(None))
+
+
+def _sanitize_scalar(value: Any) -> Any:
+    """将单个值转换为可以JSON序列化的值，空值和无穷大转换为None"""
+    if isinstance(value, _JSON_SCALARS):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, np.generic):
+        if isinstance(value, np.datetime64):
+            return None if np.isnat(value) else _datetime_strings(np.array([value]))[0]
+        if isinstance(value, np.timedelta64):
+            return None if np.isnat(value) else str(pd.Timedelta(value))
+        return _sanitize_scalar(value.item())
+    if isinstance(value, pd.Timestamp):
+        # 与 orjson 一致只保留到微秒
+        return value.to_pydatetime(warn=False).isoformat()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        # pd.NaT 也是 datetime 的子类
+        return None if value is pd.NaT else value.isoformat()
+    if isinstance(value, (datetime.timedelta, pd.Period, pd.Interval, complex)):
+        return str(value)
+    if value is pd.NA:
+        return None
+    return value
+
+
+def _datetime_strings(array: np.ndarray) -> List[Any]:
+    """
+    将 datetime64 数组格式化为ISO字符串，NaT转换为None
+
+    与 datetime.isoformat() 和 orjson 的格式一致：没有小于秒的部分时只保留到秒，否则保留到微秒。
+    """
+    missing = np.isnat(array)
+    seconds = array.astype("datetime64[s]")
+    strings = np.datetime_as_string(seconds, unit="s").astype(object)
+    fraction = ~missing & (seconds != array)
+    if fraction.any():
+        strings[fraction] = np.datetime_as_string(array[fraction].astype("datetime64[us]"), unit="us")
+    strings[missing] = None
+    return strings.tolist()
+
+
+def sanitize_values(values: Union[pd.Series, pd.Index, np.ndarray]) -> List[Any]:
+    """
+    将一列数据转换为可以JSON序列化的列表
+
+    NumPy 数值列和日期列使用向量化的转换，其他类型的列只转换需要转换的值。
+
+    Args:
+        values: 一列数据
+
+    Returns:
+        List[Any]: Python原生类型的列表，NaN、无穷大、NaT 和 pd.NA 转换为None，
+            日期转换为ISO字符串
+    """
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype):
+        array = np.asarray(values)
+        if dtype.kind in "iub":
+            return array.tolist()
+        if dtype.kind == "f":
+            finite = np.isfinite(array)
+            if finite.all():
+                return array.tolist()
+            converted = array.astype(object)
+            converted[~finite] = None
+            return converted.tolist()
+        if dtype.kind == "M":
+            return _datetime_strings(array)
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    converted = series.astype(object).where(series.notna(), None)
+    return [value if isinstance(value, _JSON_SCALARS) else _sanitize_scalar(value) for value in converted.tolist()]
+
+
+def sanitize_columns(df: pd.DataFrame) -> List[List[Any]]:
+    """
+    将DataFrame的每一列转换为可以JSON序列化的列表
+
+    同一NumPy数值类型的列合并为一个二维数组一次性转换，宽表不需要逐列处理。
+
+    Args:
+        df: DataFrame
+
+    Returns:
+        List[List[Any]]: 按列顺序排列的值列表，转换规则与 sanitize_values 相同
+    """
+    columns: List[Any] = [None] * len(df.columns)
+    groups: Dict[np.dtype, List[int]] = {}
+    for position, dtype in enumerate(df.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind in "iubf":
+            groups.setdefault(dtype, []).append(position)
+        else:
+            columns[position] = sanitize_values(df.iloc[:, position])
+    for dtype, positions in groups.items():
+        block = df.iloc[:, positions].to_numpy(dtype=dtype).T
+        if dtype.kind == "f":
+            finite = np.isfinite(block)
+            if not finite.all():
+                block = block.astype(object)
+                block[~finite] = None
+        for position, values in zip(positions, block.tolist()):
+            columns[position] = values
+    return columns
+
+
+def sanitize(obj: Any) -> Any:
+    """
+    将嵌套的字典、列表、Series、DataFrame和数组转换为可以JSON序列化的对象
+
+    Args:
+        obj: 要转换的对象
+
+    Returns:
+        Any: 转换后的对象，DataFrame转换为 {列名: 值列表}
+    """
+    if isinstance(obj, dict):
+        return {key: sanitize(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [sanitize(value) for value in obj]
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return sanitize_values(obj)
+    if isinstance(obj, pd.DataFrame):
+        return dict(zip(map(str, obj.columns), sanitize_columns(obj)))
+    if isinstance(obj, np.ndarray):
+        if obj.ndim == 1:
+            return sanitize_values(obj)
+        return [sanitize(row) for row in obj]
+    return _sanitize_scalar(obj)
+
+
+# 编码前检查 datetime64 时可以直接跳过的类型
+_PLAIN_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def _convert_datetime64(obj: Any) -> Any:
+    """
+    把嵌套的字典和列表中的 datetime64 数组和标量转换为ISO字符串，其他值保持不变
+
+    orjson 对 datetime64 的编码与版本有关（部分版本把 NaT 编码为1677年的日期而不是报错），
+    编码前先转换，保证与标准库 json 的结果一致。
+    """
+    if isinstance(obj, dict):
+        return {key: value if type(value) in _PLAIN_TYPES else _convert_datetime64(value)
+                for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [value if type(value) in _PLAIN_TYPES else _convert_datetime64(value) for value in obj]
+    if isinstance(obj, np.ndarray) and obj.dtype.kind == "M":
+        return sanitize(obj)
+    if isinstance(obj, np.datetime64):
+        return _sanitize_scalar(obj)
+    return obj
+
+
+def _default(obj: Any) -> Any:
+    """编码器遇到无法直接序列化的对象时的转换"""
+    value = sanitize(obj)
+    if value is obj:
+        return str(obj)
+    return value
+
+
+def dumps(content: Any) -> bytes:
+    """
+    将对象编码为JSON（UTF-8字节），NaN和无穷大编码为null
+
+    Args:
+        content: 要编码的对象
+
+    Returns:
+        bytes: JSON
+    """
+    if orjson is not None:
+        content = _convert_datetime64(content)
+        try:
+            return orjson.dumps(content, default=_default,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # 非连续或不支持的类型的数组等情况先转换再编码
+            return orjson.dumps(sanitize(content), default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(sanitize(content), ensure_ascii=False, allow_nan=False, default=str,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    使用 dumps 编码的JSON响应
+
+    作为应用的默认响应类；路由直接返回该响应时还可以跳过FastAPI逐个值的 jsonable_encoder 转换，
+    适合返回大量数据的接口。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -3,6 +3,7 @@ from app.core.logger import configure_logging
 from app.routes import register_routes
 from app.core.middlewares import configure_middlewares
 from app.core.lifespan import lifespan
+from app.core.serialization import FastJSONResponse
 
 def create_app():
     """
@@ -15,8 +16,8 @@ def create_app():
     """
     # 配置日志系统
     configure_logging()
-    # 创建 FastAPI 应用实例，并设置生命周期管理
-    app = FastAPI(title="DataInsight API", lifespan=lifespan)
+    # 创建 FastAPI 应用实例，并设置生命周期管理，所有路由默认使用 orjson 编码响应
+    app = FastAPI(title="DataInsight API", lifespan=lifespan, default_response_class=FastJSONResponse)
     # 配置中间件
     configure_middlewares(app)
     # 注册所有路由
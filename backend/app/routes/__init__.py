@@ -8,6 +8,7 @@ from app.routes.export_routes import router as export_router
 from app.routes.system_routes import router as system_router
 from app.routes.data_files import router as data_files_router
 from app.routes.ai_routes import router as ai_router
+from app.routes.artifact_routes import router as artifact_router
 import logging
 
 logger = logging.getLogger(__name__)  # 获取当前模块的日志记录器
@@ -39,6 +40,8 @@ def register_routes(app: FastAPI):
     app.include_router(notebook_router)
     # 注册执行相关路由
     app.include_router(execution_router)
+    # 注册单元格输出产物相关路由
+    app.include_router(artifact_router)
     # 注册导出相关路由
     app.include_router(export_router)
     logger.info("路由注册完成")
\ No newline at end of file
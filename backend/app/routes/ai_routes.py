@@ -2,17 +2,14 @@
 AI相关的路由处理
 """
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import logging
-import numpy as np
-import math
-import json
 from app.services.ai.deepseek_client import get_client
 from app.services.ai.sys_prompt_config import SysPromptConfig
 from app.services.ai.user_prompt_config import UserPromptConfig
 from app.core.config import settings
+from app.core.serialization import FastJSONResponse, sanitize
 
 # 配置日志
 logging.basicConfig(
@@ -21,36 +18,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class NumpyJSONEncoder(json.JSONEncoder):
-    """处理 NumPy 和特殊浮点数值的 JSON 编码器"""
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        if isinstance(obj, np.floating):
-            if np.isnan(obj) or np.isinf(obj):
-                return None
-            return float(obj)
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super().default(obj)
-
-def handle_special_floats(obj):
-    """处理特殊浮点数值的JSON序列化"""
-    if isinstance(obj, (float, np.floating)):
-        if math.isnan(obj) or np.isnan(obj):
-            return None
-        if math.isinf(obj) or np.isinf(obj):
-            return None
-    if isinstance(obj, (np.integer, np.floating)):
-        return float(obj)
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    if isinstance(obj, dict):
-        return {k: handle_special_floats(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [handle_special_floats(v) for v in obj]
-    return obj
-
 class GenerateCodeRequest(BaseModel):
     """代码生成请求模型"""
     prompt: str
@@ -79,7 +46,7 @@ async def generate_code(request: GenerateCodeRequest):
         request: 包含提示词和上下文信息的请求对象
         
     Returns:
-        JSONResponse: 包含生成的代码的响应对象
+        FastJSONResponse: 包含生成的代码的响应对象
     """
     try:
         logger.info("收到代码生成请求")
@@ -89,7 +56,7 @@ async def generate_code(request: GenerateCodeRequest):
         
         # 处理请求中的特殊浮点数值
         if request.dataframe_info:
-            request.dataframe_info = handle_special_floats(request.dataframe_info)
+            request.dataframe_info = sanitize(request.dataframe_info)
         
         client = get_client()
         generated_code = client.generate_code(
@@ -99,21 +66,17 @@ async def generate_code(request: GenerateCodeRequest):
             notebook_context=request.notebook_context
         )
         
-        # 使用自定义 JSON 编码器处理响应
         response_data = {
             "status": "success",
             "code": generated_code,
             "message": None
         }
         
-        return JSONResponse(
-            content=handle_special_floats(response_data),
-            status_code=200
-        )
+        return FastJSONResponse(content=response_data, status_code=200)
         
     except Exception as e:
         logger.error(f"代码生成失败: {str(e)}", exc_info=True)
-        return JSONResponse(
+        return FastJSONResponse(
             content={"status": "error", "message": str(e)},
             status_code=500
         )
@@ -0,0 +1,57 @@
+''' 文件名称: artifact_routes.py
+    功能: 提供单元格输出图片等产物的下载接口
+    详细说明:
+    - 产物按内容的哈希值命名，同一个URL的内容永远不变，响应允许客户端长期缓存。
+    - 客户端携带 If-None-Match 请求时，ETag 匹配则直接返回304。
+'''
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from app.services.code_executor.artifact_store import get_artifact_store
+
+router = APIRouter(prefix="/api/artifacts", tags=["artifacts"])
+
+# 产物内容不会改变，允许客户端和代理缓存一年
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    判断 If-None-Match 请求头是否与ETag匹配（弱比较，W/ 前缀被忽略）
+
+    Args:
+        if_none_match: If-None-Match 请求头，可以包含逗号分隔的多个ETag或 *
+        etag: 产物的ETag
+
+    Returns:
+        bool: 是否匹配
+    """
+    for value in if_none_match.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        if value == "*" or value == etag:
+            return True
+    return False
+
+
+@router.get("/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request):
+    """
+    获取产物内容
+
+    Args:
+        artifact_id: 产物ID（内容哈希加扩展名）
+
+    Returns:
+        FileResponse: 产物文件，客户端缓存仍然有效时返回304
+    """
+    store = get_artifact_store()
+    path = store.get_path(artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="产物不存在")
+    etag = f'"{artifact_id}"'
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=str(path), media_type=store.media_type(artifact_id), headers=headers)
@@ -1,14 +1,15 @@
 """
 DataFrame相关的API路由
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
-import numpy as np
-import math
 from app.core.config import settings
+from app.core.serialization import FastJSONResponse
 from app.services.code_executor.note_executor import get_executor
+from app.services.code_executor.arrow_export import ArrowResponse, accepts_arrow
+from app.services.code_executor.dataframe_manager import PREVIEW_ROWS
 
 # 配置日志
 logging.basicConfig(
@@ -43,154 +44,137 @@ class SaveDataFrameRequest(BaseModel):
     file_type: str = "csv"
     save_options: Dict[str, Any] = {}
 
-def process_value(value: Any) -> Any:
-    """处理数值，确保JSON序列化安全
-    
-    Args:
-        value: 需要处理的值
-        
-    Returns:
-        处理后的值
-    """
-    try:
-        # 处理 None
-        if value is None:
-            return None
-            
-        # 处理 Pandas Timestamp 和 datetime64
-        if str(type(value)) in ["<class 'pandas._libs.tslibs.timestamps.Timestamp'>", 
-                               "<class 'numpy.datetime64'>",
-                               "<class 'pandas.Timestamp'>"]:
-            logger.debug(f"将 Timestamp 值 {value} 转换为 ISO 格式字符串")
-            return value.isoformat()
-            
-        # 处理 NumPy 数值类型
-        if isinstance(value, (np.integer, np.floating)):
-            # 处理 NaN 和 Inf
-            if np.isnan(value) or math.isnan(float(value)):
-                logger.debug(f"将 NaN 值转换为 None")
-                return None
-            if np.isinf(value) or math.isinf(float(value)):
-                logger.debug(f"将 Inf 值转换为 None")
-                return None
-            # 转换为 Python 原生类型
-            return float(value)
-            
-        # 处理 NumPy 数组
-        if isinstance(value, np.ndarray):
-            logger.debug(f"将 NumPy 数组转换为列表")
-            return [process_value(x) for x in value.tolist()]
-            
-        # 处理其他类型
-        return value
-    except Exception as e:
-        logger.error(f"处理值 {value} (类型: {type(value)}) 时出错: {str(e)}")
-        return None
-
-def process_dict(data: Dict) -> Dict:
-    """递归处理字典中的所有值
-    
-    Args:
-        data: 需要处理的字典
-        
-    Returns:
-        处理后的字典
-    """
-    return {k: process_value(v) if not isinstance(v, dict) else process_dict(v) 
-            for k, v in data.items()}
+def page_response(result: Dict[str, Any], message: str) -> Any:
+    """分页数据的响应：以Arrow格式编码时返回Arrow IPC流，总行数和起始行号放在响应头中，否则返回JSON"""
+    if "arrow" in result:
+        return ArrowResponse(content=result["arrow"], headers={
+            "X-Total-Rows": str(result["total_rows"]),
+            "X-Offset": str(result["offset"])
+        })
+    # 数据已按列转换，直接编码，跳过 jsonable_encoder 逐个值的转换
+    return FastJSONResponse({"status": "success", "data": result, "message": message})
 
 @router.get("/list")
 async def get_dataframes(session_id: str) -> dict:
     executor = get_executor()
-    dataframes = executor.get_dataframes_names(session_id)
+    dataframes = await executor.read_in_session(session_id, executor.get_dataframes_names, session_id)
     return {"status": "success", "data": dataframes}
 
 @router.get("/info", response_model=DataFrameInfoResponse)
-async def get_dataframe_info(session_id: str, name: str) -> DataFrameInfoResponse:
+async def get_dataframe_info(session_id: str, name: str, tiers: Optional[str] = None) -> DataFrameInfoResponse:
     """获取指定DataFrame的详细信息
     
     Args:
         name: DataFrame变量名
+        tiers: 需要的信息层，逗号分隔，可选 basic、nulls、summary、preview，为空时返回全部
         
     Returns:
         DataFrameInfoResponse: 包含状态、数据和消息的字典
     """
     try:
         logger.info(f"获取DataFrame '{name}' 的信息")
+        tier_list = [tier.strip() for tier in tiers.split(",") if tier.strip()] if tiers else None
         
         executor = get_executor()
-        df = executor.get_dataframe(session_id, name)
+        result = await executor.read_in_session(session_id, executor.get_dataframe_info, session_id, name, tier_list)
         
-        if df is None:
+        if result is None:
             logger.warning(f"DataFrame '{name}' 未找到")
             return {"status": "error", "data": {}, "message": f"DataFrame '{name}' 不存在"}
         
-        # 获取基本信息
-        basic_info = {
-            "行数": len(df),
-            "列数": len(df.columns),
-            "内存占用": f"{df.memory_usage().sum() / 1024**2:.2f} MB"
-        }
-        logger.debug(f"基本信息: {basic_info}")
-        
-        # 获取列信息
-        columns = []
-        for col in df.columns:
-            try:
-                col_info = {
-                    "name": str(col),
-                    "type": str(df[col].dtype),
-                    "null_count": int(df[col].isnull().sum())
-                }
-                columns.append(col_info)
-            except Exception as e:
-                logger.error(f"处理列 '{col}' 信息时出错: {str(e)}")
-                continue
-        logger.debug(f"列信息: {columns}")
-        
-        # 获取预览信息
-        try:
-            head_data = df.head().to_dict('records')
-            head_data = [process_dict(row) for row in head_data]
-            
-            # 获取统计信息并处理特殊值
-            describe_df = df.describe()
-            # 将所有的 nan 值替换为 None
-            describe_df = describe_df.where(describe_df.notna(), None)
-            summary_data = describe_df.to_dict()
-            summary_data = process_dict(summary_data)
-            
-            preview = {
-                "head": head_data,
-                "summary": summary_data
-            }
-            logger.debug("预览信息已处理")
-            logger.debug(f"处理后的预览信息: {preview}")
-        except Exception as e:
-            logger.error(f"处理预览信息时出错: {str(e)}")
-            preview = {
-                "head": [],
-                "summary": {}
-            }
-        
-        result = {
-            "basic_info": basic_info,
-            "columns": columns,
-            "preview": preview
-        }
-        
+        # 预览和统计信息在计算时已按列转换为可以JSON序列化的值，直接编码，跳过响应模型的校验和逐个值的转换
         logger.info(f"成功获取DataFrame '{name}' 的信息")
-        return {"status": "success", "data": result, "message": "获取信息成功"}
+        return FastJSONResponse({"status": "success", "data": result, "message": "获取信息成功"})
         
+    except ValueError as e:
+        return {"status": "error", "data": {}, "message": str(e)}
     except Exception as e:
         logger.error(f"获取DataFrame '{name}' 信息时发生错误: {str(e)}", exc_info=True)
         return {"status": "error", "data": {}, "message": str(e)}
 
+@router.get("/rows")
+async def get_dataframe_rows(request: Request, session_id: str, name: str, offset: int = 0, limit: int = 100,
+                             columns: Optional[str] = None) -> Any:
+    """按位置分页读取DataFrame的行，用于在表格中滚动浏览完整数据
+    
+    请求头 Accept 包含 application/vnd.apache.arrow.stream 且服务端安装了 pyarrow 时，
+    返回包含行索引的Arrow IPC流，总行数和起始行号在响应头 X-Total-Rows、X-Offset 中。
+    
+    Args:
+        session_id: 会话ID
+        name: DataFrame变量名
+        offset: 起始行号（从0开始）
+        limit: 读取的行数，最多1000行
+        columns: 需要的列名，逗号分隔，为空时返回全部列
+        
+    Returns:
+        Dict[str, Any]: 总行数 total_rows、起始行号 offset、列名 columns、行索引 index
+            和按列排列的数据 data
+    """
+    try:
+        column_list = [col for col in columns.split(",") if col] if columns else None
+        executor = get_executor()
+        result = await executor.read_in_session(session_id, executor.get_dataframe_rows, session_id, name, offset, limit,
+                                                column_list, accepts_arrow(request.headers.get("accept")))
+        if result is None:
+            return {"status": "error", "data": {}, "message": f"DataFrame '{name}' 不存在"}
+        return page_response(result, "获取数据成功")
+    except ValueError as e:
+        return {"status": "error", "data": {}, "message": str(e)}
+    except Exception as e:
+        logger.error(f"读取DataFrame '{name}' 的数据时发生错误: {str(e)}", exc_info=True)
+        return {"status": "error", "data": {}, "message": str(e)}
+
+@router.post("/query")
+async def query_dataframe(request: Request) -> Any:
+    """对DataFrame执行过滤、分组聚合和排序，并分页读取结果
+    
+    查询结果按 (DataFrame版本, 查询) 缓存，翻页或切换回之前的排序时不重新计算，
+    DataFrame被代码修改后自动重新计算。与 /rows 相同，可以通过 Accept 头请求Arrow IPC流。
+    
+    Args:
+        session_id: 会话ID
+        name: DataFrame变量名
+        query: 查询，例如
+            {"filters": [{"column": "age", "op": ">=", "value": 18}],
+             "group_by": ["city"],
+             "aggregations": [{"column": "income", "func": "mean"}],
+             "sort": [{"column": "income_mean", "ascending": false}]}
+            过滤运算符: ==、!=、>、>=、<、<=、in、not_in、between、contains、startswith、isnull、notnull；
+            聚合函数: count、size、sum、mean、median、min、max、std、var、nunique、first、last
+        offset: 结果中的起始行号
+        limit: 读取的行数，最多1000行
+        columns: 需要的列名列表，为空时返回全部列
+        
+    Returns:
+        Dict[str, Any]: 格式与 /rows 相同，total_rows 为查询结果的总行数
+    """
+    try:
+        data = await request.json()
+        name = data.get("name", "")
+        executor = get_executor()
+        session_id = data.get("session_id", "")
+        result = await executor.read_in_session(
+            session_id, executor.query_dataframe, session_id, name, data.get("query") or {},
+            data.get("offset", 0), data.get("limit", 100), data.get("columns"),
+            accepts_arrow(request.headers.get("accept"))
+        )
+        if result is None:
+            return {"status": "error", "data": {}, "message": f"DataFrame '{name}' 不存在"}
+        return page_response(result, "查询成功")
+    except ValueError as e:
+        return {"status": "error", "data": {}, "message": str(e)}
+    except Exception as e:
+        logger.error(f"查询DataFrame时发生错误: {str(e)}", exc_info=True)
+        return {"status": "error", "data": {}, "message": str(e)}
+
 @router.get("/preview/{name}", response_model=Dict[str, Any])
 async def get_dataframe_preview(name: str, request: Request) -> Dict[str, Any]:
     """
     获取指定DataFrame的预览信息
     
+    请求头 Accept 包含 application/vnd.apache.arrow.stream 时，以Arrow IPC流返回前几行数据
+    
     Args:
         name: DataFrame变量名
         
@@ -204,18 +188,19 @@ async def get_dataframe_preview(name: str, request: Request) -> Dict[str, Any]:
         session_id = data.get("session_id", "")
         
         executor = get_executor()
-        df = executor.get_dataframe(session_id, name)
-        
-        if df is None:
+        if accepts_arrow(request.headers.get("accept")):
+            # 以Arrow IPC流返回前几行数据
+            result = await executor.read_in_session(session_id, executor.get_dataframe_rows, session_id, name, 0,
+                                                    PREVIEW_ROWS, None, True)
+            if result is None:
+                return {"status": "error", "data": {}, "message": f"DataFrame {name} 不存在"}
+            return page_response(result, "获取预览信息成功")
+        # 预览信息在DataFrame所在的进程中生成，不传输整个DataFrame
+        preview_info = await executor.read_in_session(session_id, executor.get_dataframe_preview, session_id, name)
+        
+        if preview_info is None:
             return {"status": "error", "data": {}, "message": f"DataFrame {name} 不存在"}
         
-        preview_info = {
-            "shape": df.shape,
-            "columns": {col: str(df[col].dtype) for col in df.columns},
-            "memory_usage": df.memory_usage(deep=True).sum(),
-            "sample_data": df.head(5).to_dict(orient='list')
-        }
-        
         logger.info(f"成功获取DataFrame {name} 的预览信息")
         return {"status": "success", "data": preview_info, "message": "获取预览信息成功"}
         
@@ -240,7 +225,9 @@ async def save_dataframe(name: str, request: SaveDataFrameRequest) -> Dict[str,
         data = await request.json()
         session_id = data.get("session_id", "")
         executor = get_executor()       
-        result = executor.save_dataframe_to_file(
+        result = await executor.read_in_session(
+            session_id,
+            executor.save_dataframe_to_file,
             session_id=session_id,
             name=name,
             file_path=request.file_path,
@@ -1,11 +1,83 @@
-from fastapi import APIRouter, HTTPException, Request
-from typing import Dict, Any, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, ValidationError
+import asyncio
+import concurrent.futures
+import logging
 import uuid
+from app.core.config import settings
 from app.services.code_executor.note_executor import get_executor
+from app.services.code_executor.plotly_serializer import encode_array
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/execution", tags=["execution"])
 
+# 队列已满时执行线程检查通道是否已关闭的间隔（秒）
+CHANNEL_PUT_POLL_INTERVAL = 0.5
+
+class NotebookCell(BaseModel):
+    """代码单元格模型"""
+    cell_id: str
+    code: str = ""
+
+class NotebookCellsRequest(BaseModel):
+    """按笔记本顺序排列的单元格请求模型"""
+    session_id: str = ""
+    cells: List[NotebookCell] = []
+
+def parse_cells(data: Any) -> List[Dict[str, str]]:
+    """
+    校验请求中的单元格列表
+    
+    Returns:
+        List[Dict]: 每项包含 cell_id 和 code 的单元格
+        
+    Raises:
+        ValueError: 请求不是JSON对象或单元格缺少 cell_id 等字段时
+    """
+    try:
+        return [cell.dict() for cell in NotebookCellsRequest.parse_obj(data).cells]
+    except ValidationError as e:
+        raise ValueError(f"单元格格式不正确: {e}")
+
+class OutputChannel:
+    """
+    将执行线程中产生的输出事件转交给事件循环的有界队列
+    
+    队列已满时执行线程会等待，客户端接收过慢时由此对代码执行形成背压。
+    """
+    def __init__(self, maxsize: int):
+        self._loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._closed = False
+
+    def put(self, event: Optional[Dict[str, Any]]) -> None:
+        """在执行线程中放入一个事件，通道关闭后（包括等待期间）丢弃事件"""
+        if self._closed:
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(event), self._loop)
+        except RuntimeError:
+            # 事件循环已关闭
+            self._closed = True
+            return
+        while True:
+            try:
+                future.result(timeout=CHANNEL_PUT_POLL_INTERVAL)
+                return
+            except concurrent.futures.TimeoutError:
+                if self._closed:
+                    future.cancel()
+                    return
+
+    def close(self) -> None:
+        """连接结束后丢弃之后的事件，并清空队列以释放等待中的执行线程"""
+        self._closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
 @router.post("/execute")
 async def execute_code(request: Request):
     """
@@ -23,7 +95,10 @@ async def execute_code(request: Request):
         executor = get_executor()
         code = data.get("code", "")
         session_id = data.get("session_id", "")
-        result = executor.execute(session_id, code)
+        timeout = data.get("timeout")
+        cell_id = data.get("cell_id")
+        result = await executor.execute_async(session_id, code, timeout=timeout, cell_id=cell_id,
+                                              profile=bool(data.get("profile")))
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -40,8 +115,294 @@ async def reset_context(request: Request):
         data = await request.json()
         executor = get_executor()
         session_id = data.get("session_id", "")
-        executor = get_executor()
-        executor.reset_session(session_id)
+        await executor.run_in_session(session_id, executor.reset_session, session_id)
         return {"status": "success", "message": "笔记本环境已重置"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/interrupt")
+async def interrupt_execution(request: Request):
+    """
+    中断指定笔记本中正在执行的代码
+    
+    被中断的单元格返回 status 为 "limit_exceeded" 的执行结果
+    
+    Args:
+        session_id: 笔记本会话ID
+    """
+    try:
+        data = await request.json()
+        executor = get_executor()
+        session_id = data.get("session_id", "")
+        interrupted = executor.interrupt(session_id)
+        message = "已中断正在执行的代码" if interrupted else "当前没有正在执行的代码"
+        if interrupted and settings.SESSION_MODE != "process":
+            # 服务进程内执行时只能在Python代码中抛出KeyboardInterrupt
+            message = "已请求中断，正在进行的C扩展调用（如time.sleep、大型merge）返回后才会中断"
+        return {"status": "success", "message": message, "interrupted": interrupted}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/batch")
+async def execute_batch(request: Request):
+    """
+    在一次请求中按顺序执行多个单元格
+    
+    Args:
+        session_id: 笔记本会话ID
+        cells: 按顺序排列的单元格 [{"cell_id": ..., "code": ...}]
+        stop_on_error: 某个单元格执行失败后是否停止执行之后的单元格，默认为 true
+        timeout: 可选的单元格执行超时时间（秒）
+        profile: 是否开启详细性能分析，默认为 false
+        
+    Returns:
+        各单元格的执行结果（executed）和未执行的单元格（skipped）
+    """
+    try:
+        data = await request.json()
+        executor = get_executor()
+        result = await executor.execute_cells_async(data.get("session_id", ""), data.get("cells", []),
+                                                    data.get("stop_on_error", True), timeout=data.get("timeout"),
+                                                    profile=bool(data.get("profile")))
+        return {"status": "success", "data": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stale")
+async def get_stale_cells(request: Request):
+    """
+    分析笔记本中单元格的依赖关系，找出需要重新执行的单元格
+    
+    Args:
+        session_id: 笔记本会话ID
+        cells: 按笔记本顺序排列的代码单元格 [{"cell_id": ..., "code": ...}]
+        
+    Returns:
+        每个单元格依赖的单元格和过期原因（未过期时为null）
+    """
+    try:
+        data = await request.json()
+        cells = parse_cells(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        executor = get_executor()
+        # 解析每个单元格的代码，在线程池中进行，不阻塞事件循环
+        plan = await run_in_threadpool(executor.plan_stale, data.get("session_id", ""), cells)
+        return {"status": "success", "data": plan}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/run_stale")
+async def run_stale_cells(request: Request):
+    """
+    只重新执行过期的单元格：代码被修改、从未执行或上游依赖发生变化的单元格
+    
+    修改了下方的绘图单元格时，上方加载数据的单元格不会被重新执行。
+    某个单元格执行失败后，之后的过期单元格不再执行。
+    
+    Args:
+        session_id: 笔记本会话ID
+        cells: 按笔记本顺序排列的全部代码单元格 [{"cell_id": ..., "code": ...}]
+        timeout: 可选的单元格执行超时时间（秒）
+        profile: 是否开启详细性能分析
+        
+    Returns:
+        依赖分析结果、已执行单元格的执行结果和未执行的单元格
+    """
+    try:
+        data = await request.json()
+        cells = parse_cells(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        executor = get_executor()
+        result = await executor.run_stale(data.get("session_id", ""), cells,
+                                          timeout=data.get("timeout"), profile=bool(data.get("profile")))
+        return {"status": "success", "data": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/check_syntax")
+async def check_syntax(request: Request):
+    """
+    检查代码的语法，不执行代码
+    
+    Args:
+        code: 要检查的代码
+        
+    Returns:
+        语法正确时 valid 为 true，否则在 error 中返回错误信息和所在行列
+    """
+    try:
+        data = await request.json()
+        executor = get_executor()
+        error = executor.check_syntax(data.get("code", ""))
+        return {"status": "success", "valid": error is None, "error": error}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/raster")
+async def aggregate_raster(request: Request):
+    """
+    按缩放后的坐标范围重新聚合被聚合为热力图的散点
+    
+    Args:
+        session_id: 会话ID
+        raster_id: 散点数据ID（热力图轨迹的 meta.raster.raster_id）
+        x_range: 横坐标范围 [min, max]，为空时使用数据的范围
+        y_range: 纵坐标范围 [min, max]，为空时使用数据的范围
+        
+    Returns:
+        热力图的 z（类型化数组）、x0、dx、y0、dy，以及范围内的点数 points
+    """
+    try:
+        data = await request.json()
+        executor = get_executor()
+        grid = await asyncio.to_thread(
+            executor.aggregate_raster, data["session_id"], data["raster_id"],
+            data.get("x_range"), data.get("y_range")
+        )
+        if grid is None:
+            return {"status": "error", "message": "图形数据已失效，请重新运行单元格"}
+        grid["z"] = encode_array(grid["z"])
+        return {"status": "success", "data": grid}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/output")
+async def read_full_output(session_id: str, output_id: str, offset: int = 0, limit: int = 65536):
+    """
+    分页读取被截断的完整输出
+    
+    Args:
+        session_id: 笔记本会话ID
+        output_id: 输出ID（执行结果中 output_truncated.stdout/stderr 的 output_id）
+        offset: 起始位置（字节），第一页为0，之后使用上一页返回的 next_offset
+        limit: 每页最多读取的字节数，不超过1MB
+        
+    Returns:
+        本页的文本 text、下一页的起始位置 next_offset、输出的总字节数 size 和是否已读完 done
+    """
+    try:
+        executor = get_executor()
+        page = await asyncio.to_thread(executor.read_output, session_id, output_id, offset,
+                                       min(max(limit, 1), 1024 * 1024))
+        if page is None:
+            return {"status": "error", "message": "完整输出已失效，请重新运行单元格"}
+        return {"status": "success", "data": page}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/profile")
+async def get_session_profile(session_id: str):
+    """
+    获取会话中各单元格的执行统计
+    
+    Args:
+        session_id: 笔记本会话ID
+        
+    Returns:
+        按累计耗时从高到低排列的单元格统计：执行次数、累计和最长耗时、CPU时间、最大内存占用，
+        以及最近一次执行的性能数据
+    """
+    try:
+        executor = get_executor()
+        return {"status": "success", "data": executor.get_session_profile(session_id).summary()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/metrics")
+async def get_execution_metrics():
+    """
+    获取会话运行指标
+    
+    包括每个会话的DataFrame内存占用、删除变量后释放的内存、空闲时间、是否正在执行，最近被回收的会话和回收原因，以及编译代码缓存的命中统计
+    """
+    try:
+        executor = get_executor()
+        return {"status": "success", "data": executor.get_metrics()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.websocket("/ws")
+async def execute_code_stream(websocket: WebSocket):
+    """
+    通过WebSocket执行代码并实时推送输出
+    
+    客户端发送 {"session_id": ..., "code": ..., "cell_id": 可选, "profile": 可选}，服务端在执行过程中依次推送：
+        {"type": "stream", "name": "stdout"|"stderr", "text": ...}  输出文本
+        {"type": "display", "plot"|"plotly_json": ...}               运行中显示的图形
+    执行结束后推送 {"type": "result", "data": 执行结果}，格式与 /execute 的返回值相同。
+    
+    客户端发送 {"session_id": ..., "cells": [...], "stop_on_error": true, "stale_only": false} 时批量执行单元格，
+    输出事件附带 cell_id，每个单元格开始和结束时分别推送 cell_start 和 cell_result 事件，
+    最后推送的 result 与 /batch（stale_only 为 true 时与 /run_stale）的返回数据相同。
+    同一连接可以依次执行多段代码。
+    """
+    await websocket.accept()
+    executor = get_executor()
+    channel = None
+    task = None
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"type": "error", "message": "消息不是有效的JSON"})
+                continue
+            if not isinstance(data, dict):
+                await websocket.send_json({"type": "error", "message": "消息必须是JSON对象"})
+                continue
+            session_id = data.get("session_id", "")
+            timeout = data.get("timeout")
+            profile = bool(data.get("profile"))
+            channel = OutputChannel(settings.STREAM_QUEUE_SIZE)
+
+            if "cells" in data and data.get("stale_only"):
+                try:
+                    cells = parse_cells(data)
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "message": str(e)})
+                    continue
+                execution = executor.run_stale(session_id, cells, on_output=channel.put, timeout=timeout,
+                                               profile=profile)
+            elif "cells" in data:
+                execution = executor.execute_cells_async(session_id, data["cells"], data.get("stop_on_error", True),
+                                                         on_output=channel.put, timeout=timeout, profile=profile)
+            else:
+                execution = executor.execute_async(session_id, data.get("code", ""), on_output=channel.put,
+                                                   timeout=timeout, cell_id=data.get("cell_id"), profile=profile)
+
+            async def run(execution=execution, channel: OutputChannel = channel):
+                try:
+                    return await execution
+                finally:
+                    # 执行结束标记
+                    await channel.queue.put(None)
+
+            task = asyncio.create_task(run())
+            while True:
+                event = await channel.queue.get()
+                if event is None:
+                    break
+                await websocket.send_json(event)
+
+            try:
+                result = await task
+                await websocket.send_json({"type": "result", "data": result})
+            except Exception as e:
+                logger.error(f"流式执行代码失败: {str(e)}", exc_info=True)
+                await websocket.send_json({"type": "error", "message": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"WebSocket连接异常结束: {str(e)}")
+    finally:
+        # 连接以任何方式结束后都关闭通道，防止执行线程阻塞在推送输出上而一直占用会话
+        if channel is not None:
+            channel.close()
+        if task is not None and not task.done():
+            # 执行线程无法取消，代码执行结束后丢弃其结果
+            task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
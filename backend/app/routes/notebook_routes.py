@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
 from app.services.notebook.notebook_manager import NoteBookManager
 
 notebook_manager = NoteBookManager() 
@@ -14,7 +15,7 @@ async def save_notebook_route(request: Request):
     data = await request.json()
     filename = data.get("filename")
     notebook = data.get("notebook")
-    return notebook_manager.save_notebook(filename, notebook)
+    return await run_in_threadpool(notebook_manager.save_notebook, filename, notebook)
 
 @router.post("/rename_notebook")
 async def rename_notebook_route(request: Request):
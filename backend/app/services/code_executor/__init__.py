@@ -6,4 +6,5 @@
 - matplotlib图形输出支持
 - plotly图形输出支持
 - DataFrame变量管理
+- 基于独立工作进程的会话隔离
 """
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+DataFrame的Arrow IPC编码模块
+
+分页读取和查询DataFrame时，客户端可以通过 Accept 头请求 Arrow IPC 流格式。
+与按列转换为Python列表再编码为JSON相比，Arrow直接使用pandas的数据缓冲区，
+日期、空值和数值类型不会丢失，传输体积也更小。
+pyarrow 已列在 requirements.txt 中；未安装时接口返回JSON。
+"""
+from typing import Any, Optional
+import pandas as pd
+from fastapi import Response
+
+try:
+    import pyarrow as pa
+except ImportError:  # 未安装 pyarrow 时只支持JSON
+    pa = None
+
+# Arrow IPC 流格式的媒体类型
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def arrow_available() -> bool:
+    """是否可以使用Arrow格式"""
+    return pa is not None
+
+
+def accepts_arrow(accept: Optional[str]) -> bool:
+    """
+    客户端是否请求Arrow格式
+
+    Args:
+        accept: 请求的 Accept 头
+
+    Returns:
+        bool: Accept 头中包含Arrow IPC流格式且已安装 pyarrow
+    """
+    return arrow_available() and ARROW_STREAM_MEDIA_TYPE in (accept or "")
+
+
+def dataframe_to_arrow(df: pd.DataFrame) -> Optional[Any]:
+    """
+    将DataFrame编码为Arrow IPC流，行索引作为列保留
+
+    Args:
+        df: DataFrame
+
+    Returns:
+        Optional[pa.Buffer]: Arrow IPC流，支持缓冲区协议，可以不复制直接写入响应；
+            未安装 pyarrow 或含有Arrow不支持的类型（如混合类型的object列）时返回None
+    """
+    if pa is None:
+        return None
+    if not all(isinstance(col, str) for col in df.columns):
+        df = df.rename(columns=str)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class ArrowResponse(Response):
+    """
+    Arrow IPC流响应，直接使用 pa.Buffer 的内存作为响应体，不复制为 bytes
+    """
+    media_type = ARROW_STREAM_MEDIA_TYPE
+
+    def render(self, content: Any) -> Any:
+        if content is None:
+            return b""
+        if isinstance(content, bytes):
+            return content
+        return memoryview(content)
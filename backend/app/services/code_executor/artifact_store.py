@@ -0,0 +1,250 @@
+"""
+输出产物存储模块
+
+单元格生成的图片按内容的哈希值保存到产物目录，执行结果和笔记本中只保存图片的URL，
+而不是内联的base64字符串。内容相同的图片只保存一次，URL对应的内容永远不变，
+客户端可以长期缓存。产物文件的修改时间记录最近一次使用的时间，
+后台回收任务按保留时间和目录总大小删除最久未使用的产物，
+已保存的笔记本、笔记本数据和导出文件中引用的产物，以及仍在使用的会话生成的产物不会被删除。
+"""
+import base64
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+from app.core.config import settings
+
+# 产物的访问路径前缀
+ARTIFACT_URL_PREFIX = "/api/artifacts/"
+
+# 支持的图片格式
+MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}\.(%s)$" % "|".join(MEDIA_TYPES))
+# 写入中断后残留的临时文件超过该时间（秒）后删除
+STALE_TMP_SECONDS = 3600
+
+_ARTIFACT_URL = re.compile(re.escape(ARTIFACT_URL_PREFIX) + r"([0-9a-f]{64}\.(?:%s))" % "|".join(MEDIA_TYPES))
+_ARTIFACT_URL_BYTES = re.compile(_ARTIFACT_URL.pattern.encode())
+
+
+class ArtifactStore:
+    """
+    按内容寻址的产物存储
+    """
+
+    def __init__(self, root: Path):
+        """
+        Args:
+            root: 产物目录
+        """
+        self.root = Path(root)
+        # 已扫描文件的 (修改时间, 大小) 和其中引用的产物ID，文件未修改时不再重新扫描
+        self._references: Dict[Path, Tuple[Tuple[int, int], Set[str]]] = {}
+
+    def _path(self, artifact_id: str) -> Path:
+        # 按哈希前两位分目录，避免单个目录中文件过多
+        return self.root / artifact_id[:2] / artifact_id
+
+    def put(self, data: bytes, extension: str) -> str:
+        """
+        保存产物，内容相同的产物只保存一次
+
+        Args:
+            data: 产物内容
+            extension: 文件扩展名，例如 "png"
+
+        Returns:
+            str: 产物ID（内容哈希加扩展名）
+        """
+        if extension not in MEDIA_TYPES:
+            raise ValueError(f"不支持的产物格式: {extension}")
+        artifact_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self._path(artifact_id)
+        try:
+            # 已存在的产物更新使用时间，避免被回收
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写入临时文件再重命名，其他进程不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return artifact_id
+
+    def get_path(self, artifact_id: str) -> Optional[Path]:
+        """
+        获取产物文件路径
+
+        Args:
+            artifact_id: 产物ID
+
+        Returns:
+            Optional[Path]: 文件路径，产物ID无效或不存在时返回None
+        """
+        if not _ARTIFACT_ID.match(artifact_id):
+            return None
+        path = self._path(artifact_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def referenced(self, directories: Iterable[Path]) -> Set[str]:
+        """
+        查找目录中的文件（笔记本、笔记本数据等）引用的产物
+
+        Args:
+            directories: 要扫描的目录，不存在的目录被忽略
+
+        Returns:
+            Set[str]: 被引用的产物ID
+        """
+        found: Set[str] = set()
+        seen = set()
+        for directory in directories:
+            for path in Path(directory).rglob("*"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if not path.is_file():
+                    continue
+                seen.add(path)
+                key = (stat.st_mtime_ns, stat.st_size)
+                cached = self._references.get(path)
+                if cached is None or cached[0] != key:
+                    cached = (key, _scan_references(path))
+                    self._references[path] = cached
+                found |= cached[1]
+        for path in set(self._references) - seen:
+            del self._references[path]
+        return found
+
+    def sweep(self, max_bytes: int = 0, max_age: float = 0, keep: Optional[Set[str]] = None) -> int:
+        """
+        删除超过保留时间的产物，总大小仍超出上限时按最近使用时间从早到晚继续删除
+
+        Args:
+            max_bytes: 产物总大小上限（字节），0 表示不限制
+            max_age: 产物最近一次使用后的保留时间（秒），0 表示不限制
+            keep: 总是保留且不计入总大小的产物ID（已保存的笔记本引用的产物）
+
+        Returns:
+            int: 删除的产物个数
+        """
+        keep = keep or set()
+        now = time.time()
+        artifacts = []
+        for path in self.root.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.suffix == ".tmp":
+                if now - stat.st_mtime > STALE_TMP_SECONDS:
+                    path.unlink(missing_ok=True)
+                continue
+            if path.name not in keep:
+                artifacts.append((stat.st_mtime, stat.st_size, path))
+        artifacts.sort()
+        total = sum(size for _, size, _ in artifacts)
+        removed = 0
+        for mtime, size, path in artifacts:
+            expired = max_age and now - mtime > max_age
+            if not expired and (not max_bytes or total <= max_bytes):
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    @staticmethod
+    def url(artifact_id: str) -> str:
+        """产物的访问URL"""
+        return ARTIFACT_URL_PREFIX + artifact_id
+
+    @staticmethod
+    def media_type(artifact_id: str) -> str:
+        """产物的媒体类型"""
+        return MEDIA_TYPES[artifact_id.rsplit(".", 1)[-1]]
+
+    def image_tag(self, data: bytes, extension: str) -> str:
+        """
+        保存图片并返回引用它的 <img> 标签，配置了 FIGURE_INLINE 时返回内联的base64图片
+
+        Args:
+            data: 图片内容
+            extension: 图片格式
+
+        Returns:
+            str: <img> 标签
+        """
+        if settings.FIGURE_INLINE:
+            return f'<img src="data:{MEDIA_TYPES[extension]};base64,{base64.b64encode(data).decode()}">'
+        return f'<img src="{self.url(self.put(data, extension))}">'
+
+    def to_file_urls(self, html: str) -> str:
+        """
+        将HTML中的产物URL替换为本地文件路径（用于导出PDF等无法访问接口的场景）
+
+        Args:
+            html: 包含产物URL的HTML
+
+        Returns:
+            str: 替换后的HTML，不存在的产物保持原样
+        """
+        def replace(match):
+            path = self.get_path(match.group(1))
+            return path.resolve().as_uri() if path is not None else match.group(0)
+        return _ARTIFACT_URL.sub(replace, html)
+
+
+def artifact_ids(text: str) -> Set[str]:
+    """
+    查找文本（例如执行结果中的图片HTML）中引用的产物ID
+
+    Args:
+        text: 可能包含产物URL的文本
+
+    Returns:
+        Set[str]: 引用的产物ID
+    """
+    return {match.group(1) for match in _ARTIFACT_URL.finditer(text or "")}
+
+
+def _scan_references(path: Path) -> Set[str]:
+    """查找文件内容中的产物URL，返回引用的产物ID"""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return set()
+            # 笔记本数据文件可能很大，映射到内存后扫描，不需要整个读入
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return {match.group(1).decode() for match in _ARTIFACT_URL_BYTES.finditer(data)}
+    except (OSError, ValueError):
+        return set()
+
+
+_artifact_store: Optional[ArtifactStore] = None
+_artifact_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """获取ArtifactStore的单例实例"""
+    global _artifact_store
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            _artifact_store = ArtifactStore(settings.ARTIFACTS_DIR)
+        return _artifact_store
@@ -0,0 +1,220 @@
+"""
+单元格性能分析模块
+
+每次执行单元格时记录耗时（墙钟时间和CPU时间）和进程峰值内存的变化；
+开启详细分析时，额外使用 tracemalloc 统计执行期间的内存分配峰值，
+并使用 cProfile 统计耗时最多的函数。tracemalloc 是进程级的：inprocess 模式下多个会话同时开启
+详细分析时，内存分配峰值包含其他会话的分配，结果中以 memory_peak_scope 为 "process" 标明。
+按会话汇总每个单元格的执行统计，找出占用时间和内存最多的单元格。
+"""
+import cProfile
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 resource 模块
+    resource = None
+
+# tracemalloc 是进程级的，多个会话同时开启详细分析时共用，记录正在使用的数量和累计开启的次数
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_starts = 0
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """进程的峰值常驻内存（MB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位为字节，Linux 上为KB
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _start_tracemalloc() -> Optional[int]:
+    """
+    开始统计内存分配
+
+    Returns:
+        Optional[int]: 没有其他会话在统计时返回本次开启的序号，否则返回None
+            （不重置峰值，避免影响其他会话的统计）
+    """
+    global _tracemalloc_users, _tracemalloc_starts
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        alone = _tracemalloc_users == 0
+        _tracemalloc_users += 1
+        _tracemalloc_starts += 1
+        if not alone:
+            return None
+        tracemalloc.reset_peak()
+        return _tracemalloc_starts
+
+
+def _stop_tracemalloc(token: Optional[int]) -> Tuple[int, bool]:
+    """
+    结束统计内存分配
+
+    Args:
+        token: _start_tracemalloc 的返回值
+
+    Returns:
+        Tuple[int, bool]: 内存分配峰值（字节），以及统计期间是否只有本次执行在统计（峰值只包含本次执行的分配）
+    """
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        exclusive = token is not None and token == _tracemalloc_starts
+        _tracemalloc_users -= 1
+        if not _tracemalloc_users:
+            tracemalloc.stop()
+    return peak, exclusive
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int) -> List[Dict[str, Any]]:
+    """按累计耗时排序，返回耗时最多的函数"""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": name if filename == "~" else f"{filename}:{line}({name})",
+            "calls": calls,
+            "total_time": round(total, 6),
+            "cumulative_time": round(cumulative, 6)
+        })
+    rows.sort(key=lambda row: row["cumulative_time"], reverse=True)
+    return rows[:limit]
+
+
+class CellProfiler:
+    """
+    记录一次代码执行的性能数据，需要在执行代码的线程中进入和退出
+
+    执行线程会被复用，之前的中断不能用 PyThreadState_SetAsyncExc(NULL) 清除，
+    否则在该线程上开启cProfile后执行无法结束（见 execution_limits.deliver_pending_interrupt）。
+
+    用法:
+        profiler = CellProfiler(detailed=True)
+        with profiler:
+            exec(...)
+        profile = profiler.result()
+    """
+
+    def __init__(self, detailed: bool = False, top_n: int = 15):
+        """
+        Args:
+            detailed: 是否开启详细分析（tracemalloc 内存分配峰值和 cProfile 函数耗时）
+            top_n: 详细分析时返回耗时最多的函数个数
+        """
+        self.detailed = detailed
+        self.top_n = top_n
+        self._profile: Dict[str, Any] = {}
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def __enter__(self):
+        self._rss = _peak_rss_mb()
+        if self.detailed:
+            self._trace_token = _start_tracemalloc()
+            self._traced = tracemalloc.get_traced_memory()[0]
+            self._profiler = cProfile.Profile()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        if self._profiler is not None:
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # 当前线程已经有其他分析器在运行
+                self._profiler = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is not None:
+            self._profiler.disable()
+        self._profile = {
+            "wall_time": round(time.perf_counter() - self._wall, 6),
+            "cpu_time": round(time.thread_time() - self._cpu, 6),
+        }
+        rss = _peak_rss_mb()
+        if rss is not None:
+            # 峰值常驻内存只增不减，这里是本次执行使进程峰值内存增加的量
+            self._profile["peak_rss_increase_mb"] = round(rss - self._rss, 2)
+        if self.detailed:
+            peak, exclusive = _stop_tracemalloc(self._trace_token)
+            self._profile["memory_peak_mb"] = round(max(peak - self._traced, 0) / 1024 ** 2, 3)
+            # 有其他会话同时统计时，峰值是整个进程的分配峰值
+            self._profile["memory_peak_scope"] = "cell" if exclusive else "process"
+            if self._profiler is not None:
+                self._profile["top_functions"] = _top_functions(self._profiler, self.top_n)
+        return False
+
+    def result(self) -> Dict[str, Any]:
+        """
+        获取性能数据
+
+        Returns:
+            Dict: wall_time、cpu_time（秒）、peak_rss_increase_mb，
+                详细分析时还有 memory_peak_mb、memory_peak_scope 和 top_functions
+        """
+        return dict(self._profile)
+
+
+class SessionProfile:
+    """
+    汇总一个会话中每个单元格的执行统计
+    """
+
+    def __init__(self):
+        self._cells: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, cell_id: str, profile: Dict[str, Any]) -> None:
+        """
+        记录单元格一次执行的性能数据
+
+        Args:
+            cell_id: 单元格ID
+            profile: CellProfiler 返回的性能数据
+        """
+        if not profile:
+            return
+        with self._lock:
+            stats = self._cells.setdefault(cell_id, {
+                "cell_id": cell_id,
+                "runs": 0,
+                "total_wall_time": 0.0,
+                "total_cpu_time": 0.0,
+                "max_wall_time": 0.0,
+                # 详细分析时的内存分配峰值和进程峰值常驻内存的增加量，两者含义不同，分别记录
+                "max_memory_peak_mb": None,
+                "max_rss_increase_mb": None,
+            })
+            stats["runs"] += 1
+            stats["total_wall_time"] = round(stats["total_wall_time"] + profile["wall_time"], 6)
+            stats["total_cpu_time"] = round(stats["total_cpu_time"] + profile["cpu_time"], 6)
+            stats["max_wall_time"] = max(stats["max_wall_time"], profile["wall_time"])
+            for key, metric in (("max_memory_peak_mb", "memory_peak_mb"),
+                                ("max_rss_increase_mb", "peak_rss_increase_mb")):
+                if profile.get(metric) is not None:
+                    stats[key] = max(stats[key] or 0.0, profile[metric])
+            stats["last"] = profile
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        获取会话的执行统计
+
+        Returns:
+            Dict: 按累计耗时从高到低排列的单元格统计（cells），以及所有单元格的累计耗时
+        """
+        with self._lock:
+            cells = [dict(stats) for stats in self._cells.values()]
+        cells.sort(key=lambda stats: stats["total_wall_time"], reverse=True)
+        return {
+            "cells": cells,
+            "total_wall_time": round(sum(stats["total_wall_time"] for stats in cells), 6),
+            "total_cpu_time": round(sum(stats["total_cpu_time"] for stats in cells), 6),
+        }
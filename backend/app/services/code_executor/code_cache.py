@@ -0,0 +1,125 @@
+"""
+编译代码缓存模块
+
+用户会反复执行同一个单元格，每次执行都重新解析和编译源码。这里按源码的哈希值
+缓存编译后的代码对象，缓存条数有上限，按最近最少使用的顺序淘汰。
+代码对象不可变，可以在所有会话之间共享。
+"""
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from types import CodeType
+from typing import Dict, Any, Optional
+from app.core.config import settings
+
+# 编译代码时使用的文件名，出现在异常堆栈中
+CODE_FILENAME = "<string>"
+
+
+class CompiledCodeCache:
+    """
+    编译代码缓存
+    """
+    def __init__(self, maxsize: int = 256):
+        """
+        Args:
+            maxsize: 最多缓存的代码对象个数，0 表示不缓存
+        """
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, CodeType]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(code: str) -> str:
+        return hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def compile(self, code: str) -> CodeType:
+        """
+        获取源码编译后的代码对象，未缓存时编译并加入缓存
+
+        Args:
+            code: Python源码
+
+        Returns:
+            CodeType: 代码对象
+
+        Raises:
+            SyntaxError: 源码存在语法错误时
+        """
+        key = self._key(code)
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = compile(code, CODE_FILENAME, "exec")
+        if self.maxsize:
+            with self._lock:
+                self._cache[key] = compiled
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return compiled
+
+    def check_syntax(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        检查源码的语法，不执行代码，语法正确的代码会被编译并缓存
+
+        Args:
+            code: Python源码
+
+        Returns:
+            Optional[Dict]: 语法错误的信息（message、line、offset），语法正确时返回None
+        """
+        try:
+            self.compile(code)
+        except SyntaxError as e:
+            return {
+                "message": "".join(traceback.format_exception_only(type(e), e)),
+                "line": e.lineno,
+                "offset": e.offset
+            }
+        return None
+
+    def clear(self) -> None:
+        """清空缓存和命中统计"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: 缓存条数、上限、命中和未命中次数
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+# 进程内共享的缓存实例（process 模式下每个工作进程各有一个）
+_code_cache: Optional[CompiledCodeCache] = None
+_code_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CompiledCodeCache:
+    """获取CompiledCodeCache的单例实例"""
+    global _code_cache
+    with _code_cache_lock:
+        if _code_cache is None:
+            _code_cache = CompiledCodeCache(settings.CODE_CACHE_SIZE)
+        return _code_cache
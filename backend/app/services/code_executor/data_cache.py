@@ -0,0 +1,223 @@
+"""
+数据文件缓存模块
+
+多个笔记本读取同一个数据文件时，每个会话都要重新解析文件并各自保存一份数据。
+这里按 (文件路径, 修改时间, 文件大小, 读取参数) 缓存解析后的DataFrame，同一进程中的所有会话共享。
+SESSION_MODE 为 process 时每个会话在各自的工作进程中运行，缓存只在同一会话内生效，不能跨会话共享。
+默认交给会话的是缓存数据的独立拷贝，会话中的代码可以任意修改，省去的是重复解析文件的时间；
+只读取不修改的大文件可以使用 load_data(..., copy=False) 获取共享数据的浅拷贝，同时节省内存。
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import pandas as pd
+from app.core.config import settings
+
+# 按文件扩展名选择读取函数
+_READERS: Dict[str, Callable[..., Any]] = {
+    ".csv": pd.read_csv,
+    ".txt": pd.read_csv,
+    ".tsv": lambda path, **options: pd.read_csv(path, **{"sep": "\t", **options}),
+    ".xlsx": pd.read_excel,
+    ".xls": pd.read_excel,
+    ".json": pd.read_json,
+    ".parquet": pd.read_parquet,
+    ".feather": pd.read_feather,
+    ".pkl": pd.read_pickle,
+}
+
+
+def _freeze(value: Any) -> Hashable:
+    """将读取参数转换为可哈希的值，用作缓存键"""
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+def resolve_data_path(path: Any) -> Path:
+    """
+    解析数据文件路径，相对路径相对于数据目录（也可以以数据目录名开头，如 data/sales.csv）
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        Path: 文件的绝对路径
+
+    Raises:
+        ValueError: 文件不在数据目录中时
+        FileNotFoundError: 文件不存在时
+    """
+    data_dir = settings.DATA_DIR.resolve()
+    candidate = Path(path)
+    if not candidate.is_absolute():
+        resolved = data_dir / candidate
+        if not resolved.exists() and candidate.parts and candidate.parts[0] == data_dir.name:
+            resolved = data_dir.joinpath(*candidate.parts[1:])
+        candidate = resolved
+    candidate = candidate.resolve()
+    if data_dir not in candidate.parents:
+        raise ValueError(f"只能读取数据目录中的文件: {path}")
+    if not candidate.is_file():
+        raise FileNotFoundError(f"数据文件不存在: {path}")
+    return candidate
+
+
+class DataFileCache:
+    """
+    解析后的数据文件缓存，总内存超出上限时按最近最少使用的顺序淘汰
+    """
+    def __init__(self, max_mb: int = 1024):
+        """
+        Args:
+            max_mb: 缓存的DataFrame总内存上限（MB），0 表示不缓存
+        """
+        self.max_bytes = max_mb * 1024 * 1024
+        # 缓存键 -> (DataFrame, 内存占用字节数)
+        self._cache: "OrderedDict[Tuple, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在读取的文件，同一文件同时被多个会话读取时只解析一次
+        self._loading: Dict[Tuple, threading.Lock] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: Any, copy: bool = True, **options) -> Any:
+        """
+        读取数据目录中的文件，文件未修改且读取参数相同时使用缓存
+
+        Args:
+            path: 文件路径，相对路径相对于数据目录
+            copy: 是否返回可以任意修改的独立拷贝，否则返回与缓存共享数据的浅拷贝
+            options: 传给读取函数（如 pd.read_csv）的参数
+
+        Returns:
+            读取结果，通常为DataFrame
+
+        Raises:
+            ValueError: 文件不在数据目录中或不支持该文件类型时
+            FileNotFoundError: 文件不存在时
+        """
+        file_path = resolve_data_path(path)
+        reader = _READERS.get(file_path.suffix.lower())
+        if reader is None:
+            raise ValueError(f"不支持的文件类型: {file_path.suffix}")
+        stat = file_path.stat()
+        try:
+            key = (str(file_path), stat.st_mtime_ns, stat.st_size, _freeze(options))
+        except TypeError:
+            # 读取参数无法作为缓存键时直接读取
+            return reader(file_path, **options)
+        if not self.max_bytes:
+            return reader(file_path, **options)
+
+        df = self._get(key)
+        if df is None:
+            with self._lock:
+                loading = self._loading.setdefault(key, threading.Lock())
+            try:
+                with loading:
+                    df = self._get(key, count=False)
+                    if df is None:
+                        result = reader(file_path, **options)
+                        if not isinstance(result, pd.DataFrame):
+                            # 多个工作表等非DataFrame结果不缓存
+                            return result
+                        df = self._put(key, result)
+            finally:
+                # 读取失败时也要移除，否则该条目一直留在 _loading 中
+                with self._lock:
+                    self._loading.pop(key, None)
+        return df.copy(deep=True) if copy else df.copy(deep=False)
+
+    def _get(self, key: Tuple, count: bool = True) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if count:
+                self.misses += 1
+            return None
+
+    def _put(self, key: Tuple, df: pd.DataFrame) -> pd.DataFrame:
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return df
+        with self._lock:
+            # 文件被修改后旧版本的缓存不再使用
+            for stale in [other for other in self._cache if other[0] == key[0] and other[1:3] != key[1:3]]:
+                self._bytes -= self._cache.pop(stale)[1]
+            self._cache[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._bytes -= evicted
+        return df
+
+    def clear(self) -> None:
+        """清空缓存和命中统计"""
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: 缓存的文件数、内存占用和上限（MB）、命中和未命中次数
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "memory_mb": round(self._bytes / 1024 ** 2, 2),
+                "max_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+# 进程内共享的缓存实例（process 模式下每个工作进程各有一个）
+_data_cache: Optional[DataFileCache] = None
+_data_cache_lock = threading.Lock()
+
+
+def get_data_cache() -> DataFileCache:
+    """获取DataFileCache的单例实例"""
+    global _data_cache
+    with _data_cache_lock:
+        if _data_cache is None:
+            _data_cache = DataFileCache(settings.DATA_CACHE_MAX_MB)
+        return _data_cache
+
+
+def load_data(path: Any, copy: bool = True, **options) -> Any:
+    """
+    读取数据目录中的数据文件（csv、tsv、txt、xlsx、xls、json、parquet、feather、pkl），
+    多个笔记本读取同一个文件时只解析一次（process 模式下只在同一笔记本内复用）
+
+    默认返回可以任意修改的独立拷贝。传入 copy=False 时返回与缓存和其他笔记本共享数据的浅拷贝，
+    不占用额外内存，可以新增、替换、删除列或排序，但原地修改单个元素（如 df.loc[0, 'a'] = 1）
+    会同时改变缓存中的数据，只适合只读取不修改的数据。
+
+    Args:
+        path: 文件路径，相对路径相对于数据目录，如 'sales.csv' 或 'data/sales.csv'
+        copy: 是否返回可以任意修改的独立拷贝，为False时返回共享数据的浅拷贝
+        options: 传给读取函数（如 pd.read_csv）的参数
+
+    Returns:
+        读取结果，通常为DataFrame
+    """
+    return get_data_cache().load(path, copy=copy, **options)
@@ -1,57 +1,303 @@
-from typing import Dict, List, Optional, Any
+import logging
+import pickle
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Any, Hashable, Set, Tuple
+import numpy as np
 import pandas as pd
 from app.core.config import settings
+from app.core.serialization import sanitize_columns, sanitize_values
+from app.services.code_executor.session_snapshot import SpilledDataFrame
+from app.services.code_executor.dataframe_query import QueryViewCache
+from app.services.code_executor.arrow_export import dataframe_to_arrow
+
+logger = logging.getLogger(__name__)
+
+# 计算变更指纹时抽样的行数
+FINGERPRINT_SAMPLE_ROWS = 64
+# 预览的行数
+PREVIEW_ROWS = 5
+# 分页读取时每页的最大行数
+MAX_PAGE_ROWS = 1000
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> Hashable:
+    """
+    计算DataFrame的变更指纹，用于判断DataFrame自上次注册后是否被修改
+
+    由对象标识、形状、列、底层数组标识和抽样行的哈希组成，计算开销与DataFrame大小基本无关。
+    原地修改未被抽样到的单元格时无法察觉，这种情况下需要重新赋值或调用 register_dataframe(force=True)。
+
+    Args:
+        df: DataFrame对象
+
+    Returns:
+        Hashable: 指纹，相同表示未被修改
+    """
+    try:
+        # 整列替换、增删列等操作会更换底层数组
+        arrays = tuple(id(arr) for arr in df._mgr.arrays)
+    except AttributeError:
+        arrays = ()
+    rows = len(df)
+    if rows > FINGERPRINT_SAMPLE_ROWS:
+        positions = np.linspace(0, rows - 1, FINGERPRINT_SAMPLE_ROWS).astype(np.int64)
+        sample = df.iloc[positions]
+    else:
+        sample = df
+    try:
+        sample_hash = int(pd.util.hash_pandas_object(sample, index=True).sum())
+    except TypeError:
+        # 含有列表、字典等不可哈希的值
+        sample_hash = None
+    return (id(df), df.shape, tuple(map(str, df.columns)), arrays, sample_hash)
+
+
+def _profile_basic(df: pd.DataFrame) -> Dict[str, Any]:
+    """基本信息：形状、内存占用和列类型"""
+    return {
+        "basic_info": {
+            "行数": len(df),
+            "列数": len(df.columns),
+            "内存占用": f"{df.memory_usage().sum() / 1024**2:.2f} MB"
+        },
+        "columns": [{"name": str(col), "type": str(dtype)} for col, dtype in df.dtypes.items()]
+    }
+
+
+def _profile_nulls(df: pd.DataFrame) -> Dict[str, int]:
+    """每列的空值数量"""
+    return {str(col): int(count) for col, count in df.isnull().sum().items()}
+
+
+def _profile_summary(df: pd.DataFrame) -> Dict[str, Any]:
+    """数值列的描述性统计"""
+    try:
+        describe_df = df.describe()
+    except ValueError:
+        # 没有列的DataFrame无法统计
+        return {}
+    # 按列转换，nan 和无穷大替换为 None
+    return {col: dict(zip(describe_df.index, values))
+            for col, values in zip(describe_df.columns, sanitize_columns(describe_df))}
+
+
+def _profile_preview(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """前几行数据，按列转换为可以JSON序列化的值后组装为行"""
+    head = df.head(PREVIEW_ROWS)
+    columns = sanitize_columns(head)
+    if not columns:
+        return [{} for _ in range(len(head))]
+    return [dict(zip(head.columns, row)) for row in zip(*columns)]
+
+
+def _page(df: pd.DataFrame, positions: Optional[np.ndarray], offset: int, limit: int,
+          columns: Optional[List[str]], arrow: bool = False) -> Dict[str, Any]:
+    """
+    读取DataFrame（或其中按行号选出的行）的一页，数据按列排列
+    
+    Args:
+        df: DataFrame
+        positions: 行号数组，为空时按DataFrame的顺序读取全部行
+        offset: 起始位置
+        limit: 行数，不超过 MAX_PAGE_ROWS
+        columns: 需要的列名，为空时返回全部列
+        arrow: 是否将数据编码为Arrow IPC流（arrow），无法编码时仍返回 index 和 data
+    """
+    total = len(df) if positions is None else len(positions)
+    offset = min(max(int(offset), 0), total)
+    limit = min(max(int(limit), 0), MAX_PAGE_ROWS)
+    if columns:
+        labels = {str(col): position for position, col in enumerate(df.columns)}
+        unknown = [col for col in columns if col not in labels]
+        if unknown:
+            raise ValueError(f"列不存在: {', '.join(unknown)}")
+        column_positions = [labels[col] for col in columns]
+    else:
+        column_positions = list(range(len(df.columns)))
+    rows = slice(offset, offset + limit) if positions is None else positions[offset:offset + limit]
+    window = df.iloc[rows, column_positions]
+    page = {"total_rows": total, "offset": offset, "columns": [str(col) for col in window.columns]}
+    encoded = dataframe_to_arrow(window) if arrow else None
+    if encoded is not None:
+        return {**page, "arrow": encoded}
+    return {
+        **page,
+        "index": sanitize_values(window.index),
+        "data": dict(zip(page["columns"], sanitize_columns(window)))
+    }
+
+
+def dump_frames(frames: Dict[str, pd.DataFrame], path: Path) -> List[str]:
+    """
+    将 {变量名: DataFrame} 保存到pickle文件，无法序列化的DataFrame被跳过
+
+    先写入临时文件再替换，保存失败时不会留下写了一半的文件。
+
+    Returns:
+        List[str]: 已保存的DataFrame变量名
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(frames, f)
+    except Exception:
+        # 逐个检查，跳过无法序列化的DataFrame（例如列中含有锁或文件句柄等对象）
+        saved = {}
+        for name, df in frames.items():
+            try:
+                pickle.dumps(df)
+            except Exception as e:
+                logger.warning(f"DataFrame '{name}' 无法序列化，未保存: {str(e)}")
+                continue
+            saved[name] = df
+        frames = saved
+        with open(tmp_path, "wb") as f:
+            pickle.dump(frames, f)
+    tmp_path.replace(path)
+    return list(frames)
+
+
+# 统计信息分层，按计算开销从小到大排列
+PROFILE_TIERS: Dict[str, Callable[[pd.DataFrame], Any]] = {
+    "basic": _profile_basic,
+    "nulls": _profile_nulls,
+    "summary": _profile_summary,
+    "preview": _profile_preview,
+}
+
+_profile_pool: Optional[ThreadPoolExecutor] = None
+_profile_pool_lock = threading.Lock()
+
+
+def _get_profile_pool() -> ThreadPoolExecutor:
+    """获取后台计算统计信息的线程池"""
+    global _profile_pool
+    with _profile_pool_lock:
+        if _profile_pool is None:
+            _profile_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dataframe-profile")
+        return _profile_pool
+
 
 class DataFrameManager:
     """DataFrame变量管理器"""
     
     def __init__(self):
         self._dataframes: Dict[str, pd.DataFrame] = {}
-        self._dataframe_info: Dict[str, Dict] = {}
+        # 分层统计信息缓存，键为 (变量名, 版本号)
+        self._profiles: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._profile_lock = threading.Lock()
+        # 尚未完成的后台统计任务
+        self._prefetches: Set[Future] = set()
+        # 每个DataFrame注册时的变更指纹和版本号，版本号在DataFrame每次变更后加一
+        self._fingerprints: Dict[str, Hashable] = {}
+        self._versions: Dict[str, int] = {}
+        # 查询结果视图缓存，键中包含版本号
+        self._query_views = QueryViewCache()
         # 添加数据目录
         self.data_dir = settings.DATA_DIR
         if not self.data_dir.exists():
             self.data_dir.mkdir(parents=True)
     
-    def register_dataframe(self, name: str, df: pd.DataFrame) -> None:
+    def register_dataframe(self, name: str, df: pd.DataFrame, force: bool = False) -> bool:
         """
-        注册一个DataFrame变量并更新其信息
+        注册一个DataFrame变量，新增或被修改的DataFrame会使已缓存的统计信息失效
         
         Args:
             name: DataFrame变量名
             df: DataFrame对象
+            force: 是否不比较指纹，强制视为已修改
+            
+        Returns:
+            bool: DataFrame是否为新增或已被修改
         """
+        fingerprint = dataframe_fingerprint(df)
+        if not force and self._dataframes.get(name) is df and self._fingerprints.get(name) == fingerprint:
+            return False
         self._dataframes[name] = df
-        self._update_dataframe_info(name)
+        self._fingerprints[name] = fingerprint
+        with self._profile_lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._discard_profiles(name)
+        self._query_views.discard(name)
+        return True
     
-    def _update_dataframe_info(self, name: str) -> None:
+    def get_version(self, name: str) -> int:
         """
-        更新指定DataFrame的信息
+        获取DataFrame的版本号，DataFrame每次被替换或修改后加一
         
         Args:
             name: DataFrame变量名
+            
+        Returns:
+            int: 版本号，DataFrame不存在时返回0
+        """
+        return self._versions.get(name, 0)
+    
+    def register_lazy_dataframe(self, name: str, placeholder: SpilledDataFrame) -> None:
+        """
+        注册一个尚未从快照加载的DataFrame，第一次访问时才加载
+        
+        Args:
+            name: DataFrame变量名
+            placeholder: 快照中的DataFrame占位对象
+        """
+        self._dataframes[name] = placeholder
+        self._fingerprints.pop(name, None)
+        with self._profile_lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._discard_profiles(name)
+        self._query_views.discard(name)
+    
+    def reconcile(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        与会话命名空间同步：变量被删除或不再是DataFrame时移除其注册信息和统计信息缓存，
+        使不再被代码引用的DataFrame可以被释放
+        
+        Args:
+            names: 命名空间中当前为DataFrame的变量名
+            
+        Returns:
+            Dict: 被移除的变量名 dataframes，以及因此实际释放的内存 memory_mb
+                （DataFrame仍被其他变量或对象引用时不计算在内）
         """
+        names = set(names)
+        removed = [name for name in self._dataframes if name not in names]
+        if not removed:
+            return {"dataframes": [], "memory_mb": 0.0}
+        released = []
+        for name in removed:
+            df = self._dataframes.pop(name)
+            self._fingerprints.pop(name, None)
+            if isinstance(df, pd.DataFrame):
+                released.append((weakref.ref(df), int(df.memory_usage(index=True).sum())))
+            del df
+        with self._profile_lock:
+            for name in removed:
+                self._discard_profiles(name)
+        for name in removed:
+            self._query_views.discard(name)
+        # 弱引用失效说明DataFrame已被释放
+        freed = {id(ref): size for ref, size in released if ref() is None}
+        return {"dataframes": removed, "memory_mb": round(sum(freed.values()) / 1024 ** 2, 2)}
+    
+    def _discard_profiles(self, name: str) -> None:
+        """丢弃DataFrame旧版本的统计信息缓存，调用方需持有 _profile_lock"""
+        for key in [key for key in self._profiles if key[0] == name]:
+            del self._profiles[key]
+    
+    def _load(self, name: str) -> Optional[pd.DataFrame]:
+        """获取DataFrame，尚未从快照加载时先加载"""
         df = self._dataframes.get(name)
-        if df is not None:
-            self._dataframe_info[name] = {
-                "basic_info": {
-                    "行数": len(df),
-                    "列数": len(df.columns),
-                    "内存占用": f"{df.memory_usage().sum() / 1024**2:.2f} MB"
-                },
-                "columns": [
-                    {
-                        "name": str(col),
-                        "type": str(df[col].dtype),
-                        "null_count": int(df[col].isnull().sum())
-                    }
-                    for col in df.columns
-                ],
-                "preview": {
-                    "head": df.head().to_dict('records'),
-                    "summary": df.describe().to_dict()
-                }
-            }
+        if isinstance(df, SpilledDataFrame):
+            df = df.load()
+            self._dataframes[name] = df
+            self._fingerprints[name] = dataframe_fingerprint(df)
+        return df
     
     def get_dataframe(self, name: str) -> Optional[pd.DataFrame]:
         """
@@ -63,21 +309,205 @@ class DataFrameManager:
         Returns:
             Optional[pd.DataFrame]: DataFrame对象，如果不存在则返回None
         """
-        return self._dataframes.get(name)
+        return self._load(name)
+    
+    def get_dataframe_profile(self, name: str, tiers: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        获取DataFrame的分层统计信息，每一层只在第一次请求时计算，DataFrame变更前一直缓存
+        
+        Args:
+            name: DataFrame变量名
+            tiers: 需要的信息层，可选 "basic"、"nulls"、"summary"、"preview"，为空时返回全部
+            
+        Returns:
+            Optional[Dict[str, Any]]: 以信息层为键的统计信息，DataFrame不存在时返回None
+            
+        Raises:
+            ValueError: 信息层名称无效时
+        """
+        tiers = list(tiers or PROFILE_TIERS)
+        unknown = [tier for tier in tiers if tier not in PROFILE_TIERS]
+        if unknown:
+            raise ValueError(f"不支持的信息层: {', '.join(unknown)}")
+        df = self._load(name)
+        if df is None:
+            return None
+        version = self._versions.get(name, 0)
+        with self._profile_lock:
+            cached = dict(self._profiles.get((name, version), {}))
+        for tier in tiers:
+            if tier not in cached:
+                cached[tier] = PROFILE_TIERS[tier](df)
+                self._store_profile(name, version, tier, cached[tier])
+        return {tier: cached[tier] for tier in tiers}
+    
+    def _store_profile(self, name: str, version: int, tier: str, value: Any) -> None:
+        """缓存一层统计信息，DataFrame在计算期间已被修改时丢弃"""
+        with self._profile_lock:
+            if self._versions.get(name) != version:
+                return
+            self._profiles.setdefault((name, version), {})[tier] = value
+    
+    def prefetch_profiles(self, names: List[str], tiers: Optional[List[str]] = None) -> None:
+        """
+        在后台线程中预先计算DataFrame的统计信息
+        
+        Args:
+            names: DataFrame变量名
+            tiers: 需要预先计算的信息层，为空时使用配置中的 DATAFRAME_PROFILE_PREFETCH
+        """
+        if tiers is None:
+            tiers = [tier.strip() for tier in settings.DATAFRAME_PROFILE_PREFETCH.split(",") if tier.strip()]
+        tiers = [tier for tier in tiers if tier in PROFILE_TIERS]
+        if not tiers or not names:
+            return
+        for name in names:
+            df = self._dataframes.get(name)
+            if not isinstance(df, pd.DataFrame):
+                continue
+            future = _get_profile_pool().submit(self._prefetch_profile, name, df, self._versions.get(name, 0), tiers)
+            with self._profile_lock:
+                self._prefetches.add(future)
+            future.add_done_callback(self._prefetch_done)
+    
+    def _prefetch_done(self, future: Future) -> None:
+        with self._profile_lock:
+            self._prefetches.discard(future)
+    
+    def cancel_prefetches(self) -> None:
+        """
+        取消尚未开始的后台统计任务，并等待正在计算的任务结束，
+        在执行下一个单元格前调用，避免后台线程读取正在被代码修改的DataFrame
+        """
+        with self._profile_lock:
+            futures = list(self._prefetches)
+            self._prefetches.clear()
+        running = [future for future in futures if not future.cancel()]
+        if running:
+            wait(running)
+    
+    def _prefetch_profile(self, name: str, df: pd.DataFrame, version: int, tiers: List[str]) -> None:
+        """后台计算统计信息，结果只在DataFrame未变更时保留"""
+        for tier in tiers:
+            with self._profile_lock:
+                if self._versions.get(name) != version:
+                    return
+                if tier in self._profiles.get((name, version), {}):
+                    continue
+            try:
+                value = PROFILE_TIERS[tier](df)
+            except Exception as e:
+                # 下一个单元格可能正在修改该DataFrame，按需计算时会重新统计
+                logger.debug(f"后台统计DataFrame {name} 的 {tier} 信息失败: {str(e)}")
+                return
+            self._store_profile(name, version, tier, value)
+    
+    def get_rows(self, name: str, offset: int = 0, limit: int = 100,
+                 columns: Optional[List[str]] = None, arrow: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        按位置分页读取DataFrame的行，只转换请求的窗口，耗时与DataFrame的总行数无关
+        
+        Args:
+            name: DataFrame变量名
+            offset: 起始行号（从0开始）
+            limit: 读取的行数，不超过 MAX_PAGE_ROWS
+            columns: 需要的列名，为空时返回全部列
+            arrow: 是否以Arrow IPC流返回数据
+            
+        Returns:
+            Optional[Dict]: 总行数 total_rows、本页的起始行号 offset、列名 columns、行索引 index
+                和按列排列的数据 data（{列名: 值列表}），以Arrow格式返回时用 arrow（包含行索引的
+                Arrow IPC流）代替 index 和 data，DataFrame不存在时返回None
+            
+        Raises:
+            ValueError: 列名不存在时
+        """
+        df = self._load(name)
+        if df is None:
+            return None
+        return _page(df, None, offset, limit, columns, arrow)
     
-    def get_dataframe_info(self, name: str) -> Optional[Dict]:
+    def query_rows(self, name: str, query: Dict[str, Any], offset: int = 0, limit: int = 100,
+                   columns: Optional[List[str]] = None, arrow: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        对DataFrame执行声明式查询（过滤、分组聚合、排序）并分页读取结果
+        
+        查询结果视图按 (DataFrame版本, 查询) 缓存，翻页和重复查询不重新计算。
+        
+        Args:
+            name: DataFrame变量名
+            query: 查询，格式见 dataframe_query 模块
+            offset: 结果中的起始行号
+            limit: 读取的行数，不超过 MAX_PAGE_ROWS
+            columns: 需要的列名，为空时返回全部列
+            arrow: 是否以Arrow IPC流返回数据
+            
+        Returns:
+            Optional[Dict]: 格式同 get_rows，total_rows 为查询结果的总行数，
+                index 为原DataFrame中的行索引（分组聚合时为结果的行号），DataFrame不存在时返回None
+            
+        Raises:
+            ValueError: 查询无效时
+        """
+        df = self._load(name)
+        if df is None:
+            return None
+        view = self._query_views.get_view(name, self._versions.get(name, 0), df, query or {})
+        if isinstance(view, pd.DataFrame):
+            return _page(view, None, offset, limit, columns, arrow)
+        return _page(df, view, offset, limit, columns, arrow)
+    
+    def get_dataframe_info(self, name: str, tiers: Optional[List[str]] = None) -> Optional[Dict]:
         """
         获取指定DataFrame的详细信息
         
         Args:
             name: DataFrame变量名
+            tiers: 需要的信息层，为空时返回全部
             
         Returns:
-            Optional[Dict]: DataFrame的详细信息，如果不存在则返回None
+            Optional[Dict]: DataFrame的详细信息，包括 basic_info、columns 和 preview，如果不存在则返回None
+        """
+        tiers = list(tiers or PROFILE_TIERS)
+        if "basic" not in tiers:
+            tiers.insert(0, "basic")
+        profile = self.get_dataframe_profile(name, tiers)
+        if profile is None:
+            return None
+        columns = [dict(column) for column in profile["basic"]["columns"]]
+        if "nulls" in profile:
+            for column in columns:
+                column["null_count"] = profile["nulls"].get(column["name"], 0)
+        info = {"basic_info": profile["basic"]["basic_info"], "columns": columns}
+        if "summary" in profile or "preview" in profile:
+            info["preview"] = {
+                "head": profile.get("preview", []),
+                "summary": profile.get("summary", {})
+            }
+        return info
+    
+    def get_preview(self, name: str, rows: int = PREVIEW_ROWS) -> Optional[Dict[str, Any]]:
         """
-        if name not in self._dataframe_info:
-            self._update_dataframe_info(name)
-        return self._dataframe_info.get(name)
+        获取DataFrame的预览信息，只返回前几行数据，不传输整个DataFrame
+        
+        Args:
+            name: DataFrame变量名
+            rows: 预览的行数
+            
+        Returns:
+            Optional[Dict]: 形状 shape、列类型 columns、内存占用 memory_usage（字节）
+                和按列排列的前几行数据 sample_data，DataFrame不存在时返回None
+        """
+        df = self._load(name)
+        if df is None:
+            return None
+        head = df.head(rows)
+        return {
+            "shape": list(df.shape),
+            "columns": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+            "memory_usage": int(df.memory_usage(deep=True).sum()),
+            "sample_data": dict(zip(map(str, head.columns), sanitize_columns(head)))
+        }
     
     def get_dataframes_names(self) -> List[str]:
         """
@@ -89,12 +519,48 @@ class DataFrameManager:
         return list(self._dataframes.keys())
     
     def get_dataframes(self):
+        for name in list(self._dataframes):
+            self._load(name)
         return self._dataframes
     
+    def dump_dataframes(self, path: Path) -> List[str]:
+        """
+        将所有DataFrame以 {变量名: DataFrame} 的形式保存到pickle文件
+        
+        在DataFrame所在的进程中写入文件，process 模式下不需要把DataFrame传回服务进程。
+        
+        Args:
+            path: 文件路径
+            
+        Returns:
+            List[str]: 已保存的DataFrame变量名，无法序列化的DataFrame被跳过
+        """
+        frames = {}
+        for name in list(self._dataframes):
+            df = self._load(name)
+            if df is not None:
+                frames[name] = df
+        return dump_frames(frames, path)
+    
+    def get_memory_usage(self) -> int:
+        """
+        获取所有已注册DataFrame占用的内存
+        
+        同一个DataFrame以多个变量名注册时只计算一次，尚未从快照加载的DataFrame不计算在内。
+        
+        Returns:
+            int: 内存占用字节数（不深入统计object列中的字符串）
+        """
+        frames = {id(df): df for df in self._dataframes.values() if isinstance(df, pd.DataFrame)}
+        return int(sum(df.memory_usage(index=True).sum() for df in frames.values()))
+    
     def clear(self):
         """清空所有注册的DataFrame信息"""
         self._dataframes.clear()
-        self._dataframe_info.clear()
+        self._fingerprints.clear()
+        with self._profile_lock:
+            self._profiles.clear()
+        self._query_views.discard()
     
     def save_dataframe(self, name: str, file_path: str, file_type: str = "csv", **save_options) -> Dict[str, Any]:
         """
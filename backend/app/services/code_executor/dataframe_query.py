@@ -0,0 +1,239 @@
+"""
+DataFrame查询模块
+
+不写代码浏览DataFrame时，前端提交声明式的查询（过滤条件、排序、分组聚合），
+这里使用pandas的向量化操作计算查询结果。结果以视图的形式缓存：
+过滤和排序的结果是原DataFrame的行号数组，分组聚合的结果是聚合后的小DataFrame。
+缓存键包含DataFrame的版本号，翻页时直接从视图中取一页；只改变排序时复用已缓存的过滤结果；
+DataFrame被修改后版本号变化，旧的视图自动失效。
+
+查询格式:
+    {
+        "filters": [{"column": "age", "op": ">=", "value": 18}],
+        "group_by": ["city"],
+        "aggregations": [{"column": "income", "func": "mean", "name": "avg_income"}],
+        "sort": [{"column": "avg_income", "ascending": false}]
+    }
+执行顺序为 过滤 -> 分组聚合 -> 排序。
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+
+# 每个会话缓存的查询视图个数
+MAX_QUERY_VIEWS = 16
+
+
+def _contains(values: pd.Series, value: Any) -> pd.Series:
+    if values.dtype != object and not pd.api.types.is_string_dtype(values):
+        values = values.astype(str)
+    return values.str.contains(str(value), regex=False, na=False)
+
+
+def _between(values: pd.Series, value: Any) -> pd.Series:
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("between 的值必须是 [最小值, 最大值]")
+    return values.between(value[0], value[1])
+
+
+# 过滤条件的运算符
+FILTER_OPS: Dict[str, Callable[[pd.Series, Any], pd.Series]] = {
+    "==": lambda values, value: values == value,
+    "!=": lambda values, value: values != value,
+    ">": lambda values, value: values > value,
+    ">=": lambda values, value: values >= value,
+    "<": lambda values, value: values < value,
+    "<=": lambda values, value: values <= value,
+    "in": lambda values, value: values.isin(list(value)),
+    "not_in": lambda values, value: ~values.isin(list(value)),
+    "between": _between,
+    "contains": _contains,
+    "startswith": lambda values, value: values.astype(str).str.startswith(str(value), na=False),
+    "isnull": lambda values, value: values.isna(),
+    "notnull": lambda values, value: values.notna(),
+}
+
+# 分组聚合支持的函数
+AGG_FUNCS = ("count", "size", "sum", "mean", "median", "min", "max", "std", "var", "nunique", "first", "last")
+
+
+def _column(df: pd.DataFrame, name: Any) -> Any:
+    """按列名（字符串形式）查找列标签"""
+    for column in df.columns:
+        if str(column) == str(name):
+            return column
+    raise ValueError(f"列不存在: {name}")
+
+
+def filter_mask(df: pd.DataFrame, filters: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    计算所有过滤条件同时满足的行
+
+    Args:
+        df: DataFrame
+        filters: 过滤条件 [{"column": 列名, "op": 运算符, "value": 值}]
+
+    Returns:
+        np.ndarray: 布尔数组，满足条件的行为True
+
+    Raises:
+        ValueError: 列名或运算符无效时
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for condition in filters:
+        op = FILTER_OPS.get(condition.get("op"))
+        if op is None:
+            raise ValueError(f"不支持的过滤运算符: {condition.get('op')}")
+        values = df[_column(df, condition.get("column"))]
+        try:
+            matched = op(values, condition.get("value"))
+        except TypeError as e:
+            raise ValueError(f"无法按列 {condition.get('column')} 过滤: {str(e)}")
+        if matched.dtype != bool:
+            # 可空类型的比较结果中含有缺失值
+            matched = matched.fillna(False)
+        mask &= np.asarray(matched, dtype=bool)
+    return mask
+
+
+def _sort_spec(df: pd.DataFrame, sort: List[Dict[str, Any]]) -> Tuple[List[Any], List[bool]]:
+    return [_column(df, key.get("column")) for key in sort], [bool(key.get("ascending", True)) for key in sort]
+
+
+def sort_positions(df: pd.DataFrame, positions: np.ndarray, sort: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    按排序条件对行号排序（稳定排序，空值排在最后）
+
+    Args:
+        df: DataFrame
+        positions: 参与排序的行号
+        sort: 排序条件 [{"column": 列名, "ascending": 是否升序}]
+
+    Returns:
+        np.ndarray: 排序后的行号
+    """
+    columns, ascending = _sort_spec(df, sort)
+    keys = df.iloc[positions, [df.columns.get_loc(col) for col in columns]].reset_index(drop=True)
+    keys.columns = range(len(columns))
+    order = keys.sort_values(by=list(keys.columns), ascending=ascending, kind="stable", na_position="last").index
+    return positions[order.to_numpy()]
+
+
+def group_frame(df: pd.DataFrame, group_by: List[Any], aggregations: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    分组聚合
+
+    Args:
+        df: 已过滤的DataFrame
+        group_by: 分组的列名
+        aggregations: 聚合 [{"column": 列名, "func": 聚合函数, "name": 可选的结果列名}]，
+            为空时统计每组的行数
+
+    Returns:
+        pd.DataFrame: 每组一行，分组列在前，之后是各聚合结果列
+    """
+    keys = [_column(df, col) for col in group_by]
+    grouped = df.groupby(keys, dropna=False, sort=True, observed=True)
+    if not aggregations:
+        aggregations = [{"func": "size", "name": "count"}]
+    named = {}
+    for aggregation in aggregations:
+        func = aggregation.get("func")
+        if func not in AGG_FUNCS:
+            raise ValueError(f"不支持的聚合函数: {func}")
+        column = aggregation.get("column")
+        name = str(aggregation.get("name") or (func if column is None else f"{column}_{func}"))
+        if func == "size" or column is None:
+            named[name] = grouped.size()
+        else:
+            named[name] = grouped[_column(df, column)].agg(func)
+    result = pd.DataFrame(named)
+    return result.reset_index()
+
+
+def _key(query: Dict[str, Any], *parts: str) -> str:
+    """查询中指定部分的规范化表示，用作缓存键"""
+    return json.dumps({part: query.get(part) or [] for part in parts}, sort_keys=True, default=str)
+
+
+# 查询视图：原DataFrame的行号数组，或分组聚合后的DataFrame
+QueryView = Union[np.ndarray, pd.DataFrame]
+
+
+class QueryViewCache:
+    """
+    缓存查询的中间结果（过滤结果）和最终视图，按最近最少使用的顺序淘汰
+    """
+
+    def __init__(self, maxsize: int = MAX_QUERY_VIEWS):
+        self.maxsize = maxsize
+        self._views: "OrderedDict[Tuple[Hashable, ...], QueryView]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key: Tuple[Hashable, ...], compute: Callable[[], QueryView]) -> QueryView:
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                self.hits += 1
+                return view
+            self.misses += 1
+        view = compute()
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > self.maxsize:
+                self._views.popitem(last=False)
+        return view
+
+    def get_view(self, name: str, version: int, df: pd.DataFrame, query: Dict[str, Any]) -> QueryView:
+        """
+        获取查询的结果视图，已缓存时直接返回
+
+        Args:
+            name: DataFrame变量名
+            version: DataFrame的版本号
+            df: DataFrame
+            query: 查询
+
+        Returns:
+            QueryView: 行号数组（只有过滤和排序时）或分组聚合后的DataFrame
+        """
+        def compute_positions() -> np.ndarray:
+            positions = np.arange(len(df), dtype=np.int64)
+            if query.get("filters"):
+                positions = positions[filter_mask(df, query["filters"])]
+            return positions
+
+        positions = self._cached((name, version, "filter", _key(query, "filters")), compute_positions)
+        if not query.get("group_by") and not query.get("sort"):
+            return positions
+
+        def compute_view() -> QueryView:
+            if query.get("group_by"):
+                source = df if len(positions) == len(df) else df.iloc[positions]
+                grouped = group_frame(source, query["group_by"], query.get("aggregations") or [])
+                if query.get("sort"):
+                    columns, ascending = _sort_spec(grouped, query["sort"])
+                    grouped = grouped.sort_values(by=columns, ascending=ascending, kind="stable",
+                                                  na_position="last", ignore_index=True)
+                return grouped
+            return sort_positions(df, positions, query["sort"])
+
+        key = (name, version, "view", _key(query, "filters", "group_by", "aggregations", "sort"))
+        return self._cached(key, compute_view)
+
+    def discard(self, name: Optional[str] = None) -> None:
+        """
+        丢弃视图
+
+        Args:
+            name: DataFrame变量名，为空时丢弃全部视图
+        """
+        with self._lock:
+            for key in [key for key in self._views if name is None or key[0] == name]:
+                del self._views[key]
@@ -0,0 +1,240 @@
+"""
+单元格依赖分析模块
+
+通过静态分析（AST）找出每个单元格定义和使用的变量，按单元格顺序建立依赖关系：
+单元格依赖于在它之前、最近一次定义它所使用变量的单元格。
+结合每个单元格最近一次执行的代码和顺序，找出需要重新执行的（过期的）单元格。
+"""
+import ast
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Any, FrozenSet, List, Optional, Set, Tuple
+
+
+class _SymbolVisitor(ast.NodeVisitor):
+    """收集一段代码在模块作用域中读取和写入的变量名"""
+
+    def __init__(self):
+        self.loads: Set[str] = set()
+        self.stores: Set[str] = set()
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.loads.add(node.id)
+        else:
+            self.stores.add(node.id)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name != "*":
+                self.stores.add(alias.asname or alias.name.split(".")[0])
+
+    visit_ImportFrom = visit_Import
+
+    def _mutate(self, target: ast.AST):
+        """df['a'] = ...、df.x = ... 等修改对象的语句，既读取又修改根变量"""
+        while isinstance(target, (ast.Attribute, ast.Subscript)):
+            target = target.value
+        if isinstance(target, ast.Name):
+            self.loads.add(target.id)
+            self.stores.add(target.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not isinstance(node.ctx, ast.Load):
+            self._mutate(node)
+        self.generic_visit(node)
+
+    visit_Subscript = visit_Attribute
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        if isinstance(node.target, ast.Name):
+            self.loads.add(node.target.id)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        # df.drop(..., inplace=True) 等原地修改
+        if isinstance(node.func, ast.Attribute) and any(
+            keyword.arg == "inplace" and isinstance(keyword.value, ast.Constant) and keyword.value.value is True
+            for keyword in node.keywords
+        ):
+            self._mutate(node.func.value)
+        self.generic_visit(node)
+
+    def _visit_scope(self, nodes: List[ast.AST], bound: Set[str]):
+        """分析嵌套作用域，只保留其中引用的外部变量"""
+        inner = _SymbolVisitor()
+        for child in nodes:
+            inner.visit(child)
+        self.loads |= inner.loads - inner.stores - bound
+
+    @staticmethod
+    def _arg_names(args: ast.arguments) -> Set[str]:
+        names = [arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs]
+        names += [arg.arg for arg in (args.vararg, args.kwarg) if arg is not None]
+        return set(names)
+
+    def visit_FunctionDef(self, node):
+        for child in node.decorator_list + node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            self.visit(child)
+        self.stores.add(node.name)
+        self._visit_scope(node.body, self._arg_names(node.args))
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        for child in node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            self.visit(child)
+        self._visit_scope([node.body], self._arg_names(node.args))
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self.stores.add(node.name)
+        self._visit_scope(node.body, set())
+
+    def _visit_comprehension(self, node):
+        # 第一个迭代对象在外部作用域中求值，其余部分属于推导式自己的作用域
+        self.visit(node.generators[0].iter)
+        elements = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+        inner = [generator.target for generator in node.generators]
+        inner += [cond for generator in node.generators for cond in generator.ifs]
+        inner += [generator.iter for generator in node.generators[1:]]
+        self._visit_scope(inner + elements, set())
+
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _visit_comprehension
+
+
+class CellSymbols:
+    """单元格定义和使用的变量"""
+
+    __slots__ = ("defs", "uses")
+
+    def __init__(self, defs: FrozenSet[str], uses: FrozenSet[str]):
+        self.defs = defs
+        self.uses = uses
+
+
+@lru_cache(maxsize=1024)
+def analyze_cell(code: str) -> Optional[CellSymbols]:
+    """
+    分析单元格代码定义和使用的变量
+
+    按语句顺序分析，在同一单元格中先定义后使用的变量不算作对其他单元格的依赖。
+
+    Args:
+        code: 单元格代码
+
+    Returns:
+        Optional[CellSymbols]: 定义和使用的变量，代码有语法错误时返回None
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    defs: Set[str] = set()
+    uses: Set[str] = set()
+    for statement in tree.body:
+        visitor = _SymbolVisitor()
+        visitor.visit(statement)
+        uses |= visitor.loads - defs
+        defs |= visitor.stores
+    return CellSymbols(frozenset(defs), frozenset(uses))
+
+
+def code_hash(code: str) -> str:
+    """计算单元格代码的哈希值"""
+    return hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class DependencyGraph:
+    """
+    笔记本的单元格依赖图，记录会话中每个单元格最近一次执行的代码和顺序
+    """
+
+    def __init__(self):
+        # 单元格ID -> (代码哈希, 执行序号, 是否执行成功, 定义的变量)
+        self._runs: Dict[str, Tuple[str, int, bool, FrozenSet[str]]] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def record_run(self, cell_id: str, code: str, success: bool) -> None:
+        """
+        记录一次单元格执行
+
+        Args:
+            cell_id: 单元格ID
+            code: 执行的代码
+            success: 是否执行成功
+        """
+        symbols = analyze_cell(code)
+        defs = symbols.defs if symbols is not None else frozenset()
+        with self._lock:
+            self._sequence += 1
+            self._runs[cell_id] = (code_hash(code), self._sequence, success, defs)
+
+    def forget(self, names: Optional[List[str]] = None) -> None:
+        """
+        清除执行记录，之后对应的单元格会被视为过期
+
+        Args:
+            names: 只清除定义了这些变量的单元格（例如会话恢复时丢失的变量），为空时清除全部记录
+        """
+        with self._lock:
+            if names is None:
+                self._runs.clear()
+                return
+            lost = set(names)
+            for cell_id in [cell_id for cell_id, run in self._runs.items() if run[3] & lost]:
+                del self._runs[cell_id]
+
+    def plan(self, cells: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        分析单元格的依赖关系和过期状态
+
+        单元格在以下情况下过期：从未执行、代码已修改、上次执行失败、
+        依赖的单元格已过期，或依赖的单元格在它之后重新执行过。
+
+        Args:
+            cells: 按笔记本顺序排列的单元格，每项包含 cell_id 和 code
+
+        Returns:
+            List[Dict]: 每个单元格的 cell_id、依赖的单元格ID（depends_on）、过期原因（reason，未过期时为None）
+        """
+        with self._lock:
+            runs = dict(self._runs)
+        definers: Dict[str, int] = {}
+        stale: List[bool] = []
+        plan = []
+        for index, cell in enumerate(cells):
+            symbols = analyze_cell(cell["code"]) or CellSymbols(frozenset(), frozenset())
+            depends_on = sorted({definers[name] for name in symbols.uses if name in definers})
+            run = runs.get(cell["cell_id"])
+            if not cell["code"].strip():
+                # 空单元格不需要执行
+                reason = None
+            elif run is None:
+                reason = "never_run"
+            elif run[0] != code_hash(cell["code"]):
+                reason = "code_changed"
+            elif not run[2]:
+                reason = "failed"
+            else:
+                reason = None
+                for dep in depends_on:
+                    dep_run = runs.get(cells[dep]["cell_id"])
+                    if stale[dep]:
+                        reason = "upstream_stale"
+                        break
+                    if dep_run is not None and dep_run[1] > run[1]:
+                        reason = "upstream_changed"
+                        break
+            stale.append(reason is not None)
+            for name in symbols.defs:
+                definers[name] = index
+            plan.append({
+                "cell_id": cell["cell_id"],
+                "depends_on": [cells[dep]["cell_id"] for dep in depends_on],
+                "reason": reason
+            })
+        return plan
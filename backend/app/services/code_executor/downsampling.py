@@ -0,0 +1,174 @@
+"""
+折线图降采样模块
+
+数据点很多的折线图（例如高频传感器数据）在捕获图形时使用 LTTB（Largest-Triangle-Three-Buckets）
+算法降采样：将数据按顺序分桶，每个桶中保留与相邻桶构成三角形面积最大的点，
+在大幅减少点数的同时保留曲线的峰谷等视觉特征。
+
+plotly图形只在序列化的数据上降采样，不修改用户的图形对象；
+matplotlib图形在渲染前直接替换线条数据（渲染后图形即被关闭）。
+"""
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+
+# 降采样时同步截取的plotly逐点属性
+_PLOTLY_POINT_ATTRS = ("x", "y", "text", "hovertext", "customdata", "ids")
+_PLOTLY_NESTED_ATTRS = ("marker", "line", "error_y", "error_x")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    使用LTTB算法选择保留的数据点
+
+    Args:
+        x: 横坐标（数值，按升序排列）
+        y: 纵坐标（数值）
+        n_out: 保留的点数
+
+    Returns:
+        np.ndarray: 保留的点的下标，按升序排列，总是包含首尾两个点
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # 首尾两个点单独保留，中间的点分为 n_out - 2 个桶
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # 每个桶的平均点，用作下一个桶选点时的第三个顶点
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i + 1]) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y[i + 1] - ay))
+        # 包含NaN的点不参与比较，整个桶都是NaN时保留第一个点
+        area = np.where(np.isnan(area), -1.0, area)
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def _numeric_x(x: Any, n: int) -> Optional[np.ndarray]:
+    """
+    将横坐标转换为可以计算面积的数值，无法转换时使用点的序号，横坐标不是升序时返回None
+    """
+    if x is None:
+        return np.arange(n, dtype=np.float64)
+    values = np.asarray(x)
+    if values.dtype.kind == "M":
+        values = values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    elif values.dtype.kind == "O":
+        try:
+            values = pd.DatetimeIndex(values).asi8.astype(np.float64)
+        except (TypeError, ValueError):
+            # 分类等无法转换为数值的横坐标按等间距处理
+            return np.arange(n, dtype=np.float64)
+    elif values.dtype.kind not in "iufb":
+        return np.arange(n, dtype=np.float64)
+    values = values.astype(np.float64)
+    if np.any(np.diff(values) < 0):
+        # 横坐标无序的折线（例如轨迹图）降采样会改变形状，不处理
+        return None
+    return values
+
+
+def _take(value: Any, indices: np.ndarray, n: int) -> Any:
+    """截取与数据点一一对应的属性，其他属性原样返回"""
+    if isinstance(value, np.ndarray) and value.ndim >= 1 and len(value) == n:
+        return value[indices]
+    if isinstance(value, (list, tuple)) and len(value) == n:
+        return [value[i] for i in indices]
+    return value
+
+
+def _downsample_record(source: str, name: Any, original: int, points: int) -> Dict[str, Any]:
+    return {"source": source, "name": None if name is None else str(name), "original_points": original, "points": points}
+
+
+def downsample_plotly_trace(trace: Dict[str, Any], threshold: int, n_out: int,
+                            report: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    对plotly折线轨迹降采样
+
+    Args:
+        trace: 轨迹的字典表示（不会被修改）
+        threshold: 点数超过该值时降采样，0 表示不降采样
+        n_out: 降采样后的点数
+        report: 降采样记录列表，降采样时追加一条记录
+
+    Returns:
+        Dict: 降采样后的轨迹，不需要降采样时返回原轨迹
+    """
+    if not threshold or trace.get("type", "scatter") not in ("scatter", "scattergl"):
+        return trace
+    y = trace.get("y")
+    if y is None or isinstance(y, str):
+        return trace
+    n = len(y)
+    # 未指定 mode 时，点数超过20的scatter轨迹默认绘制为折线
+    if n <= threshold or "lines" not in (trace.get("mode") or "lines"):
+        return trace
+    y_values = np.asarray(y)
+    if y_values.ndim != 1 or y_values.dtype.kind not in "iufb":
+        return trace
+    x = trace.get("x")
+    if x is not None and len(x) != n:
+        return trace
+    x_values = _numeric_x(x, n)
+    if x_values is None:
+        return trace
+
+    indices = lttb_indices(x_values, y_values, n_out)
+    downsampled = {key: _take(value, indices, n) if key in _PLOTLY_POINT_ATTRS else value
+                   for key, value in trace.items()}
+    for key in _PLOTLY_NESTED_ATTRS:
+        if isinstance(trace.get(key), dict):
+            downsampled[key] = {attr: _take(value, indices, n) for attr, value in trace[key].items()}
+    if report is not None:
+        report.append(_downsample_record("plotly", trace.get("name"), n, len(indices)))
+    return downsampled
+
+
+def downsample_matplotlib_figure(fig: Any, threshold: int, n_out: int,
+                                 report: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    对matplotlib图形中的折线降采样（直接修改线条数据）
+
+    Args:
+        fig: matplotlib图形
+        threshold: 点数超过该值时降采样，0 表示不降采样
+        n_out: 降采样后的点数
+        report: 降采样记录列表，每条被降采样的折线追加一条记录
+    """
+    if not threshold:
+        return
+    for ax in fig.axes:
+        for line in ax.get_lines():
+            # 使用单位转换后的数据，日期、分类等横坐标已经转换为数值
+            x, y = line.get_xdata(orig=False), line.get_ydata(orig=False)
+            n = len(y)
+            if n <= threshold or len(x) != n:
+                continue
+            try:
+                x_values = np.ma.asarray(x, dtype=np.float64).filled(np.nan)
+                y_values = np.ma.asarray(y, dtype=np.float64).filled(np.nan)
+            except (TypeError, ValueError):
+                continue
+            if np.any(np.diff(x_values) < 0):
+                continue
+            indices = lttb_indices(x_values, y_values, n_out)
+            line.set_data(x_values[indices], y_values[indices])
+            if report is not None:
+                label = line.get_label()
+                report.append(_downsample_record("matplotlib", None if label.startswith("_") else label, n, len(indices)))
+
@@ -0,0 +1,181 @@
+"""
+代码执行限制模块
+
+提供单元格执行的中断、超时以及工作进程的CPU时间和内存限制，
+超出限制时返回统一结构的执行结果。
+"""
+import ctypes
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 resource 模块
+    resource = None
+
+# 限制类型
+LIMIT_INTERRUPTED = "interrupted"
+LIMIT_TIMEOUT = "timeout"
+LIMIT_MEMORY = "memory"
+LIMIT_CPU_TIME = "cpu_time"
+LIMIT_WORKER_EXITED = "worker_exited"
+
+_LIMIT_MESSAGES = {
+    LIMIT_INTERRUPTED: "代码执行已被中断",
+    LIMIT_TIMEOUT: "代码执行超时",
+    LIMIT_MEMORY: "代码执行超出内存限制",
+    LIMIT_CPU_TIME: "代码执行超出CPU时间限制",
+    LIMIT_WORKER_EXITED: "会话工作进程意外退出",
+}
+
+
+class ExecutionLimitExceeded(Exception):
+    """代码执行超出限制时抛出的异常"""
+
+    def __init__(self, kind: str, limit: Optional[float] = None):
+        self.kind = kind
+        self.limit = limit
+        super().__init__(_LIMIT_MESSAGES.get(kind, kind))
+
+
+def execution_result() -> Dict[str, Any]:
+    """
+    构造一次执行的初始结果，所有返回路径都以它为基础，保证结果字段一致
+
+    Returns:
+        Dict: 执行成功且没有输出时的结果，profile 为空表示代码没有运行
+    """
+    return {
+        "output": "",
+        "error": None,
+        "status": "success",
+        "has_dataframes": False,
+        "plot": "",
+        "plotly_json": "",
+        # 捕获图形时被降采样的折线和被聚合为热力图的散点
+        "downsampled": [],
+        "rasterized": [],
+        # 变量被删除后不再跟踪的DataFrame和释放的内存
+        "reclaimed": {"dataframes": [], "memory_mb": 0.0},
+        "profile": {},
+        "output_truncated": None
+    }
+
+
+def limit_exceeded_result(kind: str, limit: Optional[float] = None, output: str = "",
+                          session_reset: bool = False) -> Dict[str, Any]:
+    """
+    构造超出限制时的执行结果
+
+    Args:
+        kind: 限制类型
+        limit: 限制值（秒或MB）
+        output: 被中断前已产生的输出
+        session_reset: 会话是否因此被重置（工作进程被终止时，会话中的变量全部丢失）
+
+    Returns:
+        Dict: 与正常执行结果字段一致，status 为 "limit_exceeded"，并附带 limit_exceeded 详情
+    """
+    message = _LIMIT_MESSAGES.get(kind, kind)
+    if limit:
+        message += f" (限制: {limit:g}{'MB' if kind == LIMIT_MEMORY else '秒'})"
+    if session_reset:
+        message += "，会话已重置，变量需要重新计算"
+    result = execution_result()
+    result.update({
+        "output": f"{output}{message}\n",
+        "error": message,
+        "status": "limit_exceeded",
+        "limit_exceeded": {
+            "type": kind,
+            "limit": limit,
+            "session_reset": session_reset
+        }
+    })
+    return result
+
+
+def interrupt_thread(thread_id: int) -> None:
+    """
+    在指定线程中抛出KeyboardInterrupt
+
+    主线程（工作进程中执行代码的线程）通过SIGINT信号中断，可以打断sleep等阻塞调用；
+    其他线程通过异步异常中断，在线程执行下一条字节码时生效。
+    """
+    if thread_id == threading.main_thread().ident and hasattr(signal, "pthread_kill"):
+        signal.pthread_kill(thread_id, signal.SIGINT)
+        return
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), ctypes.py_object(KeyboardInterrupt))
+
+
+# 等待已发送的中断生效时最多执行的空循环次数
+_DELIVERY_SPINS = 1000
+
+
+def deliver_pending_interrupt() -> bool:
+    """
+    在当前线程中接收已发送但尚未生效的中断
+
+    异步异常和信号处理函数都在线程执行字节码时生效，这里执行一段空循环让中断在循环中抛出并捕获。
+    不能用 PyThreadState_SetAsyncExc(NULL) 清除中断：CPython 3.11 中这会使解释器的
+    检查标志一直保持置位，之后该线程开启cProfile时执行会陷入死循环。
+
+    Returns:
+        bool: 是否收到了中断（被中断的代码自己捕获了KeyboardInterrupt时不会再收到）
+    """
+    try:
+        for _ in range(_DELIVERY_SPINS):
+            pass
+    except KeyboardInterrupt:
+        return True
+    return False
+
+
+def apply_memory_limit(limit_mb: int) -> None:
+    """
+    限制当前进程的地址空间大小，超出时内存分配抛出MemoryError
+
+    Args:
+        limit_mb: 内存上限（MB），0 表示不限制
+    """
+    if not limit_mb or resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = limit_mb * 1024 ** 2
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+@contextmanager
+def cpu_time_limit(seconds: float):
+    """
+    限制代码块可使用的CPU时间，超出时在主线程中抛出ExecutionLimitExceeded
+
+    只能在进程的主线程中使用（信号处理函数只能在主线程中注册）。
+
+    Args:
+        seconds: CPU时间上限（秒），0 表示不限制
+    """
+    if not seconds or resource is None or not hasattr(signal, "SIGXCPU"):
+        yield
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    new_soft = used + max(int(seconds), 1)
+    if hard != resource.RLIM_INFINITY:
+        new_soft = min(new_soft, hard)
+
+    def raise_cpu_time_exceeded(signum, frame):
+        raise ExecutionLimitExceeded(LIMIT_CPU_TIME, seconds)
+
+    previous_handler = signal.signal(signal.SIGXCPU, raise_cpu_time_exceeded)
+    resource.setrlimit(resource.RLIMIT_CPU, (new_soft, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        signal.signal(signal.SIGXCPU, previous_handler)
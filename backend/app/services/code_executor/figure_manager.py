@@ -0,0 +1,156 @@
+"""
+会话图形管理模块
+
+pyplot 通过全局的 Gcf.figs 记录所有打开的图形，多个会话在不同线程中同时执行代码时，
+会话之间的图形会互相覆盖。这里将 Gcf.figs 替换为按上下文分发的映射，每个会话在
+执行代码时激活自己的图形记录，plt.figure、plt.gcf、plt.close 等只作用于当前会话的图形。
+
+plt.show 和 plotly.io.show 也只替换一次，调用时分发给当前激活的会话处理。
+"""
+import contextvars
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Any, Callable, List, Optional
+import matplotlib
+matplotlib.use('Agg')  # 在导入plt之前设置后端
+import matplotlib.pyplot as plt
+from matplotlib._pylab_helpers import Gcf
+import plotly.io as pio
+
+# 当前线程中激活的会话图形
+_active_session: contextvars.ContextVar = contextvars.ContextVar("active_figure_session", default=None)
+
+_install_lock = threading.Lock()
+
+
+class _SessionFigs(MutableMapping):
+    """替换 Gcf.figs 的映射，按当前激活的会话分发，没有激活的会话时使用全局记录"""
+
+    def __init__(self, default: "OrderedDict"):
+        self._default = default
+
+    def _figs(self) -> "OrderedDict":
+        session = _active_session.get()
+        return self._default if session is None else session.figs
+
+    def __getitem__(self, num):
+        return self._figs()[num]
+
+    def __setitem__(self, num, manager):
+        self._figs()[num] = manager
+
+    def __delitem__(self, num):
+        del self._figs()[num]
+
+    def __iter__(self):
+        return iter(self._figs())
+
+    def __len__(self) -> int:
+        return len(self._figs())
+
+    def __reversed__(self):
+        return reversed(self._figs())
+
+    def move_to_end(self, num, last: bool = True):
+        self._figs().move_to_end(num, last)
+
+    def values(self):
+        return self._figs().values()
+
+    def clear(self):
+        self._figs().clear()
+
+
+def _dispatch_show(*args, **kwargs):
+    """替换 plt.show，交给当前会话处理"""
+    session = _active_session.get()
+    if session is not None and session.on_show is not None:
+        session.on_show()
+    return None
+
+
+def _dispatch_plotly_show(fig, *args, **kwargs):
+    """替换 plotly.io.show（fig.show() 也会调用它），交给当前会话处理"""
+    session = _active_session.get()
+    if session is not None and session.on_plotly_show is not None:
+        session.on_plotly_show(fig)
+    return None
+
+
+def install() -> None:
+    """替换全局的图形记录和显示函数（只替换一次）"""
+    with _install_lock:
+        if not isinstance(Gcf.figs, _SessionFigs):
+            Gcf.figs = _SessionFigs(Gcf.figs)
+        plt.show = _dispatch_show
+        pio.show = _dispatch_plotly_show
+
+
+class FigureSession:
+    """
+    一个会话的matplotlib图形记录和显示回调
+    """
+
+    def __init__(self, on_show: Optional[Callable[[], None]] = None,
+                 on_plotly_show: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            on_show: 会话代码调用 plt.show() 时的回调
+            on_plotly_show: 会话代码显示plotly图形时的回调，参数为图形对象
+        """
+        install()
+        self.figs: "OrderedDict" = OrderedDict()
+        self.on_show = on_show
+        self.on_plotly_show = on_plotly_show
+
+    @contextmanager
+    def activate(self):
+        """在当前线程中激活该会话，期间pyplot只操作该会话的图形"""
+        token = _active_session.set(self)
+        try:
+            yield self
+        finally:
+            _active_session.reset(token)
+
+    def figures(self) -> List[Any]:
+        """按创建顺序（图形编号）返回所有打开的图形"""
+        managers = list(self.figs.values())
+        try:
+            managers.sort(key=lambda manager: manager.num)
+        except TypeError:
+            # 图形编号混用了数字和字符串，保持原有顺序
+            pass
+        return [manager.canvas.figure for manager in managers]
+
+    def render(self, fmt: str = "png", close: bool = True) -> List[bytes]:
+        """
+        将所有打开的图形渲染为图片
+
+        每个图形使用自己的画布渲染，不同会话可以同时渲染。
+        相同的图形总是渲染出相同的内容，便于按内容去重。
+
+        Args:
+            fmt: 图片格式（png、webp、svg）
+            close: 渲染后是否关闭这些图形
+
+        Returns:
+            List[bytes]: 按创建顺序排列的图片内容
+        """
+        images = []
+        for fig in self.figures():
+            buf = BytesIO()
+            # 去掉SVG中的创建时间，否则每次渲染的内容都不同
+            metadata = {'Date': None} if fmt == 'svg' else None
+            fig.savefig(buf, format=fmt, bbox_inches='tight', metadata=metadata)
+            images.append(buf.getvalue())
+        if close:
+            self.close_all()
+        return images
+
+    def close_all(self) -> None:
+        """关闭该会话的所有图形"""
+        with self.activate():
+            plt.close('all')
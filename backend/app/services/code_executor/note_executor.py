@@ -1,6 +1,35 @@
-from typing import Dict, Any, Optional
-from .session_environment import SessionEnvironment
-from app.services.code_executor.dataframe_manager import DataFrameManager
+import asyncio
+import functools
+import logging
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Deque, List, Set, Tuple
+from .session_environment import SessionEnvironment, output_dir, OUTPUT_DIR_NAME
+from .output_capture import read_spilled_output
+from .session_worker import RemoteSessionEnvironment, RemoteDataFrameManager, SessionWorkerBusy
+from .session_snapshot import has_snapshot, delete_snapshot
+from .code_cache import get_code_cache
+from .data_cache import get_data_cache
+from .dependency_graph import DependencyGraph
+from .cell_profiler import SessionProfile
+from .session_pool import SessionPool
+from .artifact_store import get_artifact_store, artifact_ids
+from app.services.code_executor.dataframe_manager import DataFrameManager, dump_frames
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 保留的会话回收记录条数
+EVICTION_LOG_SIZE = 200
+
+# 会话快照的保存目录
+SNAPSHOT_DIR_NAME = "sessions"
 
 class NoteExecutor:
     """
@@ -9,40 +38,475 @@ class NoteExecutor:
     def __init__(self):
         self._sessions: Dict[str, SessionEnvironment] = {}
         self._dataframes: Dict[str, DataFrameManager] = {}
+        # 执行代码的线程池，避免阻塞asyncio事件循环
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.EXECUTION_WORKERS,
+            thread_name_prefix="note-executor"
+        )
+        # 每个会话一把锁，保证同一笔记本中的单元格按顺序执行
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        # 会话最近使用时间，按最近最少使用的顺序排列
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        # 正在执行代码的会话及其执行中的调用数，执行中的会话不会被回收
+        self._active: Dict[str, int] = {}
+        # 每个会话最近一次执行后统计的DataFrame内存占用（字节）
+        self._memory: Dict[str, int] = {}
+        # 每个会话中因变量被删除而释放的DataFrame个数和内存（MB）累计
+        self._reclaimed: Dict[str, Dict[str, float]] = {}
+        # 每个会话的单元格依赖图，记录单元格的执行情况
+        self._graphs: Dict[str, DependencyGraph] = {}
+        # 每个会话中各单元格的执行统计
+        self._profiles: Dict[str, SessionProfile] = {}
+        # 每个会话执行结果中引用的产物，笔记本可能尚未保存，会话删除前回收产物时保留
+        self._artifacts: Dict[str, Set[str]] = {}
+        # 会话回收记录
+        self._evictions: Deque[Dict[str, Any]] = deque(maxlen=EVICTION_LOG_SIZE)
+        # 保护以上会话状态的锁
+        self._state_lock = threading.Lock()
+        # 每个会话一把创建锁，同一会话同时被首次使用时只创建一次
+        self._creation_locks: Dict[str, threading.Lock] = {}
+        # 预热的空闲会话池，服务启动时才开始创建会话
+        self._session_pool = SessionPool(settings.SESSION_POOL_SIZE)
         
     def get_or_create_session(self, session_id: str) -> SessionEnvironment:
         """
         获取或创建一个会话环境
         
+        同一会话同时被多个请求首次使用时只创建一次。
+        
         Args:
             session_id: 会话ID，通常对应笔记本ID
             
         Returns:
             SessionEnvironment实例
         """
-        if session_id not in self._sessions:
+        session = self._sessions.get(session_id)
+        if session is None or (isinstance(session, RemoteSessionEnvironment) and not session.is_alive()):
+            with self._creation_lock(session_id):
+                session = self._sessions.get(session_id)
+                if isinstance(session, RemoteSessionEnvironment) and not session.is_alive():
+                    # 工作进程已被终止（超时或超出内存），丢弃后重新创建
+                    self._discard_session(session_id)
+                    session = None
+                if session is None:
+                    session = self._create_session(session_id)
+        self._touch(session_id)
+        return session
+    
+    def _creation_lock(self, session_id: str) -> threading.Lock:
+        """获取会话的创建锁"""
+        with self._state_lock:
+            return self._creation_locks.setdefault(session_id, threading.Lock())
+    
+    def _create_session(self, session_id: str) -> SessionEnvironment:
+        """
+        创建会话环境并从快照恢复变量，调用方需持有该会话的创建锁
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            SessionEnvironment实例
+        """
+        session = self._session_pool.acquire(session_id)
+        if session is not None:
+            # 使用预热的会话环境
+            df_manager = session.df_manager
+        elif settings.SESSION_MODE == "process":
+            # 在独立的工作进程中创建会话环境，DataFrameManager也位于该进程中
+            session = RemoteSessionEnvironment(session_id)
+            df_manager = session.df_manager
+        else:
             # 创建新的DataFrameManager实例
             df_manager = DataFrameManager()
-            self._dataframes[session_id] = df_manager
             # 创建新的SessionEnvironment实例，并传入DataFrameManager
-            self._sessions[session_id] = SessionEnvironment(session_id, df_manager)
-        return self._sessions[session_id]
+            session = SessionEnvironment(session_id, df_manager)
+        self._restore_session(session_id, session)
+        with self._state_lock:
+            self._dataframes[session_id] = df_manager
+            self._sessions[session_id] = session
+        return session
+    
+    def _snapshot_dir(self, session_id: str) -> Path:
+        """获取会话快照目录"""
+        safe_id = re.sub(r"[^\w.-]", "_", session_id)
+        return settings.TEMP_DIR / SNAPSHOT_DIR_NAME / safe_id
+    
+    def _restored_dir(self, session_id: str) -> Path:
+        """获取已恢复的快照所在的目录，其中的DataFrame在被访问时才加载"""
+        directory = self._snapshot_dir(session_id)
+        return directory.with_name(directory.name + ".restored")
+    
+    def _delete_snapshots(self, session_id: str):
+        """删除会话的快照和已恢复的快照"""
+        delete_snapshot(self._snapshot_dir(session_id))
+        delete_snapshot(self._restored_dir(session_id))
+    
+    def _restore_session(self, session_id: str, session: SessionEnvironment):
+        """
+        如果会话曾被回收并保存了快照，则从快照恢复变量
+        
+        快照在恢复前被移动到已恢复目录，只能恢复一次：工作进程被终止后重新创建的会话不会再恢复旧的变量。
+        已恢复目录在会话结束（被回收、重置、删除或工作进程被终止）时删除。
+        
+        Args:
+            session_id: 会话ID
+            session: 新创建的会话环境
+        """
+        directory = self._snapshot_dir(session_id)
+        if not has_snapshot(directory):
+            return
+        restored = self._restored_dir(session_id)
+        delete_snapshot(restored)
+        directory.rename(restored)
+        try:
+            session.restore(restored)
+        except Exception as e:
+            logger.warning(f"会话 {session_id} 从快照恢复失败: {str(e)}")
+            delete_snapshot(restored)
+    
+    def _touch(self, session_id: str):
+        """记录会话的最近使用时间"""
+        with self._state_lock:
+            self._last_used[session_id] = time.time()
+            self._last_used.move_to_end(session_id)
+    
+    def _discard_session(self, session_id: str):
+        """
+        丢弃会话记录和快照，不再调用会话的任何方法（用于工作进程已退出的会话）
+        
+        Args:
+            session_id: 会话ID
+        """
+        with self._state_lock:
+            self._sessions.pop(session_id, None)
+            self._dataframes.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+            self._memory.pop(session_id, None)
+            self._reclaimed.pop(session_id, None)
+            self._graphs.pop(session_id, None)
+            self._profiles.pop(session_id, None)
+            self._artifacts.pop(session_id, None)
+        self._delete_snapshots(session_id)
+    
+    def get_graph(self, session_id: str, create: bool = False) -> DependencyGraph:
+        """
+        获取会话的单元格依赖图
+        
+        Args:
+            session_id: 会话ID
+            create: 会话还没有依赖图时是否创建并保存，只在记录单元格执行时为True，
+                只读的查询不会为未知的会话留下记录
+            
+        Returns:
+            DependencyGraph实例，会话没有依赖图且不创建时返回一个空的依赖图
+        """
+        with self._state_lock:
+            if create:
+                return self._graphs.setdefault(session_id, DependencyGraph())
+            graph = self._graphs.get(session_id)
+        return graph if graph is not None else DependencyGraph()
+    
+    def get_session_profile(self, session_id: str, create: bool = False) -> SessionProfile:
+        """
+        获取会话的单元格执行统计
+        
+        Args:
+            session_id: 会话ID
+            create: 会话还没有执行统计时是否创建并保存，只在记录单元格执行时为True
+            
+        Returns:
+            SessionProfile实例，会话没有执行统计且不创建时返回一个空的统计
+        """
+        with self._state_lock:
+            if create:
+                return self._profiles.setdefault(session_id, SessionProfile())
+            profile = self._profiles.get(session_id)
+        return profile if profile is not None else SessionProfile()
     
-    def execute(self, session_id: str, code: str) -> Dict[str, Any]:
+    def execute(self, session_id: str, code: str,
+                on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                timeout: Optional[float] = None, cell_id: Optional[str] = None,
+                profile: bool = False) -> Dict[str, Any]:
         """
         在指定会话中执行代码
         
         Args:
             session_id: 会话ID
             code: 要执行的Python代码
+            on_output: 可选的输出回调，用于实时接收输出事件
+            timeout: 执行超时时间（秒），为空时使用配置中的 EXECUTION_TIMEOUT，0 表示不限制
+            cell_id: 可选的单元格ID，用于记录单元格的执行情况以判断哪些单元格需要重新执行
+            profile: 是否开启详细性能分析（内存分配峰值和耗时最多的函数）
             
         Returns:
             执行结果字典
         """
-        print(session_id)
-        print(code)
-        session = self.get_or_create_session(session_id)
-        return session.execute(code)
+        logger.debug(f"会话 {session_id} 执行单元格 {cell_id or ''}")
+        if timeout is None:
+            timeout = settings.EXECUTION_TIMEOUT
+        with self._state_lock:
+            self._active[session_id] = self._active.get(session_id, 0) + 1
+        try:
+            session = self.get_or_create_session(session_id)
+            result = session.execute(code, on_output=on_output, timeout=timeout, profile=profile)
+            produced = artifact_ids(result.get("plot"))
+            if produced:
+                with self._state_lock:
+                    self._artifacts.setdefault(session_id, set()).update(produced)
+            if cell_id:
+                self.get_session_profile(session_id, create=True).record(cell_id, result.get("profile"))
+            if result.get("limit_exceeded", {}).get("session_reset"):
+                self._discard_session(session_id)
+            else:
+                if cell_id:
+                    self.get_graph(session_id, create=True).record_run(cell_id, code, result["status"] == "success")
+                memory = self._dataframes[session_id].get_memory_usage()
+                reclaimed = result.get("reclaimed") or {}
+                with self._state_lock:
+                    self._memory[session_id] = memory
+                    if reclaimed.get("dataframes"):
+                        total = self._reclaimed.setdefault(session_id, {"dataframes": 0, "memory_mb": 0.0})
+                        total["dataframes"] += len(reclaimed["dataframes"])
+                        total["memory_mb"] = round(total["memory_mb"] + reclaimed["memory_mb"], 2)
+                self._touch(session_id)
+        finally:
+            with self._state_lock:
+                self._active[session_id] -= 1
+                if not self._active[session_id]:
+                    del self._active[session_id]
+        # 新的DataFrame可能使总内存超出预算，回收其他最久未使用的会话
+        self.enforce_memory_budget(exclude=session_id)
+        return result
+    
+    def check_syntax(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        检查代码的语法，不执行代码
+        
+        Args:
+            code: 要检查的Python代码
+            
+        Returns:
+            语法错误的信息（message、line、offset），语法正确时返回None
+        """
+        return get_code_cache().check_syntax(code)
+    
+    def aggregate_raster(self, session_id: str, raster_id: str, x_range: Optional[List[float]] = None,
+                         y_range: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        按新的坐标范围重新聚合图形中被聚合为热力图的散点
+        
+        Args:
+            session_id: 会话ID
+            raster_id: 散点数据ID
+            x_range: 横坐标范围，为空时使用数据的范围
+            y_range: 纵坐标范围，为空时使用数据的范围
+            
+        Returns:
+            聚合结果，会话或散点数据不存在时返回None
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return session.aggregate_raster(raster_id, x_range, y_range)
+    
+    def read_output(self, session_id: str, output_id: str, offset: int = 0,
+                    limit: int = 65536) -> Optional[Dict[str, Any]]:
+        """
+        分页读取执行结果中被省略的完整输出
+        
+        Args:
+            session_id: 会话ID
+            output_id: 输出ID，位于执行结果的 output_truncated 中
+            offset: 起始位置（字节）
+            limit: 最多读取的字节数
+            
+        Returns:
+            本页的文本和下一页的起始位置，输出不存在（已被删除或会话已重置）时返回None
+        """
+        return read_spilled_output(output_dir(session_id), output_id, offset, limit)
+    
+    def interrupt(self, session_id: str) -> bool:
+        """
+        中断指定会话中正在执行的代码，不影响其他会话
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            bool: 是否有正在执行的代码被中断
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        return session.interrupt()
+    
+    async def run_in_session(self, session_id: str, func: Callable, *args) -> Any:
+        """
+        在线程池中运行与会话相关的同步操作，同一会话的操作按顺序执行
+        
+        Args:
+            session_id: 会话ID
+            func: 要运行的同步函数
+            *args: 函数参数
+            
+        Returns:
+            函数的返回值
+        """
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, func, *args)
+    
+    async def read_in_session(self, session_id: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        在线程池中运行读取会话DataFrame的同步操作。inprocess 模式下DataFrame与执行的代码在同一进程中，
+        需要持有会话锁，避免读取正在被单元格修改的DataFrame；process 模式下由工作进程串行处理，
+        不等待会话锁，工作进程忙时很快返回错误
+        
+        Args:
+            session_id: 会话ID
+            func: 要运行的同步函数
+            *args: 函数参数
+            **kwargs: 函数关键字参数
+            
+        Returns:
+            函数的返回值
+        """
+        call = functools.partial(func, *args, **kwargs)
+        if isinstance(self._sessions.get(session_id), RemoteSessionEnvironment):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, call)
+        return await self.run_in_session(session_id, call)
+    
+    async def execute_async(self, session_id: str, code: str,
+                            on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                            timeout: Optional[float] = None, cell_id: Optional[str] = None,
+                            profile: bool = False) -> Dict[str, Any]:
+        """
+        在线程池中执行代码，不阻塞事件循环
+        
+        Args:
+            session_id: 会话ID
+            code: 要执行的Python代码
+            on_output: 可选的输出回调，在执行线程中被调用
+            timeout: 执行超时时间（秒）
+            cell_id: 可选的单元格ID
+            profile: 是否开启详细性能分析
+            
+        Returns:
+            执行结果字典
+        """
+        execute = functools.partial(self.execute, session_id, code, on_output=on_output,
+                                    timeout=timeout, cell_id=cell_id, profile=profile)
+        return await self.run_in_session(session_id, execute)
+    
+    def plan_stale(self, session_id: str, cells: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        分析笔记本中各单元格的依赖关系和过期状态
+        
+        Args:
+            session_id: 会话ID
+            cells: 按笔记本顺序排列的单元格，每项包含 cell_id 和 code
+            
+        Returns:
+            List[Dict]: 每个单元格的 cell_id、depends_on 和过期原因 reason（未过期时为None）
+        """
+        return self.get_graph(session_id).plan(cells)
+    
+    def execute_cells(self, session_id: str, cells: List[Dict[str, str]], stop_on_error: bool = True,
+                      on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """
+        在指定会话中按顺序执行多个单元格
+        
+        设置了输出回调时，除了各单元格的输出事件（附带 cell_id）外，每个单元格开始时推送
+        {"type": "cell_start", "cell_id": ...}，结束时推送 {"type": "cell_result", "cell_id": ..., "data": 执行结果}。
+        
+        Args:
+            session_id: 会话ID
+            cells: 按顺序排列的单元格，每项包含 cell_id 和 code
+            stop_on_error: 某个单元格执行失败后是否停止执行之后的单元格
+            on_output: 可选的输出回调
+            timeout: 每个单元格的执行超时时间（秒）
+            profile: 是否开启详细性能分析
+            
+        Returns:
+            Dict: executed 为已执行单元格的 cell_id 和执行结果，skipped 为因前面的单元格失败而未执行的单元格
+        """
+        executed = []
+        skipped = []
+        failed = False
+        for cell in cells:
+            cell_id = cell.get("cell_id")
+            if failed:
+                skipped.append(cell_id)
+                continue
+            cell_output = None
+            if on_output is not None:
+                on_output({"type": "cell_start", "cell_id": cell_id})
+                cell_output = lambda event, cell_id=cell_id: on_output({**event, "cell_id": cell_id})
+            result = self.execute(session_id, cell.get("code", ""), on_output=cell_output,
+                                  timeout=timeout, cell_id=cell_id, profile=profile)
+            executed.append({"cell_id": cell_id, "result": result})
+            if on_output is not None:
+                on_output({"type": "cell_result", "cell_id": cell_id, "data": result})
+            failed = stop_on_error and result["status"] != "success"
+        return {"executed": executed, "skipped": skipped}
+    
+    async def execute_cells_async(self, session_id: str, cells: List[Dict[str, str]], stop_on_error: bool = True,
+                                  on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                  timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """
+        在线程池中按顺序执行多个单元格，执行期间同一会话的其他请求需要等待
+        
+        Args:
+            session_id: 会话ID
+            cells: 按顺序排列的单元格，每项包含 cell_id 和 code
+            stop_on_error: 某个单元格执行失败后是否停止执行之后的单元格
+            on_output: 可选的输出回调，在执行线程中被调用
+            timeout: 每个单元格的执行超时时间（秒）
+            profile: 是否开启详细性能分析
+            
+        Returns:
+            Dict: 与 execute_cells 的返回值相同
+        """
+        execute = functools.partial(self.execute_cells, session_id, cells, stop_on_error,
+                                    on_output=on_output, timeout=timeout, profile=profile)
+        return await self.run_in_session(session_id, execute)
+    
+    async def run_stale(self, session_id: str, cells: List[Dict[str, str]],
+                        on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """
+        只重新执行过期的单元格：代码被修改、从未执行或上游依赖发生变化的单元格
+        
+        单元格按笔记本顺序执行，某个单元格执行失败后不再执行之后的单元格。
+        
+        Args:
+            session_id: 会话ID
+            cells: 按笔记本顺序排列的全部代码单元格，每项包含 cell_id 和 code
+            on_output: 可选的输出回调，事件格式与 execute_cells 相同
+            timeout: 每个单元格的执行超时时间（秒）
+            profile: 是否开启详细性能分析
+            
+        Returns:
+            Dict: plan 为依赖分析结果，executed 为已执行单元格的 cell_id 和执行结果，
+                skipped 为因前面的单元格失败而未执行的过期单元格
+        """
+        # 依赖分析和执行在同一次会话操作中完成，其间不会有其他单元格执行使分析结果过期
+        run = functools.partial(self._run_stale, session_id, cells, on_output, timeout, profile)
+        return await self.run_in_session(session_id, run)
+    
+    def _run_stale(self, session_id: str, cells: List[Dict[str, str]],
+                   on_output: Optional[Callable[[Dict[str, Any]], None]],
+                   timeout: Optional[float], profile: bool) -> Dict[str, Any]:
+        """分析并执行过期的单元格，调用方需按会话顺序调用（见 run_stale）"""
+        plan = self.plan_stale(session_id, cells)
+        stale = {item["cell_id"] for item in plan if item["reason"] is not None}
+        result = self.execute_cells(session_id, [cell for cell in cells if cell["cell_id"] in stale],
+                                    on_output=on_output, timeout=timeout, profile=profile)
+        return {"plan": plan, **result}
     
     def reset_session(self, session_id: str):
         """
@@ -54,6 +518,12 @@ class NoteExecutor:
         if session_id in self._sessions:
             self._sessions[session_id].reset()
             self._dataframes[session_id].clear()
+            with self._state_lock:
+                self._memory[session_id] = 0
+        self.get_graph(session_id).forget()
+        with self._state_lock:
+            self._profiles.pop(session_id, None)
+        self._delete_snapshots(session_id)
             
     def delete_session(self, session_id: str):
         """
@@ -62,11 +532,237 @@ class NoteExecutor:
         Args:
             session_id: 会话ID
         """
-        if session_id in self._sessions:
-            self._sessions[session_id].reset()
-            self._dataframes[session_id].clear()
-            del self._sessions[session_id]
-            del self._dataframes[session_id]
+        with self._state_lock:
+            removed = self._pop_session(session_id)
+            self._session_locks.pop(session_id, None)
+            self._creation_locks.pop(session_id, None)
+            self._graphs.pop(session_id, None)
+            self._profiles.pop(session_id, None)
+            self._artifacts.pop(session_id, None)
+        if removed is not None:
+            self._close_session(*removed)
+        self._delete_snapshots(session_id)
+        shutil.rmtree(output_dir(session_id), ignore_errors=True)
+    
+    def _pop_session(self, session_id: str) -> Optional[Tuple[Any, Any]]:
+        """
+        从执行器中移除会话记录，调用方需持有 _state_lock
+        
+        Returns:
+            被移除的 (会话, DataFrame管理器)，会话不存在时返回None
+        """
+        if session_id not in self._sessions:
+            return None
+        session = self._sessions.pop(session_id)
+        df_manager = self._dataframes.pop(session_id)
+        self._last_used.pop(session_id, None)
+        self._memory.pop(session_id, None)
+        self._reclaimed.pop(session_id, None)
+        return session, df_manager
+    
+    def _close_session(self, session, df_manager):
+        """释放已移除会话占用的资源"""
+        if isinstance(session, RemoteSessionEnvironment):
+            # 直接关闭工作进程即可释放其全部内存
+            session.close()
+        else:
+            session.reset()
+            df_manager.clear()
+    
+    def _evict_session(self, session_id: str, reason: str) -> bool:
+        """
+        回收一个空闲会话并记录回收原因
+        
+        Args:
+            session_id: 会话ID
+            reason: 回收原因，"idle" 或 "memory"
+            
+        Returns:
+            bool: 是否回收成功，正在执行代码的会话不会被回收
+        """
+        # 持有创建锁，回收和保存快照期间同一会话不会被重新创建
+        with self._creation_lock(session_id):
+            with self._state_lock:
+                if self._active.get(session_id):
+                    return False
+                now = time.time()
+                idle_seconds = now - self._last_used.get(session_id, now)
+                memory = self._memory.get(session_id, 0)
+                removed = self._pop_session(session_id)
+                if removed is None:
+                    return False
+                record = {
+                    "session_id": session_id,
+                    "reason": reason,
+                    "memory_mb": round(memory / 1024 ** 2, 2),
+                    "idle_seconds": round(idle_seconds, 1),
+                    "evicted_at": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+                    "spilled": False
+                }
+                self._evictions.append(record)
+            if settings.SESSION_SPILL_ENABLED:
+                record["spilled"] = self._spill_session(session_id, removed[0])
+            if not record["spilled"]:
+                # 会话变量已全部丢失，所有单元格都需要重新执行
+                self.get_graph(session_id).forget()
+            self._close_session(*removed)
+            # 新快照已包含尚未加载的DataFrame的副本
+            delete_snapshot(self._restored_dir(session_id))
+        logger.info(f"会话 {session_id} 已被回收 (原因: {reason}, 内存: {memory / 1024 ** 2:.2f} MB, 空闲: {idle_seconds:.0f} 秒)")
+        return True
+    
+    def _spill_session(self, session_id: str, session) -> bool:
+        """
+        将被回收会话的变量保存到快照目录，保存失败时会话变量随回收丢失
+        
+        Args:
+            session_id: 会话ID
+            session: 已从执行器中移除的会话
+            
+        Returns:
+            bool: 是否保存成功
+        """
+        try:
+            spilled = session.spill(self._snapshot_dir(session_id))
+        except Exception as e:
+            logger.warning(f"会话 {session_id} 保存快照失败: {str(e)}")
+            return False
+        if spilled["skipped"]:
+            logger.info(f"会话 {session_id} 中以下变量无法保存: {', '.join(spilled['skipped'])}")
+            # 定义了这些变量的单元格恢复后需要重新执行
+            self.get_graph(session_id).forget(spilled["skipped"])
+        return True
+    
+    def enforce_memory_budget(self, exclude: Optional[str] = None) -> List[str]:
+        """
+        总内存超出预算时，按最近最少使用的顺序回收会话
+        
+        Args:
+            exclude: 不参与回收的会话ID（通常是刚执行完代码的会话）
+            
+        Returns:
+            List[str]: 被回收的会话ID
+        """
+        budget = settings.SESSION_MEMORY_BUDGET_MB * 1024 ** 2
+        if not budget:
+            return []
+        with self._state_lock:
+            total = sum(self._memory.values())
+            candidates = [sid for sid in self._last_used if sid != exclude]
+        evicted = []
+        for session_id in candidates:
+            if total <= budget:
+                break
+            memory = self._memory.get(session_id, 0)
+            if self._evict_session(session_id, "memory"):
+                total -= memory
+                evicted.append(session_id)
+        return evicted
+    
+    def reap_sessions(self) -> List[str]:
+        """
+        回收空闲超时的会话，并检查内存预算
+        
+        Returns:
+            List[str]: 被回收的会话ID
+        """
+        evicted = []
+        idle_timeout = settings.SESSION_IDLE_TIMEOUT
+        if idle_timeout:
+            now = time.time()
+            with self._state_lock:
+                idle = [sid for sid, last in self._last_used.items() if now - last > idle_timeout]
+            evicted = [sid for sid in idle if self._evict_session(sid, "idle")]
+        return evicted + self.enforce_memory_budget()
+    
+    def sweep_artifacts(self) -> int:
+        """
+        按 ARTIFACTS_MAX_MB 和 ARTIFACTS_MAX_AGE_DAYS 删除最久未使用的输出产物，
+        已保存的笔记本、笔记本数据和导出文件中引用的产物，以及尚未删除的会话生成的产物
+        （笔记本可能还没有保存）不会被删除
+        
+        Returns:
+            int: 删除的产物个数
+        """
+        store = get_artifact_store()
+        keep = store.referenced([settings.NOTEBOOKS_DIR, settings.NOTEDATAS_DIR, settings.EXPORT_DIR])
+        with self._state_lock:
+            for produced in self._artifacts.values():
+                keep |= produced
+        removed = store.sweep(settings.ARTIFACTS_MAX_MB * 1024 * 1024,
+                              settings.ARTIFACTS_MAX_AGE_DAYS * 86400, keep)
+        if removed:
+            logger.info(f"已删除 {removed} 个最久未使用的输出产物")
+        return removed
+    
+    async def run_reaper(self):
+        """后台定期回收空闲会话和输出产物，在应用启动时作为任务运行"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(settings.SESSION_REAPER_INTERVAL)
+            try:
+                await loop.run_in_executor(self._pool, self.reap_sessions)
+            except Exception as e:
+                logger.error(f"回收会话失败: {str(e)}", exc_info=True)
+            try:
+                await loop.run_in_executor(self._pool, self.sweep_artifacts)
+            except Exception as e:
+                logger.error(f"回收输出产物失败: {str(e)}", exc_info=True)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取会话和内存的运行指标
+        
+        Returns:
+            Dict: 各会话的内存占用、删除变量后释放的内存、空闲时间和执行状态，以及回收记录
+        """
+        now = time.time()
+        with self._state_lock:
+            sessions = [
+                {
+                    "session_id": sid,
+                    "memory_mb": round(self._memory.get(sid, 0) / 1024 ** 2, 2),
+                    # 变量被删除后释放的DataFrame个数和内存
+                    "reclaimed": dict(self._reclaimed.get(sid, {"dataframes": 0, "memory_mb": 0.0})),
+                    "idle_seconds": round(now - last, 1),
+                    "busy": bool(self._active.get(sid))
+                }
+                for sid, last in reversed(self._last_used.items())
+            ]
+            total = sum(self._memory.values())
+            evictions = list(reversed(self._evictions))
+        return {
+            "session_mode": settings.SESSION_MODE,
+            "session_count": len(sessions),
+            "total_memory_mb": round(total / 1024 ** 2, 2),
+            "memory_budget_mb": settings.SESSION_MEMORY_BUDGET_MB,
+            "idle_timeout": settings.SESSION_IDLE_TIMEOUT,
+            "sessions": sessions,
+            "evictions": evictions,
+            # process 模式下每个工作进程各有一个缓存，这里只统计服务进程中的缓存
+            "code_cache": get_code_cache().get_stats(),
+            "data_cache": get_data_cache().get_stats(),
+            "session_pool": self._session_pool.get_stats()
+        }
+    
+    def start_session_pool(self):
+        """
+        开始在后台预先创建并预热空闲会话，在服务启动时调用
+        """
+        self._session_pool.start()
+    
+    def shutdown(self):
+        """
+        删除所有会话并关闭其工作进程
+        """
+        self._session_pool.close()
+        for session_id in list(self._sessions):
+            self.delete_session(session_id)
+        self._session_locks.clear()
+        # 已回收会话的快照在服务重启后不再使用
+        shutil.rmtree(settings.TEMP_DIR / SNAPSHOT_DIR_NAME, ignore_errors=True)
+        shutil.rmtree(settings.TEMP_DIR / OUTPUT_DIR_NAME, ignore_errors=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
             
     def set_dataframes(self, session_id: str, variables: Dict[str, Any]):
         """
@@ -79,6 +775,35 @@ class NoteExecutor:
         session = self.get_or_create_session(session_id)
         session.set_dataframes(variables)
     
+    def _get_df_manager(self, session_id: str) -> Optional[DataFrameManager]:
+        """
+        获取会话的DataFrame管理器，会话已被回收但保存了快照时先恢复会话
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            DataFrame管理器，会话不存在时返回None
+        """
+        if session_id not in self._dataframes and has_snapshot(self._snapshot_dir(session_id)):
+            self.get_or_create_session(session_id)
+        return self._dataframes.get(session_id)
+    
+    def _get_df_reader(self, session_id: str) -> Optional[DataFrameManager]:
+        """
+        获取供查询接口读取DataFrame的管理器，工作进程正在执行单元格时调用很快返回会话忙的错误
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            DataFrame管理器，会话不存在时返回None
+        """
+        df_manager = self._get_df_manager(session_id)
+        if isinstance(df_manager, RemoteDataFrameManager):
+            return df_manager.reads
+        return df_manager
+    
     def get_dataframes(self, session_id: str) -> Dict[str, Any]:
         """
         获取指定会话的所有DataFrame
@@ -89,8 +814,9 @@ class NoteExecutor:
         Returns:
             DataFrame字典
         """
-        if session_id in self._dataframes:
-            return self._dataframes[session_id].get_dataframes()
+        df_manager = self._get_df_manager(session_id)
+        if df_manager is not None:
+            return df_manager.get_dataframes()
         return {}
     
     def get_dataframes_names(self, session_id: str) -> Dict[str, Any]:
@@ -103,8 +829,9 @@ class NoteExecutor:
         Returns:
             DataFrame名字列表
         """
-        if session_id in self._dataframes:
-            return self._dataframes[session_id].get_dataframes_names()
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.get_dataframes_names()
         return {}
     
     def get_dataframe(self, session_id: str, name: str) -> Any:
@@ -118,10 +845,111 @@ class NoteExecutor:
         Returns:
             DataFrame对象或None
         """
-        if session_id in self._dataframes:
-            return self._dataframes[session_id].get_dataframe(name)
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.get_dataframe(name)
         return None
     
+    def get_dataframe_preview(self, session_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        获取指定会话中DataFrame的预览信息，在DataFrame所在的进程中生成
+        
+        Args:
+            session_id: 会话ID
+            name: DataFrame变量名
+            
+        Returns:
+            预览信息，DataFrame不存在时返回None
+        """
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.get_preview(name)
+        return None
+    
+    def get_dataframe_rows(self, session_id: str, name: str, offset: int = 0, limit: int = 100,
+                           columns: Optional[List[str]] = None, arrow: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        按位置分页读取指定会话中DataFrame的行
+        
+        Args:
+            session_id: 会话ID
+            name: DataFrame变量名
+            offset: 起始行号
+            limit: 读取的行数
+            columns: 需要的列名，为空时返回全部列
+            arrow: 是否以Arrow IPC流返回数据
+            
+        Returns:
+            本页的数据，DataFrame不存在时返回None
+        """
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.get_rows(name, offset, limit, columns, arrow)
+        return None
+    
+    def query_dataframe(self, session_id: str, name: str, query: Dict[str, Any], offset: int = 0,
+                        limit: int = 100, columns: Optional[List[str]] = None,
+                        arrow: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        对指定会话中的DataFrame执行声明式查询并分页读取结果
+        
+        Args:
+            session_id: 会话ID
+            name: DataFrame变量名
+            query: 查询（filters、group_by、aggregations、sort）
+            offset: 结果中的起始行号
+            limit: 读取的行数
+            columns: 需要的列名，为空时返回全部列
+            arrow: 是否以Arrow IPC流返回数据
+            
+        Returns:
+            本页的查询结果，DataFrame不存在时返回None
+        """
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.query_rows(name, query, offset, limit, columns, arrow)
+        return None
+    
+    def get_dataframe_info(self, session_id: str, name: str, tiers: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        获取指定会话中DataFrame的统计信息，各信息层按需计算并缓存
+        
+        Args:
+            session_id: 会话ID
+            name: DataFrame变量名
+            tiers: 需要的信息层，为空时返回全部
+            
+        Returns:
+            DataFrame的统计信息，不存在时返回None
+        """
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.get_dataframe_info(name, tiers)
+        return None
+    
+    def save_dataframes(self, session_id: str, path: Path) -> Optional[List[str]]:
+        """
+        将指定会话中的所有DataFrame保存到pickle文件，在DataFrame所在的进程中写入
+        
+        process 模式下工作进程正在执行单元格时不等待，本次不保存，保留之前保存的文件。
+        
+        Args:
+            session_id: 会话ID
+            path: 文件路径
+            
+        Returns:
+            Optional[List[str]]: 已保存的DataFrame变量名，会话不存在时保存空的变量字典；
+                工作进程正忙而没有保存时返回None
+        """
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is None:
+            return dump_frames({}, path)
+        try:
+            return df_manager.dump_dataframes(path)
+        except SessionWorkerBusy:
+            logger.info(f"会话 {session_id} 正在执行代码，本次未保存DataFrame")
+            return None
+    
     def save_dataframe_to_file(self, session_id: str, name: str, file_path: str, file_type: str, **kwargs) -> Dict[str, Any]:
         """
         保存DataFrame到指定文件
@@ -133,8 +961,9 @@ class NoteExecutor:
             file_type: 文件类型
             **kwargs: 保存选项
         """
-        if session_id in self._dataframes:
-            return self._dataframes[session_id].save_dataframe(name, file_path, file_type, **kwargs)
+        df_manager = self._get_df_reader(session_id)
+        if df_manager is not None:
+            return df_manager.save_dataframe(name, file_path, file_type, **kwargs)
         return {}
 
 # 创建单例实例
@@ -0,0 +1,401 @@
+"""
+代码输出捕获模块
+
+多个会话会在不同线程中同时执行代码，而 contextlib.redirect_stdout 会替换全局的
+sys.stdout，导致不同会话的输出互相串扰。这里将 sys.stdout/sys.stderr 替换为按线程
+分发的流对象，每个执行线程只捕获自己的输出。
+
+同时提供流式输出收集器，在代码运行过程中将输出分批推送给客户端。
+
+输出缓冲区只在内存中保留开头和结尾的一部分内容，超出部分写入临时文件，
+打印大量内容的单元格不会占满内存，也不会使执行结果和保存的笔记本过大。
+"""
+import io
+import re
+import sys
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, TextIO, Tuple
+
+_install_lock = threading.Lock()
+
+# 输出ID只包含十六进制字符，防止读取输出时访问其他目录
+_OUTPUT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class _ThreadLocalStream:
+    """按线程分发写入的输出流，未设置捕获目标的线程写入原始流"""
+
+    def __init__(self, original: TextIO):
+        self._original = original
+        self._local = threading.local()
+
+    def _target(self) -> TextIO:
+        stream = getattr(self._local, "stream", None)
+        return self._original if stream is None else stream
+
+    def set_target(self, stream):
+        """设置当前线程的捕获目标，返回之前的目标"""
+        previous = getattr(self._local, "stream", None)
+        self._local.stream = stream
+        return previous
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+
+
+def _install(name: str) -> _ThreadLocalStream:
+    """将sys中的指定流替换为按线程分发的流（只替换一次）"""
+    with _install_lock:
+        stream = getattr(sys, name)
+        if not isinstance(stream, _ThreadLocalStream):
+            stream = _ThreadLocalStream(stream)
+            setattr(sys, name, stream)
+        return stream
+
+
+@contextmanager
+def capture_output(stdout, stderr):
+    """
+    将当前线程的标准输出和标准错误重定向到指定的流
+
+    Args:
+        stdout: 接收标准输出的流
+        stderr: 接收标准错误的流
+    """
+    out = _install("stdout")
+    err = _install("stderr")
+    previous_out = out.set_target(stdout)
+    previous_err = err.set_target(stderr)
+    try:
+        yield
+    finally:
+        out.set_target(previous_out)
+        err.set_target(previous_err)
+
+
+class BoundedOutput(io.TextIOBase):
+    """
+    有界的输出缓冲区
+
+    内存中保留最先写入的 head_chars 个字符和最后写入的 tail_chars 个字符，
+    总长度超出两者之和时，中间部分被省略，完整输出写入 spill_dir 下的临时文件（不超过 spill_max_bytes）。
+    """
+
+    def __init__(self, head_chars: Optional[int] = None, tail_chars: int = 0,
+                 spill_dir: Optional[Path] = None, spill_max_bytes: int = 0):
+        """
+        Args:
+            head_chars: 保留的开头字符数，为空表示不限制输出长度
+            tail_chars: 保留的结尾字符数
+            spill_dir: 保存完整输出的目录，为空时不保存
+            spill_max_bytes: 完整输出文件的最大字节数，0 表示不限制
+        """
+        super().__init__()
+        self._head_chars = head_chars
+        self._tail_chars = tail_chars
+        self._spill_dir = spill_dir
+        self._spill_max_bytes = spill_max_bytes
+        self._head: List[str] = []
+        self._head_len = 0
+        self._tail: Deque[str] = deque()
+        self._tail_len = 0
+        self._total = 0
+        self._overflowed = False
+        self._spill_file = None
+        self._spill_bytes = 0
+        self._spill_complete = True
+        self.output_id: Optional[str] = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if not s:
+            return 0
+        written = len(s)
+        self._total += written
+        if self._head_chars is None:
+            self._head.append(s)
+            return written
+        if not self._overflowed and self._total > self._head_chars + self._tail_chars:
+            self._start_spill()
+        if self._spill_file is not None:
+            self._write_spill(s)
+
+        room = self._head_chars - self._head_len
+        if room > 0:
+            self._head.append(s[:room])
+            self._head_len += min(room, len(s))
+            s = s[room:]
+        if s:
+            self._tail.append(s)
+            self._tail_len += len(s)
+            # 只保留最后 tail_chars 个字符
+            while self._tail and self._tail_len - len(self._tail[0]) >= self._tail_chars:
+                self._tail_len -= len(self._tail.popleft())
+            if self._tail_len > self._tail_chars:
+                excess = self._tail_len - self._tail_chars
+                self._tail[0] = self._tail[0][excess:]
+                self._tail_len -= excess
+        return written
+
+    def _start_spill(self) -> None:
+        """输出第一次超出限制时，将已有的输出写入临时文件，之后的输出追加到文件中"""
+        self._overflowed = True
+        if self._spill_dir is None:
+            self._spill_complete = False
+            return
+        try:
+            self._spill_dir.mkdir(parents=True, exist_ok=True)
+            self.output_id = uuid.uuid4().hex
+            self._spill_file = open(self._spill_dir / f"{self.output_id}.txt", "w", encoding="utf-8",
+                                    errors="replace")
+        except OSError:
+            self.output_id = None
+            self._spill_complete = False
+            return
+        self._write_spill("".join(self._head) + "".join(self._tail))
+
+    def _write_spill(self, s: str) -> None:
+        data = s.encode("utf-8", errors="replace")
+        if self._spill_max_bytes and self._spill_bytes + len(data) > self._spill_max_bytes:
+            # 文件达到上限后不再写入
+            self._spill_complete = False
+            self._spill_file.close()
+            self._spill_file = None
+            return
+        self._spill_file.write(s)
+        self._spill_bytes += len(data)
+
+    @property
+    def omitted_chars(self) -> int:
+        """被省略的字符数"""
+        return self._total - self._head_len - self._tail_len if self._overflowed else 0
+
+    def getvalue(self) -> str:
+        """获取输出内容，超出限制时开头和结尾之间以省略提示分隔"""
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if not self._overflowed:
+            return head + tail
+        marker = f"\n... 输出过长，已省略 {self.omitted_chars} 个字符 ...\n"
+        return head + marker + tail
+
+    def truncation_info(self) -> Optional[Dict[str, Any]]:
+        """
+        获取输出被截断的信息
+
+        Returns:
+            Optional[Dict]: 总字符数 total_chars、被省略的字符数 omitted_chars、
+                完整输出的ID output_id（未保存时为空）和完整输出是否因超出文件大小上限而不完整 complete，
+                未被截断时返回None
+        """
+        if not self._overflowed:
+            return None
+        return {
+            "total_chars": self._total,
+            "omitted_chars": self.omitted_chars,
+            "output_id": self.output_id,
+            "complete": self._spill_complete
+        }
+
+    def close(self) -> None:
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        super().close()
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """末尾最后一个完整UTF-8字符之后的位置，末尾的字节不构成完整字符时返回该字符的起始位置"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            # 多字节字符的后续字节，继续向前找起始字节
+            continue
+        if byte >= 0xF0:
+            length = 4
+        elif byte >= 0xE0:
+            length = 3
+        elif byte >= 0xC0:
+            length = 2
+        else:
+            length = 1
+        return len(data) - back if back < length else len(data)
+    return len(data)
+
+
+def read_spilled_output(directory: Path, output_id: str, offset: int = 0,
+                        limit: int = 65536) -> Optional[Dict[str, Any]]:
+    """
+    分页读取保存在临时文件中的完整输出
+
+    Args:
+        directory: 会话的完整输出目录
+        output_id: 输出ID
+        offset: 起始位置（字节）
+        limit: 最多读取的字节数
+
+    Returns:
+        Optional[Dict]: 文本 text、下一页的起始位置 next_offset、文件大小 size 和是否已读完 done，
+            输出不存在时返回None
+    """
+    if not _OUTPUT_ID_PATTERN.match(output_id or ""):
+        return None
+    path = directory / f"{output_id}.txt"
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, io.SEEK_END)
+            offset = min(max(offset, 0), size)
+            f.seek(offset)
+            data = f.read(max(limit, 4))
+    except FileNotFoundError:
+        return None
+    # 不在多字节字符的中间截断，末尾不完整的字符留到下一页
+    if offset + len(data) < size:
+        data = data[:_utf8_boundary(data)]
+    text = data.decode("utf-8", errors="replace")
+    next_offset = offset + len(data)
+    return {"text": text, "offset": offset, "next_offset": next_offset, "size": size, "done": next_offset >= size}
+
+
+# 流式输出超出开头和结尾部分的总长度（中间部分被省略）后推送的提示，其余输出在执行结束后只推送结尾部分
+STREAM_TRUNCATED_MARKER = "\n... 输出过长，之后只显示结尾部分 ...\n"
+
+
+class StreamingOutput:
+    """
+    流式输出收集器
+
+    在保存完整输出的同时，将新写入的内容按批次推送给回调函数。
+    首次写入立即推送，之后按时间间隔合并推送，每批内容不超过指定大小，
+    避免频繁打印的循环把大量小消息推给客户端。
+
+    运行中只推送输出缓冲区保留的开头部分，之后的内容在执行结束时推送；
+    只有输出确实超出开头和结尾部分的总长度时才推送一次截断提示（truncated 为 true 的 stream 事件），
+    推送的内容与执行结果中的输出相同。
+    """
+
+    def __init__(self, on_output: Callable[[Dict[str, Any]], None],
+                 flush_interval: float = 0.1, batch_size: int = 8192, **buffer_options):
+        """
+        Args:
+            on_output: 接收输出事件的回调函数
+            flush_interval: 合并推送的时间间隔（秒）
+            batch_size: 每个输出事件中文本的最大字符数，待推送的文本达到该长度时立即推送
+            buffer_options: 传给 BoundedOutput 的输出长度限制
+        """
+        self._on_output = on_output
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        # 保证各批次按写入的顺序推送
+        self._flush_lock = threading.Lock()
+        # 待推送的 (流名称, 文本片段, 是否为截断提示)
+        self._pending: List[Tuple[str, List[str], bool]] = []
+        self._pending_chars = 0
+        self._first_write = True
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="output-flusher")
+        self.stdout = _StreamingBuffer(self, "stdout", **buffer_options)
+        self.stderr = _StreamingBuffer(self, "stderr", **buffer_options)
+
+    def start(self) -> None:
+        """启动后台推送线程"""
+        self._flusher.start()
+
+    def _append(self, name: str, text: str, truncated: bool = False) -> None:
+        with self._lock:
+            if not truncated and self._pending and self._pending[-1][0] == name and not self._pending[-1][2]:
+                self._pending[-1][1].append(text)
+            else:
+                self._pending.append((name, [text], truncated))
+            self._pending_chars += len(text)
+            # 待推送的文本过多时在写入线程中推送，客户端接收过慢时由此形成背压
+            flush_now = self._first_write or self._pending_chars >= self._batch_size
+            self._first_write = False
+        if flush_now:
+            # 第一段输出立即推送，缩短用户看到输出的等待时间
+            self.flush()
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """推送一个非文本事件（例如图形），推送前先发送已缓存的文本"""
+        with self._flush_lock:
+            self._flush_pending()
+            self._on_output(event)
+
+    def flush(self) -> None:
+        """推送所有缓存的输出"""
+        with self._flush_lock:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._pending_chars = 0
+        for name, chunks, truncated in pending:
+            text = "".join(chunks)
+            if truncated:
+                self._on_output({"type": "stream", "name": name, "text": text, "truncated": True})
+                continue
+            for start in range(0, len(text), self._batch_size):
+                self._on_output({"type": "stream", "name": name, "text": text[start:start + self._batch_size]})
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self._flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """停止后台推送线程并推送剩余输出（包括被截断的输出的结尾部分）"""
+        self._closed.set()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        self.stdout.forward_tail()
+        self.stderr.forward_tail()
+        self.flush()
+
+
+class _StreamingBuffer(BoundedOutput):
+    """保存输出并将开头部分的写入内容转发给StreamingOutput的缓冲区"""
+
+    def __init__(self, owner: StreamingOutput, name: str, **buffer_options):
+        super().__init__(**buffer_options)
+        self._owner = owner
+        self._name = name
+        self._truncation_sent = False
+
+    def write(self, s: str) -> int:
+        if s:
+            if self._head_chars is None:
+                self._owner._append(self._name, s)
+            else:
+                room = self._head_chars - self._head_len
+                if room > 0:
+                    self._owner._append(self._name, s[:room])
+        # 开头部分已满后的内容保留在结尾部分中，执行结束时再推送
+        written = super().write(s)
+        if self._overflowed and not self._truncation_sent:
+            # 结尾部分开始丢弃内容，中间的输出被省略
+            self._truncation_sent = True
+            self._owner._append(self._name, STREAM_TRUNCATED_MARKER, truncated=True)
+        return written
+
+    def forward_tail(self) -> None:
+        """执行结束后转发缓冲区保留的结尾部分"""
+        tail = "".join(self._tail)
+        if tail:
+            self._owner._append(self._name, tail)
@@ -0,0 +1,137 @@
+"""
+plotly图形序列化模块
+
+将plotly图形序列化为前端可以直接绘制的JSON（data、layout、config）。
+轨迹中的数值数组使用plotly的类型化数组格式 {"dtype": "f8", "bdata": "<base64>", "shape": "..."}，
+数组按二进制原样编码，避免逐个元素转换为JSON数字，数据量大的图形序列化更快、体积更小。
+安装了 orjson 时使用 orjson 编码JSON。
+"""
+import base64
+from typing import Dict, Any, List, Optional
+import numpy as np
+import plotly.io as pio
+from app.core.config import settings
+from app.services.code_executor.downsampling import downsample_plotly_trace
+from app.services.code_executor.raster_aggregation import RasterRegistry, rasterize_plotly_trace
+
+# 前端显示plotly图形的配置
+PLOTLY_CONFIG = {
+    'displayModeBar': True,
+    'responsive': True,
+    'scrollZoom': True,
+    'showLink': False,
+    'displaylogo': False,
+    'modeBarButtonsToRemove': ['sendDataToCloud'],
+    'toImageButtonOptions': {
+        'format': 'png',
+        'filename': 'plotly_graph',
+        'height': 500,
+        'width': 700,
+        'scale': 2
+    }
+}
+
+# plotly类型化数组支持的数据类型
+_TYPED_ARRAY_DTYPES = {
+    np.dtype('int8'): 'i1',
+    np.dtype('uint8'): 'u1',
+    np.dtype('int16'): 'i2',
+    np.dtype('uint16'): 'u2',
+    np.dtype('int32'): 'i4',
+    np.dtype('uint32'): 'u4',
+    np.dtype('float32'): 'f4',
+    np.dtype('float64'): 'f8',
+}
+
+
+def encode_array(array: np.ndarray) -> Any:
+    """
+    将数值数组编码为plotly类型化数组
+
+    64位整数在取值范围允许时转换为32位整数，否则转换为64位浮点数。
+
+    Args:
+        array: numpy数组
+
+    Returns:
+        Any: 类型化数组的描述，不是数值数组时原样返回
+    """
+    if array.dtype.kind in 'iu' and array.dtype.itemsize == 8:
+        if array.size == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max):
+            array = array.astype(np.int32)
+        else:
+            array = array.astype(np.float64)
+    dtype = _TYPED_ARRAY_DTYPES.get(array.dtype.newbyteorder('='))
+    if dtype is None or array.ndim == 0:
+        return array
+    # 类型化数组按小端字节序编码
+    data = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    encoded = {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        encoded["shape"] = ",".join(str(n) for n in array.shape)
+    return encoded
+
+
+def _encode_arrays(value: Any) -> Any:
+    """递归替换轨迹属性中的数值数组"""
+    if isinstance(value, np.ndarray):
+        return encode_array(value)
+    if isinstance(value, dict):
+        return {key: _encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_arrays(item) for item in value]
+    return value
+
+
+def figure_to_dict(fig: Any, downsampled: Optional[List[Dict[str, Any]]] = None,
+                   rasterized: Optional[List[Dict[str, Any]]] = None,
+                   rasters: Optional[RasterRegistry] = None) -> Dict[str, Any]:
+    """
+    将plotly图形转换为可以序列化的字典，轨迹中的数值数组编码为类型化数组
+
+    点数过多的散点先聚合为密度热力图，点数过多的折线先降采样。
+
+    Args:
+        fig: plotly图形对象
+        downsampled: 降采样记录列表，每条被降采样的轨迹追加一条记录
+        rasterized: 聚合记录列表，每条被聚合的轨迹追加一条记录
+        rasters: 保存被聚合的原始散点的注册表，用于缩放时重新聚合
+
+    Returns:
+        Dict: 图形的 data、layout 和 config
+    """
+    # to_plotly_json 不复制图形数据，这里只读取不修改
+    figure = fig.to_plotly_json()
+    threshold, points = settings.PLOT_DOWNSAMPLE_THRESHOLD, settings.PLOT_DOWNSAMPLE_POINTS
+    traces = [
+        downsample_plotly_trace(
+            rasterize_plotly_trace(trace, settings.PLOT_RASTER_THRESHOLD, settings.PLOT_RASTER_WIDTH,
+                                   settings.PLOT_RASTER_HEIGHT, rasters, rasterized),
+            threshold, points, downsampled
+        )
+        for trace in figure.get("data", [])
+    ]
+    return {
+        "data": [_encode_arrays(trace) for trace in traces],
+        "layout": figure.get("layout", {}),
+        "config": PLOTLY_CONFIG
+    }
+
+
+def figure_to_json(fig: Any, downsampled: Optional[List[Dict[str, Any]]] = None,
+                   rasterized: Optional[List[Dict[str, Any]]] = None,
+                   rasters: Optional[RasterRegistry] = None) -> str:
+    """
+    将plotly图形序列化为JSON字符串
+
+    Args:
+        fig: plotly图形对象
+        downsampled: 降采样记录列表，每条被降采样的轨迹追加一条记录
+        rasterized: 聚合记录列表，每条被聚合的轨迹追加一条记录
+        rasters: 保存被聚合的原始散点的注册表，用于缩放时重新聚合
+
+    Returns:
+        str: 包含 data、layout 和 config 的JSON
+    """
+    # engine 为 auto 时安装了 orjson 则使用 orjson，其余numpy、日期等类型由plotly的编码器处理
+    return pio.json.to_json_plotly(figure_to_dict(fig, downsampled, rasterized, rasters), engine="auto")
@@ -0,0 +1,198 @@
+"""
+散点图栅格聚合模块
+
+点数达到百万级的散点图即使降采样，浏览器也难以绘制和交互。捕获图形时将这类散点
+按坐标分箱统计为二维密度网格，以热力图轨迹代替原始散点，前端只需绘制固定大小的网格。
+原始坐标保留在会话中，前端缩放时按新的坐标范围重新聚合，任意数据量下都可以交互浏览。
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import numpy as np
+
+# 每个会话保留的可重新聚合的散点数据个数
+MAX_RASTER_SOURCES = 8
+
+
+def _axis_range(values: np.ndarray, value_range: Optional[Sequence[float]]) -> Tuple[float, float]:
+    """确定坐标轴的聚合范围，未指定时使用数据的范围"""
+    if value_range is not None:
+        lo, hi = float(value_range[0]), float(value_range[1])
+        if lo > hi:
+            lo, hi = hi, lo
+    elif values.size:
+        lo, hi = float(values.min()), float(values.max())
+    else:
+        lo, hi = 0.0, 1.0
+    if hi <= lo:
+        # 所有点的坐标相同时，以该坐标为中心取单位宽度
+        lo, hi = lo - 0.5, hi + 0.5
+    return lo, hi
+
+
+def aggregate_points(x: np.ndarray, y: np.ndarray, width: int, height: int,
+                     x_range: Optional[Sequence[float]] = None,
+                     y_range: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """
+    将散点按坐标分箱统计为二维密度网格
+
+    Args:
+        x: 横坐标
+        y: 纵坐标
+        width: 横向的格子数
+        height: 纵向的格子数
+        x_range: 横坐标的聚合范围，为空时使用数据的范围
+        y_range: 纵坐标的聚合范围，为空时使用数据的范围
+
+    Returns:
+        Dict: 网格计数 z（height x width，没有点的格子为NaN）、第一个格子的中心坐标 x0/y0、
+            格子大小 dx/dy、聚合范围 x_range/y_range，以及范围内的点数 points
+    """
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    x_lo, x_hi = _axis_range(x, x_range)
+    y_lo, y_hi = _axis_range(y, y_range)
+    inside = (x >= x_lo) & (x <= x_hi) & (y >= y_lo) & (y <= y_hi)
+    x, y = x[inside], y[inside]
+
+    dx = (x_hi - x_lo) / width
+    dy = (y_hi - y_lo) / height
+    ix = np.minimum(((x - x_lo) / dx).astype(np.int64), width - 1)
+    iy = np.minimum(((y - y_lo) / dy).astype(np.int64), height - 1)
+    z = np.bincount(iy * width + ix, minlength=width * height).reshape(height, width).astype(np.float32)
+    # 没有点的格子显示为空白
+    z[z == 0] = np.nan
+    return {
+        "z": z,
+        "x0": x_lo + dx / 2,
+        "dx": dx,
+        "y0": y_lo + dy / 2,
+        "dy": dy,
+        "x_range": [x_lo, x_hi],
+        "y_range": [y_lo, y_hi],
+        "points": int(x.size)
+    }
+
+
+class RasterRegistry:
+    """
+    会话中已聚合的散点数据，用于缩放时重新聚合，超出上限时丢弃最早的数据
+    """
+
+    def __init__(self, session_id: str, maxsize: int = MAX_RASTER_SOURCES):
+        """
+        Args:
+            session_id: 会话ID，写入热力图轨迹中供前端请求重新聚合
+            maxsize: 最多保留的散点数据个数
+        """
+        self.session_id = session_id
+        self.maxsize = maxsize
+        self._sources: "OrderedDict[str, Tuple[np.ndarray, np.ndarray, int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, x: np.ndarray, y: np.ndarray, width: int, height: int) -> str:
+        """
+        保存散点数据
+
+        Returns:
+            str: 散点数据ID
+        """
+        raster_id = uuid.uuid4().hex
+        with self._lock:
+            self._sources[raster_id] = (x, y, width, height)
+            while len(self._sources) > self.maxsize:
+                self._sources.popitem(last=False)
+        return raster_id
+
+    def aggregate(self, raster_id: str, x_range: Optional[Sequence[float]] = None,
+                  y_range: Optional[Sequence[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        按指定的坐标范围重新聚合散点数据
+
+        Args:
+            raster_id: 散点数据ID
+            x_range: 横坐标范围，为空时使用数据的范围
+            y_range: 纵坐标范围，为空时使用数据的范围
+
+        Returns:
+            Optional[Dict]: 聚合结果（格式同 aggregate_points），散点数据不存在时返回None
+        """
+        with self._lock:
+            source = self._sources.get(raster_id)
+            if source is not None:
+                self._sources.move_to_end(raster_id)
+        if source is None:
+            return None
+        x, y, width, height = source
+        return aggregate_points(x, y, width, height, x_range, y_range)
+
+    def clear(self) -> None:
+        """清除所有散点数据"""
+        with self._lock:
+            self._sources.clear()
+
+
+def _numeric(values: Any) -> Optional[np.ndarray]:
+    """转换为一维浮点数组，不是数值时返回None"""
+    if values is None or isinstance(values, str):
+        return None
+    array = np.asarray(values)
+    if array.ndim != 1 or array.dtype.kind not in "iufb":
+        return None
+    return array.astype(np.float64, copy=False)
+
+
+def rasterize_plotly_trace(trace: Dict[str, Any], threshold: int, width: int, height: int,
+                           registry: Optional[RasterRegistry] = None,
+                           report: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    将点数过多的plotly散点轨迹聚合为热力图轨迹
+
+    Args:
+        trace: 轨迹的字典表示（不会被修改）
+        threshold: 点数超过该值时聚合，0 表示不聚合
+        width: 横向的格子数
+        height: 纵向的格子数
+        registry: 保存原始散点数据的注册表，为空时前端无法按缩放范围重新聚合
+        report: 聚合记录列表，聚合时追加一条记录
+
+    Returns:
+        Dict: 热力图轨迹，不需要聚合时返回原轨迹
+    """
+    if not threshold or trace.get("type", "scatter") not in ("scatter", "scattergl"):
+        return trace
+    # 折线交给降采样处理，这里只处理纯散点（未指定 mode 时点数多的轨迹默认绘制为折线）
+    mode = trace.get("mode") or "lines"
+    if "lines" in mode or "markers" not in mode:
+        return trace
+    y = _numeric(trace.get("y"))
+    if y is None or y.size <= threshold:
+        return trace
+    x = _numeric(trace.get("x")) if trace.get("x") is not None else np.arange(y.size, dtype=np.float64)
+    if x is None or x.size != y.size:
+        return trace
+
+    grid = aggregate_points(x, y, width, height)
+    heatmap = {
+        "type": "heatmap",
+        "name": trace.get("name"),
+        "z": grid["z"],
+        "x0": grid["x0"],
+        "dx": grid["dx"],
+        "y0": grid["y0"],
+        "dy": grid["dy"],
+        "xaxis": trace.get("xaxis"),
+        "yaxis": trace.get("yaxis"),
+        "colorscale": "Viridis",
+        "showscale": False,
+        "hoverongaps": False,
+        "hovertemplate": "x=%{x}<br>y=%{y}<br>点数=%{z}<extra></extra>",
+    }
+    if registry is not None:
+        raster_id = registry.add(x, y, width, height)
+        heatmap["meta"] = {"raster": {"session_id": registry.session_id, "raster_id": raster_id}}
+    if report is not None:
+        report.append({"name": None if trace.get("name") is None else str(trace.get("name")),
+                       "points": int(y.size), "grid": [width, height]})
+    return {key: value for key, value in heatmap.items() if value is not None}
@@ -1,6 +1,7 @@
 import sys
 import io
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Optional, Callable, List
 import traceback
 import builtins
 import numpy as np
@@ -13,11 +14,43 @@ import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 import warnings
-from contextlib import redirect_stdout, redirect_stderr
-import base64
-from io import BytesIO
 import uuid
+import logging
+import re
+import shutil
+from collections import deque
+from pathlib import Path
 from app.services.code_executor.dataframe_manager import DataFrameManager
+from app.services.code_executor.artifact_store import get_artifact_store, MEDIA_TYPES
+from app.services.code_executor.cell_profiler import CellProfiler
+from app.services.code_executor.code_cache import get_code_cache
+from app.services.code_executor.data_cache import load_data
+from app.services.code_executor.figure_manager import FigureSession
+from app.services.code_executor.plotly_serializer import figure_to_json
+from app.services.code_executor.downsampling import downsample_matplotlib_figure
+from app.services.code_executor.raster_aggregation import RasterRegistry
+from app.services.code_executor.output_capture import capture_output, StreamingOutput, BoundedOutput
+from app.services.code_executor.execution_limits import (
+    ExecutionLimitExceeded, execution_result, limit_exceeded_result, interrupt_thread, deliver_pending_interrupt,
+    LIMIT_INTERRUPTED, LIMIT_TIMEOUT, LIMIT_MEMORY
+)
+from app.services.code_executor.session_snapshot import (
+    save_snapshot, load_snapshot, resolve, LazyNamespace, SpilledDataFrame
+)
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 被省略的完整输出的保存目录
+OUTPUT_DIR_NAME = "outputs"
+# 每个会话保留的完整输出文件个数，超出时删除最早的文件
+MAX_SPILLED_OUTPUTS = 16
+
+
+def output_dir(session_id: str) -> Path:
+    """会话中被省略的完整输出的保存目录"""
+    safe_id = re.sub(r"[^\w.-]", "_", session_id)
+    return settings.TEMP_DIR / OUTPUT_DIR_NAME / safe_id
 
 # 过滤掉特定的警告
 warnings.filterwarnings('ignore', category=UserWarning, message='FigureCanvasAgg is non-interactive')
@@ -36,127 +69,210 @@ class SessionEnvironment:
         """
         self.session_id = session_id
         self.df_manager = df_manager
+        # 正在执行代码的线程，用于中断执行
+        self._exec_lock = threading.Lock()
+        self._exec_thread_id: Optional[int] = None
+        self._interrupt_reason: Optional[str] = None
         # 设置matplotlib的全局配置
         plt.ioff()  # 确保关闭交互模式
         plt.rcParams.update({
             'figure.max_open_warning': 50,
             'figure.dpi': 100,
-            'interactive': False
+            'interactive': False,
+            # SVG中的元素ID默认随机生成，固定后相同的图形生成相同的SVG
+            'svg.hashsalt': 'pythonnote'
         })
         # 设置plotly的默认模板
         pio.templates.default = "plotly_white"
+        # 当前会话的matplotlib图形，与其他会话的图形互不影响
+        self._figures = FigureSession(on_show=self._on_show, on_plotly_show=self._on_plotly_show)
+        # 聚合为热力图的散点原始数据，用于缩放时重新聚合
+        self._rasters = RasterRegistry(session_id)
+        # 保存了完整输出的文件，超出个数上限时删除最早的文件
+        self._spilled_outputs: deque = deque()
         self.reset()
     
     def _capture_plot(self) -> str:
-        """捕获matplotlib图形并转换为base64字符串"""
-        if plt.get_fignums():  # 只要有图形就捕获
-            buf = BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight')
-            plt.close()  # 清除当前图形
-            buf.seek(0)
-            self._show_called = False  # 重置标志
-            return f'<img src="data:image/png;base64,{base64.b64encode(buf.getvalue()).decode()}">'
-        return ''
+        """捕获当前会话中所有打开的matplotlib图形并转换为 <img> 标签，捕获后关闭这些图形"""
+        fmt = settings.FIGURE_FORMAT if settings.FIGURE_FORMAT in MEDIA_TYPES else 'png'
+        for fig in self._figures.figures():
+            downsample_matplotlib_figure(fig, settings.PLOT_DOWNSAMPLE_THRESHOLD,
+                                         settings.PLOT_DOWNSAMPLE_POINTS, self._downsampled)
+        store = get_artifact_store()
+        images = [store.image_tag(data, fmt) for data in self._figures.render(fmt)]
+        self._show_called = False  # 重置标志
+        return ''.join(images)
 
     def _capture_plotly(self) -> str:
-        """捕获最后一个plotly图形并转换为HTML"""
-        if not hasattr(self, '_last_plotly_fig') or self._last_plotly_fig is None:
+        """捕获最后一个plotly图形并序列化为JSON（data、layout、config）"""
+        fig = getattr(self, '_last_plotly_fig', None)
+        if fig is None:
             return ''
-            
+        self._last_plotly_fig = None
         try:
-            config = {
-                'displayModeBar': 'true',
-                'responsive': 'true',
-                'scrollZoom': 'true',
-                'showLink': 'false',
-                'displaylogo': 'false',
-                'modeBarButtonsToRemove': ['sendDataToCloud'],
-                'toImageButtonOptions': {
-                    'format': 'png',
-                    'filename': 'plotly_graph',
-                    'height': 500,
-                    'width': 700,
-                    'scale': 2
-                }
-            }
-            
-            try:
-                plot_data = self._last_plotly_fig.to_json()
-                plot_data = plot_data.replace('True', 'true').replace('False', 'false')
-                
-                plot_layout = self._last_plotly_fig.layout.to_plotly_json()
-                plot_layout = str(plot_layout).replace('True', 'true').replace('False', 'false')
-            except Exception:
-                import json
-                plot_data = json.dumps(self._last_plotly_fig.data)
-                plot_layout = json.dumps(self._last_plotly_fig.layout)
-                plot_data = plot_data.replace('True', 'true').replace('False', 'false')
-                plot_layout = plot_layout.replace('True', 'true').replace('False', 'false')
-            
-            html = f'''
-            <div class="plotly-graph-div" style="height:100%; width:100%;">
-            <script type="text/javascript">
-                (function() {{
-                    if (window.Plotly) {{
-                        try {{
-                            var data = {plot_data};
-                            var layout = {plot_layout};
-                            layout.autosize = true;
-                            layout.margin = {{ t: 30, r: 10, b: 30, l: 60 }};
-                            layout.height = null;
-                            var config = {config};
-                            
-                            var container = document.currentScript.parentElement;
-                            Plotly.newPlot(container, data, layout, config)
-                                .then(function() {{
-                                    window.dispatchEvent(new Event('resize'));
-                                }});
-                        }} catch(e) {{
-                            console.error("[Plotly] 初始化错误:", e);
-                        }}
-                    }}
-                }})();
-            </script>
-            </div>
-            '''
+            return figure_to_json(fig, self._downsampled, self._rasterized, self._rasters)
+        except Exception as e:
+            logger.warning(f"序列化plotly图形失败: {str(e)}")
+            return ''
+
+    def bind(self, session_id: str) -> None:
+        """
+        将预先创建的会话环境分配给指定的会话
+        
+        Args:
+            session_id: 会话ID
+        """
+        self.session_id = session_id
+        self._rasters.session_id = session_id
+
+    def warm_up(self) -> None:
+        """
+        预热绘图：渲染一个小的matplotlib图形并序列化一个plotly图形，
+        提前完成字体缓存、渲染器和序列化器的初始化，之后第一次绘图不再有额外延迟
+        """
+        with self._figures.activate():
+            plt.figure(figsize=(1, 1))
+            plt.plot([0, 1], [0, 1])
+            plt.title('warm up')
+        # 渲染后图形即被关闭
+        self._figures.render(settings.FIGURE_FORMAT if settings.FIGURE_FORMAT in MEDIA_TYPES else 'png')
+        figure_to_json(go.Figure(go.Scatter(x=[0, 1], y=[0, 1])))
+
+    def aggregate_raster(self, raster_id: str, x_range: Optional[List[float]] = None,
+                         y_range: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        按新的坐标范围重新聚合已聚合为热力图的散点（前端缩放时调用）
+        
+        Args:
+            raster_id: 散点数据ID，位于热力图轨迹的 meta.raster 中
+            x_range: 横坐标范围，为空时使用数据的范围
+            y_range: 纵坐标范围，为空时使用数据的范围
             
-            self._last_plotly_fig = None
-            return html
+        Returns:
+            Optional[Dict]: 聚合结果，散点数据已失效（会话重置或重新执行）时返回None
+        """
+        return self._rasters.aggregate(raster_id, x_range, y_range)
+
+    def interrupt(self, reason: str = LIMIT_INTERRUPTED) -> bool:
+        """
+        中断正在执行的代码
+        
+        在执行线程中抛出KeyboardInterrupt，对纯Python循环立即生效，
+        耗时的C扩展调用（如大型merge）会在返回后才被中断。
+        
+        Args:
+            reason: 中断原因，"interrupted" 或 "timeout"
             
-        except Exception:
-            return ''
+        Returns:
+            bool: 是否有正在执行的代码被中断
+        """
+        with self._exec_lock:
+            if self._exec_thread_id is None:
+                return False
+            self._interrupt_reason = reason
+            interrupt_thread(self._exec_thread_id)
+            return True
+    
+    def _finish_exec(self, interrupted: bool = False) -> None:
+        """
+        结束执行状态，之后的中断请求不再生效
+
+        Args:
+            interrupted: 执行线程是否已经收到KeyboardInterrupt
+
+        Raises:
+            KeyboardInterrupt: 代码执行结束时中断请求（例如超时）刚刚到达，本次执行按被中断处理
+        """
+        with self._exec_lock:
+            pending = self._exec_thread_id is not None and self._interrupt_reason is not None
+            self._exec_thread_id = None
+        if pending and not interrupted and deliver_pending_interrupt():
+            raise KeyboardInterrupt
 
-    def execute(self, code: str) -> Dict[str, Any]:
+    def execute(self, code: str, on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
         """
         在当前会话环境中执行Python代码
         
         Args:
             code: 要执行的Python代码
+            on_output: 可选的输出回调，设置后运行过程中的输出和图形会以事件形式实时推送
+            timeout: 执行超时时间（秒），超时后中断执行，为空或0表示不限制
+            profile: 是否开启详细性能分析（内存分配峰值和耗时最多的函数），耗时总是会记录
             
         Returns:
-            Dict包含执行结果
-        """
-        stdout = io.StringIO()
-        stderr = io.StringIO()
-        
-        result = {
-            "output": "",
-            "error": None,
-            "status": "success",
-            "has_dataframes": False,
-            "plot": "",
-            "plotly_html": ""
+            Dict包含执行结果和性能数据 profile，超出限制时 status 为 "limit_exceeded"
+        """
+        # 先编译再执行：直接exec源码字符串时，被中断的KeyboardInterrupt
+        # 会被解释器记为未处理的中断，导致服务进程退出时以SIGINT结束
+        try:
+            compiled = get_code_cache().compile(code)
+        except SyntaxError as e:
+            # 语法错误在执行任何代码之前返回
+            error_msg = "".join(traceback.format_exception_only(type(e), e))
+            result = execution_result()
+            result.update({
+                "output": error_msg,
+                "error": error_msg,
+                "status": "error",
+                "has_dataframes": len(self.df_manager.get_dataframes_names()) > 0
+            })
+            return result
+        
+        # 上一个单元格的后台统计任务不能与本次执行同时读取DataFrame
+        self.df_manager.cancel_prefetches()
+        
+        # 输出超出长度限制时只保留开头和结尾，完整输出保存到临时文件
+        buffer_options = {
+            "head_chars": settings.OUTPUT_HEAD_CHARS or None,
+            "tail_chars": settings.OUTPUT_TAIL_CHARS,
+            "spill_dir": output_dir(self.session_id),
+            "spill_max_bytes": settings.OUTPUT_SPILL_MAX_MB * 1024 * 1024
         }
+        if on_output is not None:
+            streamer = StreamingOutput(on_output, settings.STREAM_FLUSH_INTERVAL, settings.STREAM_BATCH_SIZE,
+                                       **buffer_options)
+            stdout, stderr = streamer.stdout, streamer.stderr
+            streamer.start()
+        else:
+            streamer = None
+            stdout = BoundedOutput(**buffer_options)
+            stderr = BoundedOutput(**buffer_options)
+        self._streamer = streamer
+        
+        result = execution_result()
+        self._downsampled = result["downsampled"]
+        self._rasterized = result["rasterized"]
+        
+        with self._exec_lock:
+            self._exec_thread_id = threading.get_ident()
+            self._interrupt_reason = None
+        timer = threading.Timer(timeout, self.interrupt, args=(LIMIT_TIMEOUT,)) if timeout else None
+        profiler = CellProfiler(detailed=profile, top_n=settings.PROFILE_TOP_N)
         
+        interrupted = False
         try:
-            with redirect_stdout(stdout), redirect_stderr(stderr):
-                exec(code, self.globals_dict, self.locals_dict)
+            try:
+                if timer is not None:
+                    timer.start()
+                with capture_output(stdout, stderr), self._figures.activate(), profiler:
+                    exec(compiled, self.globals_dict, self.locals_dict)
+            except KeyboardInterrupt:
+                interrupted = True
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                self._finish_exec(interrupted)
                 
-            self._register_dataframes()
+            changed = self._register_dataframes()
+            result["reclaimed"] = self._reconcile_dataframes()
+            # 统计信息在接口请求时才计算，这里只在后台预先计算开销小的部分
+            self.df_manager.prefetch_profiles(changed)
             result["has_dataframes"] = len(self.df_manager.get_dataframes_names()) > 0
             
             result["plot"] = self._capture_plot()
-            result["plotly_html"] = self._capture_plotly()
+            result["plotly_json"] = self._capture_plotly()
             
             output = stdout.getvalue()
             errors = stderr.getvalue()
@@ -167,6 +283,17 @@ class SessionEnvironment:
             
             result["output"] = output if output else errors
             
+        except KeyboardInterrupt:
+            self._finish_exec(interrupted=True)
+            reason = self._interrupt_reason or LIMIT_INTERRUPTED
+            result = limit_exceeded_result(reason, timeout if reason == LIMIT_TIMEOUT else None, stdout.getvalue())
+            
+        except MemoryError:
+            result = limit_exceeded_result(LIMIT_MEMORY, settings.SESSION_MEMORY_LIMIT_MB or None, stdout.getvalue())
+            
+        except ExecutionLimitExceeded as e:
+            result = limit_exceeded_result(e.kind, e.limit, stdout.getvalue())
+            
         except Exception:
             error_msg = traceback.format_exc()
             result["error"] = str(error_msg)
@@ -174,16 +301,47 @@ class SessionEnvironment:
             result["output"] = error_msg
         
         finally:
+            if streamer is not None:
+                streamer.close()
+            self._streamer = None
             stdout.close()
             stderr.close()
         
+        result["profile"] = profiler.result()
+        # 被截断的输出：总字符数、省略的字符数和可分页读取的完整输出ID
+        truncated = {}
+        for name, stream in (("stdout", stdout), ("stderr", stderr)):
+            info = stream.truncation_info()
+            if info is not None:
+                truncated[name] = info
+                self._track_spilled_output(info["output_id"])
+        result["output_truncated"] = truncated or None
         return result
 
+    def _track_spilled_output(self, output_id: Optional[str]) -> None:
+        """记录新保存的完整输出文件，超出个数上限时删除最早的文件"""
+        if output_id is None:
+            return
+        self._spilled_outputs.append(output_id)
+        while len(self._spilled_outputs) > MAX_SPILLED_OUTPUTS:
+            stale = self._spilled_outputs.popleft()
+            (output_dir(self.session_id) / f"{stale}.txt").unlink(missing_ok=True)
+
+    def clear_outputs(self) -> None:
+        """删除会话中保存的所有完整输出文件"""
+        self._spilled_outputs.clear()
+        shutil.rmtree(output_dir(self.session_id), ignore_errors=True)
+
     def reset(self):
         """重置会话环境状态"""
-        plt.close('all')
+        self._figures.close_all()
         self._last_plotly_fig = None
         self._show_called = False
+        self._streamer = None
+        self._downsampled = []
+        self._rasterized = []
+        self._rasters.clear()
+        self.clear_outputs()
         
         # 清除当前会话的DataFrame对象
         self.df_manager.clear()
@@ -196,7 +354,9 @@ class SessionEnvironment:
             'plt': plt,
             'px': px,
             'go': go,
-            'plotly': plotly
+            'plotly': plotly,
+            # 读取数据目录中的文件，各会话共享解析后的数据
+            'load_data': load_data
         }
         self.locals_dict = {}
         
@@ -204,24 +364,74 @@ class SessionEnvironment:
         for name in dir(builtins):
             if not name.startswith('_'):
                 self.globals_dict[name] = getattr(builtins, name)
+        # 初始的全局变量不需要保存到快照中
+        self._base_globals = set(self.globals_dict)
                 
-        plt.switch_backend('Agg')
         plt.ioff()
         plt.rcParams['figure.max_open_warning'] = 50
         plt.rcParams['figure.dpi'] = 100
 
-        def custom_show(*args, **kwargs):
-            self._show_called = True
-            return None
-        
-        plt.show = custom_show
+    def _on_show(self):
+        """会话代码调用 plt.show() 时的处理"""
+        self._show_called = True
+        if self._streamer is not None:
+            # 流式执行时立即推送已完成的图形
+            plot = self._capture_plot()
+            if plot:
+                self._streamer.emit({"type": "display", "plot": plot})
 
-        def custom_plotly_show(fig, *args, **kwargs):
-            self._last_plotly_fig = fig
-            return None
-        
-        plotly.io.show = custom_plotly_show
+    def _on_plotly_show(self, fig):
+        """会话代码显示plotly图形时的处理"""
+        self._last_plotly_fig = fig
+        if self._streamer is not None:
+            plotly_json = self._capture_plotly()
+            if plotly_json:
+                self._streamer.emit({"type": "display", "plotly_json": plotly_json})
 
+    def spill(self, directory: Path) -> Dict[str, Any]:
+        """
+        将会话中的变量保存到快照目录，用于会话被回收后恢复
+        
+        Args:
+            directory: 快照目录
+            
+        Returns:
+            Dict: 保存结果，包括已保存和被跳过（无法序列化）的变量名
+        """
+        user_globals = {
+            name: value for name, value in self.globals_dict.items()
+            if name not in self._base_globals
+        }
+        return save_snapshot({"locals": self.locals_dict, "globals": user_globals}, directory)
+    
+    def restore(self, directory: Path) -> List[str]:
+        """
+        从快照目录恢复会话变量
+        
+        局部变量中的DataFrame在第一次被代码或接口访问时才从磁盘加载。
+        
+        Args:
+            directory: 快照目录
+            
+        Returns:
+            List[str]: 已恢复的变量名
+        """
+        namespaces = load_snapshot(directory)
+        self.locals_dict = LazyNamespace(self.locals_dict)
+        dict.update(self.locals_dict, namespaces.get("locals", {}))
+        # exec要求全局命名空间是普通dict，无法延迟加载
+        user_globals = {name: resolve(value) for name, value in namespaces.get("globals", {}).items()}
+        self.globals_dict.update(user_globals)
+        for scope in (user_globals, namespaces.get("locals", {})):
+            for name, value in scope.items():
+                if isinstance(value, SpilledDataFrame):
+                    self.df_manager.register_lazy_dataframe(name, value)
+                elif isinstance(value, pd.DataFrame):
+                    self.df_manager.register_dataframe(name, value)
+        restored = list(namespaces.get("locals", {})) + list(user_globals)
+        logger.info(f"会话 {self.session_id} 已从快照恢复 {len(restored)} 个变量")
+        return restored
+    
     def set_dataframes(self, variables: Dict[str, Any]):
         """设置DataFrame变量到当前会话"""
         self.locals_dict.update(variables)
@@ -233,14 +443,39 @@ class SessionEnvironment:
         """获取当前会话的所有DataFrame"""
         return self.df_manager.get_dataframes()
     
-    def _register_dataframes(self):
-        """注册所有DataFrame变量到管理器"""
+    def _register_dataframes(self) -> List[str]:
+        """
+        注册所有DataFrame变量到管理器
+        
+        管理器通过变更指纹判断DataFrame是否被修改，未被本次执行改动的DataFrame不会重新统计信息。
+        
+        Returns:
+            List[str]: 新增或被修改的DataFrame变量名
+        """
+        changed = []
         for var_name, var_value in self.locals_dict.items():
             if isinstance(var_value, pd.DataFrame):
-                self.df_manager.register_dataframe(var_name, var_value)
+                if self.df_manager.register_dataframe(var_name, var_value):
+                    changed.append(var_name)
         
         for var_name, var_value in self.globals_dict.items():
             if var_name.startswith('__') or isinstance(var_value, type(pd)):
                 continue
             if isinstance(var_value, pd.DataFrame):
-                self.df_manager.register_dataframe(var_name, var_value) 
\ No newline at end of file
+                if self.df_manager.register_dataframe(var_name, var_value):
+                    changed.append(var_name)
+        return changed
+
+    def _reconcile_dataframes(self) -> Dict[str, Any]:
+        """
+        移除已从命名空间中删除的DataFrame的注册信息
+        
+        Returns:
+            Dict: 被移除的变量名和释放的内存，格式同 DataFrameManager.reconcile
+        """
+        names = [
+            name for scope in (self.locals_dict, self.globals_dict)
+            for name, value in scope.items()
+            if isinstance(value, (pd.DataFrame, SpilledDataFrame)) and not name.startswith('__')
+        ]
+        return self.df_manager.reconcile(names)
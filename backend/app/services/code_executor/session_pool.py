@@ -0,0 +1,142 @@
+"""
+预热会话池模块
+
+创建会话环境需要导入和配置numpy、pandas、matplotlib、plotly，第一次绘图还要建立字体缓存、
+初始化渲染器；process 模式下还要启动工作进程。会话池在后台预先创建并预热若干空闲的会话环境，
+打开笔记本时直接取用，取走后在后台补充。池在服务启动时由 start 开始补充，创建后不会自动启动。
+"""
+import itertools
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.code_executor.dataframe_manager import DataFrameManager
+from app.services.code_executor.session_environment import SessionEnvironment
+from app.services.code_executor.session_worker import RemoteSessionEnvironment
+
+logger = logging.getLogger(__name__)
+
+# 预先创建的会话在分配前使用的临时会话ID前缀
+POOL_SESSION_PREFIX = "__pool__"
+
+
+class SessionPool:
+    """
+    预热的空闲会话池
+    """
+
+    def __init__(self, size: int):
+        """
+        Args:
+            size: 池中保持的空闲会话数，0 表示不预先创建
+        """
+        self.size = size
+        # (会话运行模式, 会话环境)，模式改变后旧模式的会话不再使用
+        self._ready: Deque[Tuple[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counter = itertools.count(1)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """启动后台补充线程，重复调用或池大小为0时不做任何事"""
+        with self._cond:
+            if self.size <= 0 or self._closed or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._fill, name="session-pool", daemon=True)
+            self._thread.start()
+
+    def _create(self) -> Tuple[str, Any]:
+        """创建并预热一个会话环境"""
+        mode = settings.SESSION_MODE
+        session_id = f"{POOL_SESSION_PREFIX}{next(self._counter)}"
+        if mode == "process":
+            session = RemoteSessionEnvironment(session_id)
+        else:
+            session = SessionEnvironment(session_id, DataFrameManager())
+        try:
+            session.warm_up()
+        except Exception as e:
+            logger.warning(f"预热会话失败: {str(e)}")
+        return mode, session
+
+    @staticmethod
+    def _close(session: Any) -> None:
+        if isinstance(session, RemoteSessionEnvironment):
+            session.close()
+
+    def _fill(self) -> None:
+        """后台线程：池中的会话少于设定数量时补充"""
+        while True:
+            with self._cond:
+                while not self._closed and len(self._ready) >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                item = self._create()
+            except Exception as e:
+                logger.error(f"创建预热会话失败: {str(e)}", exc_info=True)
+                with self._cond:
+                    # 稍后重试，避免持续失败时占满CPU
+                    self._cond.wait(5)
+                continue
+            with self._cond:
+                if self._closed:
+                    self._close(item[1])
+                    return
+                self._ready.append(item)
+                self._cond.notify_all()
+
+    def acquire(self, session_id: str) -> Optional[Any]:
+        """
+        取出一个预热的会话环境并分配给指定会话
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            Optional: 会话环境（SessionEnvironment 或 RemoteSessionEnvironment），池为空时返回None
+        """
+        while True:
+            with self._cond:
+                if not self._ready:
+                    return None
+                mode, session = self._ready.popleft()
+                self._cond.notify_all()
+            if mode != settings.SESSION_MODE or (isinstance(session, RemoteSessionEnvironment) and not session.is_alive()):
+                self._close(session)
+                continue
+            session.bind(session_id)
+            return session
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待池中的会话补充完毕
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            bool: 池是否已满
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or len(self._ready) >= self.size, timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        """池的大小和当前空闲的会话数"""
+        with self._cond:
+            return {"size": self.size, "ready": len(self._ready)}
+
+    def close(self) -> None:
+        """停止补充并关闭池中的会话"""
+        with self._cond:
+            self._closed = True
+            ready = [session for _, session in self._ready]
+            self._ready.clear()
+            self._cond.notify_all()
+        for session in ready:
+            self._close(session)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
@@ -0,0 +1,176 @@
+"""
+会话快照模块
+
+会话被回收时，将命名空间中可序列化的变量和DataFrame保存到磁盘；
+下次使用该会话时恢复，其中DataFrame在第一次被访问时才从磁盘加载。
+"""
+import importlib
+import json
+import logging
+import pickle
+import shutil
+import threading
+import types
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 快照清单文件名
+MANIFEST_FILE = "manifest.json"
+
+
+class SpilledDataFrame:
+    """
+    已保存到磁盘的DataFrame占位对象，第一次调用 load 时从磁盘加载
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._df: Optional[pd.DataFrame] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """是否已经从磁盘加载"""
+        return self._df is not None
+
+    def load(self) -> pd.DataFrame:
+        """加载并返回DataFrame，多次调用返回同一个对象"""
+        with self._lock:
+            if self._df is None:
+                self._df = pd.read_pickle(self.path)
+            return self._df
+
+
+def resolve(value: Any) -> Any:
+    """如果是占位对象则加载对应的DataFrame，否则原样返回"""
+    if isinstance(value, SpilledDataFrame):
+        return value.load()
+    return value
+
+
+class LazyNamespace(dict):
+    """
+    支持延迟加载DataFrame的命名空间
+
+    作为exec的局部命名空间使用时，代码读取变量会经过 __getitem__，
+    此时才从磁盘加载对应的DataFrame并替换占位对象。
+    """
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, SpilledDataFrame):
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+
+def _spill_value(name: str, value: Any, directory: Path, index: int) -> Optional[Dict[str, Any]]:
+    """
+    保存单个变量，返回其在清单中的描述，无法保存时返回None
+    """
+    if isinstance(value, SpilledDataFrame) and not value.loaded:
+        # 尚未加载的DataFrame直接复制原快照文件
+        file_name = f"df_{index}.pkl"
+        shutil.copyfile(value.path, directory / file_name)
+        return {"kind": "dataframe", "file": file_name}
+    value = resolve(value)
+    if isinstance(value, pd.DataFrame):
+        file_name = f"df_{index}.pkl"
+        value.to_pickle(directory / file_name, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"kind": "dataframe", "file": file_name}
+    if isinstance(value, types.ModuleType):
+        # 模块记录名称，恢复时重新导入
+        return {"kind": "module", "module": value.__name__}
+    try:
+        # 单元格中定义的函数和类无法按引用序列化，会在这里失败并被跳过
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+    file_name = f"var_{index}.pkl"
+    (directory / file_name).write_bytes(data)
+    return {"kind": "pickle", "file": file_name}
+
+
+def save_snapshot(namespaces: Dict[str, Dict[str, Any]], directory: Path) -> Dict[str, Any]:
+    """
+    将命名空间保存到快照目录
+
+    Args:
+        namespaces: 需要保存的命名空间，例如 {"locals": {...}, "globals": {...}}
+        directory: 快照目录，已存在时会被替换
+
+    Returns:
+        Dict: 保存结果，包括已保存和被跳过的变量名
+    """
+    directory = Path(directory)
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    manifest: Dict[str, Any] = {"variables": {}}
+    saved: List[str] = []
+    skipped: List[str] = []
+    index = 0
+    for scope, namespace in namespaces.items():
+        manifest["variables"][scope] = {}
+        for name, value in list(dict.items(namespace)):
+            entry = _spill_value(name, value, tmp_dir, index)
+            index += 1
+            if entry is None:
+                skipped.append(name)
+                continue
+            manifest["variables"][scope][name] = entry
+            saved.append(name)
+
+    (tmp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    if directory.exists():
+        shutil.rmtree(directory)
+    tmp_dir.rename(directory)
+    return {"saved": saved, "skipped": skipped}
+
+
+def load_snapshot(directory: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    从快照目录恢复命名空间，DataFrame以占位对象返回
+
+    Args:
+        directory: 快照目录
+
+    Returns:
+        Dict: 与保存时结构相同的命名空间
+    """
+    directory = Path(directory)
+    manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding="utf-8"))
+    namespaces: Dict[str, Dict[str, Any]] = {}
+    for scope, variables in manifest["variables"].items():
+        namespace = namespaces.setdefault(scope, {})
+        for name, entry in variables.items():
+            try:
+                if entry["kind"] == "dataframe":
+                    namespace[name] = SpilledDataFrame(directory / entry["file"])
+                elif entry["kind"] == "module":
+                    namespace[name] = importlib.import_module(entry["module"])
+                else:
+                    namespace[name] = pickle.loads((directory / entry["file"]).read_bytes())
+            except Exception as e:
+                logger.warning(f"恢复变量 {name} 失败: {str(e)}")
+    return namespaces
+
+
+def has_snapshot(directory: Path) -> bool:
+    """快照目录中是否存在可恢复的快照"""
+    return (Path(directory) / MANIFEST_FILE).exists()
+
+
+def delete_snapshot(directory: Path) -> None:
+    """删除快照目录"""
+    directory = Path(directory)
+    if directory.exists():
+        shutil.rmtree(directory, ignore_errors=True)
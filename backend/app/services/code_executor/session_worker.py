@@ -0,0 +1,397 @@
+"""
+会话工作进程模块
+
+在独立的子进程中运行SessionEnvironment和DataFrameManager，
+父进程通过管道(Pipe)以RPC的方式调用其方法，从而让不同笔记本的代码
+运行在不同的进程中，互不争抢GIL。
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+from app.core.config import settings
+from app.services.code_executor.execution_limits import (
+    ExecutionLimitExceeded, limit_exceeded_result, apply_memory_limit, cpu_time_limit,
+    LIMIT_TIMEOUT, LIMIT_WORKER_EXITED
+)
+
+logger = logging.getLogger(__name__)
+
+# 子进程使用spawn方式启动，避免fork继承服务进程中的线程和锁状态
+_mp_context = multiprocessing.get_context("spawn")
+
+# 关闭工作进程的控制指令
+_CLOSE_COMMAND = "__close__"
+# 读取DataFrame等查询调用等待工作进程空闲的最长秒数，超过后返回会话忙的错误，
+# 而不是占用线程池的线程一直等到正在执行的单元格结束
+BUSY_LOCK_WAIT = 1.0
+
+
+class SessionWorkerError(RuntimeError):
+    """会话工作进程调用失败的异常"""
+    pass
+
+
+class SessionWorkerTimeout(SessionWorkerError):
+    """会话工作进程在限定时间内没有响应"""
+    pass
+
+
+class SessionWorkerBusy(SessionWorkerError):
+    """会话工作进程正在处理其他调用（例如执行单元格）"""
+    pass
+
+
+def _worker_main(conn, session_id: str) -> None:
+    """
+    工作进程入口，在子进程中创建会话环境并循环处理父进程的调用请求
+
+    Args:
+        conn: 与父进程通信的管道端点
+        session_id: 会话ID
+    """
+    # 在子进程中导入，保证matplotlib等库在子进程内完成初始化
+    from app.services.code_executor.dataframe_manager import DataFrameManager
+    from app.services.code_executor.session_environment import SessionEnvironment
+
+    df_manager = DataFrameManager()
+    session = SessionEnvironment(session_id, df_manager)
+    # 各库导入完成后再限制地址空间，超出限制的分配会抛出MemoryError
+    apply_memory_limit(settings.SESSION_MEMORY_LIMIT_MB)
+    targets = {"session": session, "dataframes": df_manager}
+    # 流式输出事件可能来自后台推送线程，发送时需要加锁
+    send_lock = threading.Lock()
+
+    def send(message) -> None:
+        with send_lock:
+            conn.send(message)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # 父进程已退出或管道已关闭
+            break
+        except KeyboardInterrupt:
+            continue
+
+        if message == _CLOSE_COMMAND:
+            break
+
+        target, method, args, kwargs, stream = message
+        if stream:
+            # 将输出事件实时发送给父进程
+            kwargs["on_output"] = lambda event: send(("event", event))
+        try:
+            if target == "session" and method == "execute":
+                with cpu_time_limit(settings.SESSION_CPU_TIME_LIMIT):
+                    result = session.execute(*args, **kwargs)
+            else:
+                result = getattr(targets[target], method)(*args, **kwargs)
+            reply = ("ok", result)
+        except ExecutionLimitExceeded as e:
+            # 在用户代码之外（例如注册DataFrame时）超出限制
+            reply = ("ok", limit_exceeded_result(e.kind, e.limit))
+        except KeyboardInterrupt:
+            # 中断信号在用户代码之外到达
+            reply = ("error", SessionWorkerError("调用已被中断"))
+        except Exception as e:
+            reply = ("error", SessionWorkerError(f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+        try:
+            send(reply)
+        except Exception as e:
+            # 返回值无法序列化时，将错误信息返回给父进程
+            send(("error", SessionWorkerError(f"无法返回 {target}.{method} 的结果: {e}")))
+
+    conn.close()
+
+
+class SessionWorker:
+    """
+    会话工作进程，负责子进程的启动、调用和关闭
+    """
+    def __init__(self, session_id: str):
+        """
+        启动会话工作进程
+
+        Args:
+            session_id: 会话ID
+        """
+        self.session_id = session_id
+        self._conn, child_conn = _mp_context.Pipe()
+        self._process = _mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, session_id),
+            name=f"session-worker-{session_id}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        # 管道不是线程安全的，同一时间只允许一个调用
+        self._lock = threading.Lock()
+        # 是否有调用正在进行，只在调用进行中发送中断信号
+        self._busy = False
+        logger.info(f"会话 {session_id} 的工作进程已启动 (pid={self._process.pid})")
+
+    @property
+    def pid(self) -> Optional[int]:
+        """工作进程的PID"""
+        return self._process.pid
+
+    def is_alive(self) -> bool:
+        """工作进程是否仍在运行"""
+        return self._process.is_alive()
+
+    def call(self, target: str, method: str, *args, **kwargs) -> Any:
+        """
+        调用工作进程中对象的方法
+
+        Args:
+            target: 目标对象，"session" 或 "dataframes"
+            method: 方法名
+            *args: 位置参数
+            **kwargs: 关键字参数，其中的 on_output 回调会在父进程中接收工作进程推送的输出事件
+
+        Returns:
+            方法的返回值
+
+        Raises:
+            SessionWorkerError: 工作进程已退出或方法执行失败时
+        """
+        return self.call_with_timeout(None, target, method, *args, **kwargs)
+
+    def call_with_timeout(self, wait: Optional[float], target: str, method: str, *args, **kwargs) -> Any:
+        """
+        调用工作进程中对象的方法，超过指定时间没有返回时强制终止工作进程
+
+        Args:
+            wait: 等待返回的最长秒数，为空表示一直等待
+            target: 目标对象，"session" 或 "dataframes"
+            method: 方法名
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            方法的返回值
+
+        Raises:
+            SessionWorkerTimeout: 超时且工作进程已被终止时
+            SessionWorkerError: 工作进程已退出或方法执行失败时
+        """
+        self._lock.acquire()
+        return self._call_locked(wait, target, method, args, kwargs)
+
+    def call_if_idle(self, lock_wait: float, target: str, method: str, *args, **kwargs) -> Any:
+        """
+        调用工作进程中对象的方法，工作进程正忙时最多等待指定时间
+
+        Args:
+            lock_wait: 等待其他调用（例如正在执行的单元格）结束的最长秒数
+            target: 目标对象，"session" 或 "dataframes"
+            method: 方法名
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            方法的返回值
+
+        Raises:
+            SessionWorkerBusy: 等待超时，工作进程仍在处理其他调用时
+            SessionWorkerError: 工作进程已退出或方法执行失败时
+        """
+        if not self._lock.acquire(timeout=lock_wait):
+            raise SessionWorkerBusy(f"会话 {self.session_id} 正在执行代码，请稍后重试")
+        return self._call_locked(None, target, method, args, kwargs)
+
+    def _call_locked(self, wait: Optional[float], target: str, method: str, args: tuple, kwargs: dict) -> Any:
+        """在已获得调用锁的情况下发送调用并等待返回，返回前释放锁"""
+        on_output = kwargs.pop("on_output", None)
+        deadline = time.monotonic() + wait if wait else None
+        self._busy = True
+        try:
+            self._conn.send((target, method, args, kwargs, on_output is not None))
+            while True:
+                if deadline is not None and not self._conn.poll(max(deadline - time.monotonic(), 0)):
+                    self.kill()
+                    raise SessionWorkerTimeout(f"会话 {self.session_id} 的工作进程没有响应，已被终止")
+                status, payload = self._conn.recv()
+                if status != "event":
+                    break
+                on_output(payload)
+        except (EOFError, OSError, BrokenPipeError) as e:
+            raise SessionWorkerError(f"会话 {self.session_id} 的工作进程已退出: {e}")
+        finally:
+            self._busy = False
+            self._lock.release()
+        if status == "error":
+            raise payload
+        return payload
+
+    def interrupt(self) -> bool:
+        """
+        向工作进程发送中断信号，正在执行的代码会收到KeyboardInterrupt
+
+        Returns:
+            bool: 是否发送了中断信号
+        """
+        if not self._busy or not self.is_alive() or sys.platform == "win32":
+            return False
+        os.kill(self._process.pid, signal.SIGINT)
+        return True
+
+    def kill(self) -> None:
+        """立即终止工作进程"""
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        logger.warning(f"会话 {self.session_id} 的工作进程已被终止")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        关闭工作进程
+
+        Args:
+            timeout: 等待进程正常退出的秒数，超时后强制终止
+        """
+        try:
+            with self._lock:
+                self._conn.send(_CLOSE_COMMAND)
+        except (EOFError, OSError, BrokenPipeError):
+            pass
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout)
+        self._conn.close()
+        logger.info(f"会话 {self.session_id} 的工作进程已关闭")
+
+
+class _RemoteProxy:
+    """将方法调用转发到工作进程中对应对象的代理"""
+
+    def __init__(self, worker: SessionWorker, target: str, lock_wait: Optional[float] = None):
+        """
+        Args:
+            worker: 会话工作进程
+            target: 目标对象，"session" 或 "dataframes"
+            lock_wait: 工作进程正忙时等待的最长秒数，超过后抛出SessionWorkerBusy，为空表示一直等待
+        """
+        self._worker = worker
+        self._target = target
+        self._lock_wait = lock_wait
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def remote_method(*args, **kwargs):
+            if self._lock_wait is not None:
+                return self._worker.call_if_idle(self._lock_wait, self._target, name, *args, **kwargs)
+            return self._worker.call(self._target, name, *args, **kwargs)
+
+        remote_method.__name__ = name
+        return remote_method
+
+
+class RemoteDataFrameManager(_RemoteProxy):
+    """
+    工作进程中DataFrameManager的代理，DataFrame及其信息通过进程间通信返回
+
+    直接调用时等待工作进程空闲（执行器内部的调用，例如统计内存和清空）；
+    查询接口通过 reads 调用，工作进程正在执行单元格时等待 BUSY_LOCK_WAIT 秒后返回会话忙的错误。
+    """
+
+    def __init__(self, worker: SessionWorker):
+        super().__init__(worker, "dataframes")
+        self.reads = _RemoteProxy(worker, "dataframes", BUSY_LOCK_WAIT)
+
+
+class RemoteSessionEnvironment(_RemoteProxy):
+    """
+    运行在独立工作进程中的SessionEnvironment代理，接口与SessionEnvironment一致
+    """
+    def __init__(self, session_id: str):
+        """
+        启动工作进程并创建会话环境代理
+
+        Args:
+            session_id: 会话ID
+        """
+        worker = SessionWorker(session_id)
+        super().__init__(worker, "session")
+        self.session_id = session_id
+        self.worker = worker
+        self.df_manager = RemoteDataFrameManager(worker)
+
+    def execute(self, code: str, on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """
+        在工作进程中执行代码
+
+        工作进程内部会在超时后中断执行；如果中断后仍然没有响应（例如卡在C扩展调用中），
+        则强制终止工作进程，会话中的变量随之丢失。
+
+        Args:
+            code: 要执行的Python代码
+            on_output: 可选的输出回调
+            timeout: 执行超时时间（秒），为空或0表示不限制
+            profile: 是否开启详细性能分析
+
+        Returns:
+            Dict: 执行结果
+        """
+        wait = timeout + settings.EXECUTION_KILL_GRACE if timeout else None
+        try:
+            return self.worker.call_with_timeout(wait, "session", "execute", code,
+                                                 on_output=on_output, timeout=timeout, profile=profile)
+        except SessionWorkerTimeout:
+            return limit_exceeded_result(LIMIT_TIMEOUT, timeout, session_reset=True)
+        except SessionWorkerError:
+            if self.worker.is_alive():
+                raise
+            # 工作进程被系统终止（例如超出内存被OOM killer终止）
+            return limit_exceeded_result(LIMIT_WORKER_EXITED, session_reset=True)
+
+    def aggregate_raster(self, raster_id: str, x_range: Optional[List[float]] = None,
+                         y_range: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        在工作进程中按新的坐标范围重新聚合散点，工作进程正在执行单元格时返回会话忙的错误
+
+        Args:
+            raster_id: 散点数据ID
+            x_range: 横坐标范围
+            y_range: 纵坐标范围
+
+        Returns:
+            Optional[Dict]: 聚合结果，散点数据已失效时返回None
+        """
+        return self.worker.call_if_idle(BUSY_LOCK_WAIT, "session", "aggregate_raster", raster_id, x_range, y_range)
+
+    def bind(self, session_id: str) -> None:
+        """
+        将预先启动的工作进程分配给指定的会话
+
+        Args:
+            session_id: 会话ID
+        """
+        self.worker.call("session", "bind", session_id)
+        self.session_id = session_id
+        self.worker.session_id = session_id
+
+    def interrupt(self) -> bool:
+        """中断工作进程中正在执行的代码"""
+        return self.worker.interrupt()
+
+    def is_alive(self) -> bool:
+        """工作进程是否仍在运行"""
+        return self.worker.is_alive()
+
+    def close(self) -> None:
+        """关闭会话对应的工作进程"""
+        self.worker.close()
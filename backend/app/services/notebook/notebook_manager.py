@@ -1,10 +1,13 @@
 import json
+import logging
 import os
 from pathlib import Path
 from app.core.config import settings
 from app.services.notebook.notedata_loader import NoteDataLoader
 from app.services.code_executor.note_executor import get_executor
 
+logger = logging.getLogger(__name__)
+
 class NoteBookManager:
     def __init__(self):
         self.note_data_loader = NoteDataLoader()
@@ -31,15 +34,20 @@ class NoteBookManager:
             with open(file_path, "w", encoding="utf-8") as f:
                 json.dump(notebook, f, ensure_ascii=False, indent=2)
             
-            session_id = notebook.get("session_id", "")
-            code_executor = get_executor()
-            variables = code_executor.get_dataframes(session_id)
-            
-            self.note_data_loader.save_notedata(filename, variables)
-            
-            return {"status": "success"}
         except Exception as e:
             return {"status": "error", "message": f"保存笔记本失败: {str(e)}"}
+        
+        # 笔记本已保存，DataFrame保存失败或会话正忙时不影响保存结果
+        session_id = notebook.get("session_id", "")
+        try:
+            # DataFrame在其所在的进程中直接写入文件
+            saved = get_executor().save_dataframes(session_id, self.note_data_loader.get_data_path(filename))
+        except Exception as e:
+            logger.warning(f"保存笔记本 {filename} 的数据失败: {str(e)}")
+            saved = None
+        if saved is None:
+            return {"status": "success", "message": "笔记本已保存，数据未保存"}
+        return {"status": "success"}
 
     def rename_notebook(self, old_filename: str, new_filename: str):
         if not old_filename or not new_filename:
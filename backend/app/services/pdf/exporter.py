@@ -6,6 +6,7 @@ from weasyprint import HTML
 from jinja2 import Environment, FileSystemLoader
 from typing import Dict, List, Any, Optional
 from .code_formatter import format_python_code
+from app.services.code_executor.artifact_store import get_artifact_store
 
 class NotebookPDFExporter:
     def __init__(self, export_dir: Path):
@@ -43,7 +44,11 @@ class NotebookPDFExporter:
                 # 转换Markdown为HTML
                 cell_data["content_html"] = markdown2.markdown(cell["content"])
             else:
-                cell_data["output"] = cell.get("output", {})
+                output = dict(cell.get("output") or {})
+                if output.get("plot"):
+                    # 图片保存在产物目录中，替换为本地文件路径供PDF渲染读取
+                    output["plot"] = get_artifact_store().to_file_urls(output["plot"])
+                cell_data["output"] = output
                 
             cells.append(cell_data)
         return cells
@@ -0,0 +1,299 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routes.note_executor_routes import router
+from app.routes.dataframe_routes import router as dataframe_router
+from app.routes.artifact_routes import router as artifact_router
+
+app = FastAPI()
+app.include_router(router)
+app.include_router(dataframe_router)
+app.include_router(artifact_router)
+client = TestClient(app)
+
+def test_execute():
+    """测试执行代码接口"""
+    response = client.post("/api/execution/execute", json={"session_id": "test_routes", "code": "print(1 + 1)"})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["status"] == "success"
+    assert result["output"].strip() == "2"
+
+def test_execute_stream():
+    """测试通过WebSocket流式执行代码"""
+    code = "import time\nprint('start')\ntime.sleep(0.3)\nprint('end')"
+    with client.websocket_connect("/api/execution/ws") as websocket:
+        websocket.send_json({"session_id": "test_stream", "code": code})
+        first = websocket.receive_json()
+        assert first["type"] == "stream"
+        assert first["text"].startswith("start")
+        events = [first]
+        while True:
+            event = websocket.receive_json()
+            if event["type"] == "result":
+                break
+            events.append(event)
+        assert "".join(e["text"] for e in events) == "start\nend\n"
+        assert event["data"]["status"] == "success"
+        assert event["data"]["output"] == "start\nend\n"
+
+def test_execute_stream_batches_output():
+    """测试大量打印时输出被合并为有限的批次"""
+    code = "for i in range(10000):\n    print(i)"
+    with client.websocket_connect("/api/execution/ws") as websocket:
+        websocket.send_json({"session_id": "test_stream_batch", "code": code})
+        events = []
+        while True:
+            event = websocket.receive_json()
+            if event["type"] == "result":
+                break
+            events.append(event)
+    text = "".join(e["text"] for e in events)
+    assert text == "".join(f"{i}\n" for i in range(10000))
+    assert len(events) < 100
+
+def test_execute_stream_invalid_message():
+    """测试WebSocket收到无效的JSON时返回错误事件，连接可以继续使用"""
+    with client.websocket_connect("/api/execution/ws") as websocket:
+        websocket.send_text("{not json")
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"session_id": "test_stream_invalid", "code": "print(1)"})
+        event = websocket.receive_json()
+        while event["type"] != "result":
+            event = websocket.receive_json()
+        assert event["data"]["output"] == "1\n"
+
+def test_output_channel_released_when_closed():
+    """测试输出通道关闭后，等待推送的执行线程不再阻塞"""
+    import asyncio
+    from app.routes.note_executor_routes import OutputChannel
+
+    async def run():
+        channel = OutputChannel(1)
+        await asyncio.to_thread(channel.put, {"type": "stream", "text": "a"})
+        blocked = asyncio.ensure_future(asyncio.to_thread(channel.put, {"type": "stream", "text": "b"}))
+        await asyncio.sleep(0.1)
+        assert not blocked.done()
+        channel.close()
+        await asyncio.wait_for(blocked, 2)
+        # 队列已满，关闭后放入的事件直接丢弃
+        await asyncio.wait_for(asyncio.to_thread(channel.put, {"type": "stream", "text": "c"}), 2)
+
+    asyncio.run(run())
+
+def test_check_syntax():
+    """测试语法检查接口"""
+    response = client.post("/api/execution/check_syntax", json={"code": "def f(:\n    pass"})
+    result = response.json()
+    assert result["valid"] is False
+    assert result["error"]["line"] == 1
+    assert client.post("/api/execution/check_syntax", json={"code": "x = 1"}).json()["valid"] is True
+
+def test_execute_batch():
+    """测试批量执行单元格，失败后停止执行之后的单元格"""
+    cells = [
+        {"cell_id": "a", "code": "x = 1"},
+        {"cell_id": "b", "code": "print(x + 1)"},
+        {"cell_id": "c", "code": "raise ValueError('bad')"},
+        {"cell_id": "d", "code": "print('unreachable')"},
+    ]
+    response = client.post("/api/execution/batch", json={"session_id": "test_batch", "cells": cells})
+    data = response.json()["data"]
+    assert [item["cell_id"] for item in data["executed"]] == ["a", "b", "c"]
+    assert data["executed"][1]["result"]["output"].strip() == "2"
+    assert data["executed"][2]["result"]["status"] == "error"
+    assert data["skipped"] == ["d"]
+
+def test_execute_batch_stream():
+    """测试通过WebSocket批量执行单元格，输出事件附带单元格ID"""
+    cells = [{"cell_id": "a", "code": "print('one')"}, {"cell_id": "b", "code": "print('two')"}]
+    with client.websocket_connect("/api/execution/ws") as websocket:
+        websocket.send_json({"session_id": "test_batch_stream", "cells": cells})
+        events = []
+        while True:
+            event = websocket.receive_json()
+            if event["type"] == "result":
+                break
+            events.append(event)
+    # print 的内容和换行可能分成两个输出事件推送
+    kinds = [(e["type"], e["cell_id"]) for e in events]
+    assert [k for i, k in enumerate(kinds) if i == 0 or k != kinds[i - 1]] == [
+        ("cell_start", "a"), ("stream", "a"), ("cell_result", "a"),
+        ("cell_start", "b"), ("stream", "b"), ("cell_result", "b"),
+    ]
+    assert [item["result"]["output"].strip() for item in event["data"]["executed"]] == ["one", "two"]
+
+def test_large_scatter_rasterized_and_zoomed(monkeypatch):
+    """测试点数过多的散点聚合为热力图，缩放时按新的范围重新聚合"""
+    import json
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "PLOT_RASTER_THRESHOLD", 1000)
+    monkeypatch.setattr(settings, "PLOT_RASTER_WIDTH", 20)
+    monkeypatch.setattr(settings, "PLOT_RASTER_HEIGHT", 10)
+    code = (
+        "x = np.arange(100000) % 1000\n"
+        "go.Figure(go.Scattergl(x=x, y=x * 2.0, mode='markers')).show()"
+    )
+    response = client.post("/api/execution/execute", json={"session_id": "test_raster", "code": code})
+    result = response.json()
+    assert result["rasterized"] == [{"name": None, "points": 100000, "grid": [20, 10]}]
+    trace = json.loads(result["plotly_json"])["data"][0]
+    assert trace["type"] == "heatmap" and trace["z"]["shape"] == "10,20"
+    raster = trace["meta"]["raster"]
+
+    response = client.post("/api/execution/raster", json={**raster, "x_range": [0, 99.5], "y_range": [0, 2000]})
+    data = response.json()["data"]
+    assert data["points"] == 100 * 100 and data["dx"] == 99.5 / 20
+    assert data["z"]["dtype"] == "f4"
+
+    response = client.post("/api/execution/raster", json={**raster, "raster_id": "missing"})
+    assert response.json()["status"] == "error"
+
+def test_cell_profile():
+    """测试执行结果附带性能数据，并按会话汇总各单元格的执行统计"""
+    session = "test_profile"
+    fast = client.post("/api/execution/execute", json={"session_id": session, "cell_id": "fast", "code": "x = 1"}).json()
+    assert set(fast["profile"]) >= {"wall_time", "cpu_time"} and "top_functions" not in fast["profile"]
+
+    code = "def work():\n    import time\n    time.sleep(0.2)\n    return [0] * 1000000\ndata = work()"
+    slow = client.post("/api/execution/execute",
+                       json={"session_id": session, "cell_id": "slow", "code": code, "profile": True}).json()
+    assert slow["profile"]["wall_time"] >= 0.2
+    assert slow["profile"]["memory_peak_mb"] >= 7
+    assert any("work" in row["function"] for row in slow["profile"]["top_functions"])
+
+    summary = client.get("/api/execution/profile", params={"session_id": session}).json()["data"]
+    assert [cell["cell_id"] for cell in summary["cells"]] == ["slow", "fast"]
+    assert summary["cells"][0]["runs"] == 1 and summary["cells"][0]["max_memory_peak_mb"] >= 7
+    assert slow["profile"]["memory_peak_scope"] == "cell"
+    # 没有开启详细分析的单元格只有进程峰值内存的增加量
+    assert summary["cells"][1]["max_memory_peak_mb"] is None
+
+def test_profile_and_stale_queries_do_not_create_session_state():
+    """测试查询未知会话的执行统计和过期状态时返回空结果，不为该会话保留任何记录"""
+    from app.services.code_executor.note_executor import get_executor
+
+    session = "test_unknown_profile"
+    summary = client.get("/api/execution/profile", params={"session_id": session}).json()["data"]
+    assert summary["cells"] == []
+    stale = client.post("/api/execution/stale",
+                        json={"session_id": session, "cells": [{"cell_id": "a", "code": "x = 1"}]}).json()
+    assert stale["status"] == "success"
+    executor = get_executor()
+    assert session not in executor._profiles and session not in executor._graphs
+
+def test_stale_rejects_cells_without_id():
+    """测试单元格缺少 cell_id 时 /stale 和 /run_stale 返回400"""
+    body = {"session_id": "test_stale_invalid", "cells": [{"code": "x = 1"}]}
+    assert client.post("/api/execution/stale", json=body).status_code == 400
+    assert client.post("/api/execution/run_stale", json=body).status_code == 400
+
+def test_dataframe_rows_window():
+    """测试按位置分页读取大型DataFrame的行"""
+    code = (
+        "big = pd.DataFrame({'x': np.arange(3_000_000, dtype=float), 'y': 'v',"
+        " 't': pd.Timestamp('2024-01-01')})\n"
+        "big.loc[2_500_001, 'x'] = np.nan\nbig.loc[2_500_002, 'x'] = np.inf"
+    )
+    assert client.post("/api/execution/execute", json={"session_id": "test_rows", "code": code}).json()["status"] == "success"
+    response = client.get("/api/dataframes/rows", params={
+        "session_id": "test_rows", "name": "big", "offset": 2_500_000, "limit": 3, "columns": "x,t"
+    })
+    result = response.json()
+    assert result["status"] == "success"
+    data = result["data"]
+    assert data["total_rows"] == 3_000_000 and data["offset"] == 2_500_000
+    assert data["columns"] == ["x", "t"] and data["index"] == [2_500_000, 2_500_001, 2_500_002]
+    assert data["data"]["x"] == [2_500_000.0, None, None]
+    assert data["data"]["t"][0].startswith("2024-01-01")
+
+    last = client.get("/api/dataframes/rows", params={"session_id": "test_rows", "name": "big", "offset": 2_999_999}).json()
+    assert last["data"]["index"] == [2_999_999] and last["data"]["columns"] == ["x", "y", "t"]
+    missing = client.get("/api/dataframes/rows", params={"session_id": "test_rows", "name": "big", "columns": "z"}).json()
+    assert missing["status"] == "error"
+
+def test_dataframe_query_views_cached():
+    """测试DataFrame查询：过滤、排序、分组聚合，结果视图按版本缓存"""
+    from app.services.code_executor.note_executor import get_executor
+
+    code = "sales = pd.DataFrame({'city': ['a', 'b', 'a', 'c', 'b', 'a'], 'amount': [5, 3, 8, 1, None, 2]})"
+    client.post("/api/execution/execute", json={"session_id": "test_query", "code": code})
+    query = {"filters": [{"column": "amount", "op": ">=", "value": 2}], "sort": [{"column": "amount", "ascending": False}]}
+    body = {"session_id": "test_query", "name": "sales", "query": query, "limit": 2}
+    first = client.post("/api/dataframes/query", json=body).json()["data"]
+    assert first["total_rows"] == 4 and first["index"] == [2, 0] and first["data"]["amount"] == [8.0, 5.0]
+    second = client.post("/api/dataframes/query", json={**body, "offset": 2}).json()["data"]
+    assert second["index"] == [1, 5]
+    views = get_executor()._dataframes["test_query"]._query_views
+    assert views.misses == 2 and views.hits == 2
+
+    grouped = client.post("/api/dataframes/query", json={"session_id": "test_query", "name": "sales", "query": {
+        "group_by": ["city"], "aggregations": [{"column": "amount", "func": "sum", "name": "total"}],
+        "sort": [{"column": "total", "ascending": False}]
+    }}).json()["data"]
+    assert grouped["data"] == {"city": ["a", "b", "c"], "total": [15.0, 3.0, 1.0]}
+
+    # DataFrame被修改后视图重新计算
+    client.post("/api/execution/execute", json={"session_id": "test_query", "code": "sales['amount'] = sales['amount'] * 10"})
+    changed = client.post("/api/dataframes/query", json=body).json()["data"]
+    assert changed["data"]["amount"] == [80.0, 50.0]
+    invalid = client.post("/api/dataframes/query", json={**body, "query": {"filters": [{"column": "x", "op": "=="}]}}).json()
+    assert invalid["status"] == "error"
+
+def test_dataframe_rows_arrow_format(monkeypatch):
+    """测试通过 Accept 头请求Arrow IPC流，未安装 pyarrow 时返回JSON"""
+    import pytest
+    from app.services.code_executor import arrow_export
+
+    code = "events = pd.DataFrame({'t': pd.date_range('2024-01-01', periods=10, freq='h'), 'v': np.arange(10.0)})"
+    client.post("/api/execution/execute", json={"session_id": "test_arrow", "code": code})
+    params = {"session_id": "test_arrow", "name": "events", "offset": 8}
+    headers = {"Accept": arrow_export.ARROW_STREAM_MEDIA_TYPE}
+    with monkeypatch.context() as patch:
+        # 未安装 pyarrow 时返回JSON
+        patch.setattr(arrow_export, "pa", None)
+        response = client.get("/api/dataframes/rows", params=params, headers=headers)
+        assert response.json()["data"]["index"] == [8, 9]
+
+    pa = pytest.importorskip("pyarrow")
+    response = client.get("/api/dataframes/rows", params=params, headers=headers)
+    assert response.headers["content-type"] == arrow_export.ARROW_STREAM_MEDIA_TYPE
+    assert response.headers["X-Total-Rows"] == "10" and response.headers["X-Offset"] == "8"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.to_pandas()["v"].tolist() == [8.0, 9.0]
+
+def test_dataframe_info_special_values():
+    """测试DataFrame信息中的 NaN、无穷大、Timestamp 和 NumPy 标量按列转换为JSON"""
+    code = (
+        "special = pd.DataFrame({'x': [1.5, np.nan, np.inf], 'n': np.array([1, 2, 3], dtype=np.int64),"
+        " 't': [pd.Timestamp('2024-01-01 08:30'), pd.NaT, pd.Timestamp('2024-01-02')],"
+        " 'o': ['a', None, np.float64('nan')], 'i': pd.array([1, None, 3], dtype='Int64')})"
+    )
+    client.post("/api/execution/execute", json={"session_id": "test_info", "code": code})
+    result = client.get("/api/dataframes/info", params={"session_id": "test_info", "name": "special"}).json()
+    assert result["status"] == "success"
+    head = result["data"]["preview"]["head"]
+    assert [row["x"] for row in head] == [1.5, None, None]
+    assert [row["n"] for row in head] == [1, 2, 3]
+    assert [row["t"] for row in head] == ["2024-01-01T08:30:00", None, "2024-01-02T00:00:00"]
+    assert [row["o"] for row in head] == ["a", None, None]
+    assert [row["i"] for row in head] == [1, None, 3]
+    summary = result["data"]["preview"]["summary"]
+    assert summary["x"]["count"] == 2.0 and summary["x"]["mean"] is None
+
+def test_artifact_conditional_request(monkeypatch, tmp_path):
+    """测试 If-None-Match 按逗号分隔的ETag逐个比较"""
+    from app.services.code_executor import artifact_store
+    from app.services.code_executor.artifact_store import ArtifactStore
+
+    store = ArtifactStore(tmp_path)
+    monkeypatch.setattr(artifact_store, "_artifact_store", store)
+    artifact_id = store.put(b"image", "png")
+    url = store.url(artifact_id)
+    etag = client.get(url).headers["etag"]
+    for header in (etag, f'"other", W/{etag}', "*"):
+        assert client.get(url, headers={"If-None-Match": header}).status_code == 304
+    # 与ETag不完全相同的值不匹配
+    for header in (f'"x{artifact_id}"', f'"{artifact_id[:10]}"', '"other"'):
+        response = client.get(url, headers={"If-None-Match": header})
+        assert response.status_code == 200 and response.content == b"image"
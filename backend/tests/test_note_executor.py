@@ -0,0 +1,890 @@
+from app.core.config import settings
+from app.services.code_executor.note_executor import NoteExecutor
+from app.services.code_executor.session_worker import RemoteSessionEnvironment
+
+def test_execute_inprocess():
+    """测试在服务进程内执行代码"""
+    executor = NoteExecutor()
+    result = executor.execute("test_inprocess", "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2, 3]})\nprint(len(df))")
+    assert result["status"] == "success"
+    assert result["output"].strip() == "3"
+    assert executor.get_dataframes_names("test_inprocess") == ["df"]
+    executor.shutdown()
+
+def test_execute_in_worker_process(monkeypatch):
+    """测试在独立工作进程中执行代码"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    try:
+        session = executor.get_or_create_session("test_process")
+        assert isinstance(session, RemoteSessionEnvironment)
+        result = executor.execute("test_process", "import os\ndf = pd.DataFrame({'a': [1, 2]})\nprint(os.getpid())")
+        assert result["status"] == "success"
+        assert int(result["output"]) == session.worker.pid
+        assert executor.get_dataframes_names("test_process") == ["df"]
+        assert executor.get_dataframe("test_process", "df")["a"].tolist() == [1, 2]
+        assert executor.get_dataframes_names("other_session") == {}
+    finally:
+        executor.shutdown()
+    assert not session.worker.is_alive()
+
+def test_dataframe_preview_and_dump_in_worker_process(monkeypatch, tmp_path):
+    """测试预览和保存DataFrame在工作进程中完成，不把整个DataFrame传回服务进程"""
+    import pickle
+
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    try:
+        executor.execute("test_process_preview", "df = pd.DataFrame({'a': range(100), 'b': [1.5, None] * 50})")
+        preview = executor.get_dataframe_preview("test_process_preview", "df")
+        assert preview["shape"] == [100, 2] and preview["columns"] == {"a": "int64", "b": "float64"}
+        assert preview["sample_data"] == {"a": [0, 1, 2, 3, 4], "b": [1.5, None, 1.5, None, 1.5]}
+        assert executor.get_dataframe_preview("test_process_preview", "missing") is None
+
+        path = tmp_path / "notebook.dat"
+        assert executor.save_dataframes("test_process_preview", path) == ["df"]
+        with open(path, "rb") as f:
+            assert pickle.load(f)["df"]["a"].sum() == 4950
+    finally:
+        executor.shutdown()
+
+def test_save_dataframes_skips_unpicklable(tmp_path):
+    """测试保存DataFrame时跳过无法序列化的DataFrame，其余DataFrame正常保存"""
+    import pickle
+
+    executor = NoteExecutor()
+    executor.execute("test_dump_skip", "import threading\nok = pd.DataFrame({'a': [1]})\nbad = pd.DataFrame({'a': [threading.Lock()]})")
+    path = tmp_path / "notebook.dat"
+    assert executor.save_dataframes("test_dump_skip", path) == ["ok"]
+    executor.shutdown()
+    with open(path, "rb") as f:
+        assert list(pickle.load(f)) == ["ok"]
+    assert not (tmp_path / "notebook.dat.tmp").exists()
+
+def test_dataframe_calls_fail_fast_while_worker_busy(monkeypatch, tmp_path):
+    """测试工作进程执行单元格时，读取DataFrame的调用很快返回会话忙的错误而不是等待执行结束"""
+    import threading
+    import time
+    import pytest
+    from app.services.code_executor.session_worker import SessionWorkerBusy
+
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    try:
+        executor.execute("test_process_busy", "df = pd.DataFrame({'a': [1, 2]})")
+        busy = threading.Thread(target=executor.execute, args=("test_process_busy", "import time\ntime.sleep(5)"))
+        busy.start()
+        time.sleep(1)
+        start = time.perf_counter()
+        with pytest.raises(SessionWorkerBusy):
+            executor.get_dataframe_preview("test_process_busy", "df")
+        assert time.perf_counter() - start < 3
+        # 保存笔记本时工作进程正忙，本次不保存DataFrame
+        assert executor.save_dataframes("test_process_busy", tmp_path / "busy.dat") is None
+        busy.join()
+        assert executor.get_dataframe_preview("test_process_busy", "df")["shape"] == [2, 1]
+    finally:
+        executor.shutdown()
+
+def test_execute_waits_for_slow_dataframe_call(monkeypatch):
+    """测试查询接口的调用占用工作进程超过等待时间时，单元格执行仍正常完成并记录执行情况"""
+    import threading
+    import time
+
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    try:
+        session = executor.get_or_create_session("test_process_overlap")
+        # 模拟一个耗时较长的查询调用占用工作进程
+        session.worker._lock.acquire()
+        releaser = threading.Timer(1.5, session.worker._lock.release)
+        releaser.start()
+        start = time.perf_counter()
+        result = executor.execute("test_process_overlap", "df = pd.DataFrame({'a': [1, 2]})", cell_id="c1")
+        releaser.join()
+        assert time.perf_counter() - start >= 1.5
+        assert result["status"] == "success"
+        assert executor.get_session_profile("test_process_overlap").summary()["cells"][0]["cell_id"] == "c1"
+        assert executor.get_dataframes_names("test_process_overlap") == ["df"]
+    finally:
+        executor.shutdown()
+
+def test_execute_async_sessions_run_concurrently():
+    """测试不同会话并发执行且输出互不串扰，同一会话按顺序执行"""
+    import asyncio
+    import time
+
+    executor = NoteExecutor()
+    code = "import time\nfor i in range(5):\n    print('{name}', i)\n    time.sleep(0.1)"
+
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            executor.execute_async("session_a", code.format(name="a")),
+            executor.execute_async("session_b", code.format(name="b")),
+        )
+        return results, time.perf_counter() - start
+
+    (result_a, result_b), elapsed = asyncio.run(run())
+    executor.shutdown()
+    assert elapsed < 0.9
+    assert result_a["output"].split() == [x for i in range(5) for x in ("a", str(i))]
+    assert result_b["output"].split() == [x for i in range(5) for x in ("b", str(i))]
+
+def test_execute_async_keeps_session_order():
+    """测试同一会话中的单元格按提交顺序执行"""
+    import asyncio
+
+    executor = NoteExecutor()
+
+    async def run():
+        return await asyncio.gather(
+            executor.execute_async("session_order", "import time\ntime.sleep(0.2)\nx = 1"),
+            executor.execute_async("session_order", "print(x)"),
+        )
+
+    _, result = asyncio.run(run())
+    executor.shutdown()
+    assert result["output"].strip() == "1"
+
+def test_execute_with_output_callback_in_worker_process(monkeypatch):
+    """测试工作进程中的输出事件被实时转发到父进程"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    events = []
+    try:
+        result = executor.execute("test_process_stream", "print('a')\nimport sys\nprint('b', file=sys.stderr)", on_output=events.append)
+    finally:
+        executor.shutdown()
+    assert "".join(e["text"] for e in events if e["name"] == "stdout") == "a\n"
+    assert "".join(e["text"] for e in events if e["name"] == "stderr") == "b\n"
+    assert result["error"] == "b\n"
+
+def test_execute_timeout():
+    """测试单元格执行超时后返回超出限制的结果"""
+    executor = NoteExecutor()
+    result = executor.execute("test_timeout", "x = 1\nprint('before')\nwhile True:\n    pass", timeout=0.5)
+    assert result["status"] == "limit_exceeded"
+    assert result["limit_exceeded"]["type"] == "timeout"
+    assert result["output"].startswith("before\n")
+    # 中断后会话状态保留，可以继续执行
+    assert executor.execute("test_timeout", "print(x)")["output"].strip() == "1"
+    executor.shutdown()
+
+def test_profile_after_timeout():
+    """测试超时中断后，同一线程上开启性能分析的执行能正常结束"""
+    executor = NoteExecutor()
+    assert executor.execute("test_timeout_profile", "while True:\n    pass", timeout=0.5)["status"] == "limit_exceeded"
+    result = executor.execute("test_timeout_profile", "x = 1", profile=True)
+    executor.shutdown()
+    assert result["status"] == "success"
+    assert "top_functions" in result["profile"]
+
+def test_interrupt_arriving_after_code_finished(monkeypatch):
+    """测试代码刚执行完、结束执行状态之前到达的中断按被中断处理，且不会在之后的代码中抛出"""
+    import threading
+
+    executor = NoteExecutor()
+    session = executor.get_or_create_session("test_late_interrupt")
+    finish_exec = session._finish_exec
+    calls = []
+
+    def late_interrupt(interrupted=False):
+        if not calls:
+            # 像超时定时器一样从其他线程发出中断
+            sender = threading.Thread(target=lambda: calls.append(session.interrupt()))
+            sender.start()
+            sender.join()
+        finish_exec(interrupted)
+
+    monkeypatch.setattr(session, "_finish_exec", late_interrupt)
+    result = executor.execute("test_late_interrupt", "x = 1")
+    assert calls == [True]
+    assert result["status"] == "limit_exceeded"
+    assert result["limit_exceeded"]["type"] == "interrupted"
+    monkeypatch.undo()
+    assert executor.execute("test_late_interrupt", "print(x)")["output"].strip() == "1"
+    executor.shutdown()
+
+def test_interrupt():
+    """测试中断正在执行的单元格，不影响其他会话"""
+    import asyncio
+
+    executor = NoteExecutor()
+
+    async def run():
+        busy = asyncio.ensure_future(executor.execute_async("test_interrupt", "while True:\n    pass"))
+        other = asyncio.ensure_future(executor.execute_async("test_interrupt_other", "import time\ntime.sleep(1)\nprint('done')"))
+        # 等待单元格开始执行后再中断
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if executor.interrupt("test_interrupt"):
+                break
+        return await busy, await other
+
+    busy, other = asyncio.run(run())
+    executor.shutdown()
+    assert busy["limit_exceeded"]["type"] == "interrupted"
+    assert other["output"].strip() == "done"
+    assert not executor.interrupt("test_interrupt")
+
+def test_profile_after_interrupt():
+    """测试中断后，同一会话中开启性能分析的执行能正常结束并记录函数耗时"""
+    import asyncio
+
+    executor = NoteExecutor()
+    session = "test_interrupt_profile"
+
+    async def run():
+        busy = asyncio.ensure_future(executor.execute_async(session, "while True:\n    pass"))
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if executor.interrupt(session):
+                break
+        interrupted = await busy
+        code = "def work():\n    return sum(range(1000))\nx = work()"
+        profiled = await asyncio.wait_for(executor.execute_async(session, code, profile=True), timeout=30)
+        return interrupted, profiled
+
+    interrupted, profiled = asyncio.run(run())
+    executor.shutdown()
+    assert interrupted["limit_exceeded"]["type"] == "interrupted"
+    assert profiled["status"] == "success"
+    assert any("work" in row["function"] for row in profiled["profile"]["top_functions"])
+
+def test_worker_process_timeout(monkeypatch):
+    """测试工作进程中阻塞的单元格超时后被中断"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    executor = NoteExecutor()
+    try:
+        executor.execute("test_process_timeout", "x = 1")
+        result = executor.execute("test_process_timeout", "import time\ntime.sleep(30)", timeout=0.5)
+        assert result["limit_exceeded"] == {"type": "timeout", "limit": 0.5, "session_reset": False}
+        assert executor.execute("test_process_timeout", "print(x)")["output"].strip() == "1"
+    finally:
+        executor.shutdown()
+
+def test_worker_process_killed_when_unresponsive(monkeypatch):
+    """测试中断无效时工作进程被终止，会话随后重新创建"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    monkeypatch.setattr(settings, "EXECUTION_KILL_GRACE", 0.5)
+    executor = NoteExecutor()
+    try:
+        executor.execute("test_process_kill", "import signal\nsignal.signal(signal.SIGINT, signal.SIG_IGN)\nx = 1")
+        result = executor.execute("test_process_kill", "import time\ntime.sleep(30)", timeout=0.5)
+        assert result["limit_exceeded"]["session_reset"]
+        assert executor.execute("test_process_kill", "print(1)")["status"] == "success"
+        assert executor.execute("test_process_kill", "print(x)")["status"] == "error"
+    finally:
+        executor.shutdown()
+
+def test_worker_process_memory_limit(monkeypatch):
+    """测试工作进程超出内存限制时返回超出限制的结果"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    # 工作进程在启动时从环境变量读取配置
+    monkeypatch.setenv("SESSION_MEMORY_LIMIT_MB", "2048")
+    executor = NoteExecutor()
+    try:
+        result = executor.execute("test_process_memory", "import numpy as np\na = np.ones(4 * 1024 ** 3, dtype='uint8')")
+        assert result["limit_exceeded"]["type"] == "memory"
+        assert executor.execute("test_process_memory", "print(1)")["status"] == "success"
+    finally:
+        executor.shutdown()
+
+def test_reap_idle_sessions(monkeypatch):
+    """测试空闲超时的会话被回收并记录回收原因"""
+    import time
+
+    monkeypatch.setattr(settings, "SESSION_IDLE_TIMEOUT", 0.2)
+    executor = NoteExecutor()
+    executor.execute("test_idle", "x = 1")
+    time.sleep(0.3)
+    executor.execute("test_active", "y = 1")
+    assert executor.reap_sessions() == ["test_idle"]
+    metrics = executor.get_metrics()
+    assert [s["session_id"] for s in metrics["sessions"]] == ["test_active"]
+    assert metrics["evictions"][0]["session_id"] == "test_idle"
+    assert metrics["evictions"][0]["reason"] == "idle"
+    executor.shutdown()
+
+def test_memory_budget_evicts_least_recently_used(monkeypatch):
+    """测试超出内存预算时回收最久未使用的会话"""
+    monkeypatch.setattr(settings, "SESSION_MEMORY_BUDGET_MB", 20)
+    executor = NoteExecutor()
+    code = "import numpy as np\ndf = pd.DataFrame({'a': np.zeros(1024 ** 2)})"
+    executor.execute("test_lru_1", code)
+    executor.execute("test_lru_2", code)
+    executor.execute("test_lru_1", "print(len(df))")
+    executor.execute("test_lru_3", code)
+    metrics = executor.get_metrics()
+    assert [s["session_id"] for s in metrics["sessions"]] == ["test_lru_3", "test_lru_1"]
+    assert metrics["evictions"][0]["session_id"] == "test_lru_2"
+    assert metrics["evictions"][0]["reason"] == "memory"
+    assert metrics["evictions"][0]["memory_mb"] == 8.0
+    executor.shutdown()
+
+def test_evicted_session_restored_from_snapshot(monkeypatch):
+    """测试被回收的会话在下次使用时从快照恢复，DataFrame延迟加载"""
+    import time
+    from app.services.code_executor.session_snapshot import SpilledDataFrame
+
+    monkeypatch.setattr(settings, "SESSION_IDLE_TIMEOUT", 0.1)
+    executor = NoteExecutor()
+    executor.execute("test_spill", "import json\nx = 42\ndf = pd.DataFrame({'a': [1, 2, 3]})\ndef f(): pass")
+    time.sleep(0.2)
+    executor.reap_sessions()
+    eviction = executor.get_metrics()["evictions"][0]
+    assert eviction["session_id"] == "test_spill" and eviction["spilled"]
+
+    session = executor.get_or_create_session("test_spill")
+    assert isinstance(dict.get(session.locals_dict, "df"), SpilledDataFrame)
+    assert "f" not in session.locals_dict
+    result = executor.execute("test_spill", "print(x, df['a'].sum(), json.dumps([1]))")
+    assert result["output"].strip() == "42 6 [1]"
+
+    executor.reset_session("test_spill")
+    assert not executor._snapshot_dir("test_spill").exists()
+    executor.shutdown()
+
+def test_snapshot_not_restored_after_worker_killed(monkeypatch, tmp_path):
+    """测试快照只恢复一次，工作进程被终止后重新创建的会话不会恢复旧的变量"""
+    import time
+
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    monkeypatch.setattr(settings, "TEMP_DIR", tmp_path)
+    monkeypatch.setattr(settings, "SESSION_IDLE_TIMEOUT", 0.1)
+    executor = NoteExecutor()
+    try:
+        executor.execute("test_respill", "x = 42\ndf = pd.DataFrame({'a': [1, 2, 3]})")
+        time.sleep(0.2)
+        executor.reap_sessions()
+        session = executor.get_or_create_session("test_respill")
+        assert executor.execute("test_respill", "print(x)")["output"].strip() == "42"
+        assert not executor._snapshot_dir("test_respill").exists()
+
+        session.worker.kill()
+        result = executor.execute("test_respill", "print('x' in dir(), 'df' in dir())")
+        assert result["output"].strip() == "False False"
+        assert executor.get_dataframes_names("test_respill") == []
+        assert not executor._restored_dir("test_respill").exists()
+    finally:
+        executor.shutdown()
+
+def test_session_created_once_concurrently():
+    """测试同一会话同时被多个线程首次使用时只创建一次"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = NoteExecutor()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sessions = list(pool.map(lambda _: executor.get_or_create_session("test_concurrent_create"), range(16)))
+    assert all(session is sessions[0] for session in sessions)
+    executor.shutdown()
+
+def test_unchanged_dataframes_not_reprofiled():
+    """测试只有新增或被修改的DataFrame才会重新统计信息"""
+    executor = NoteExecutor()
+    executor.execute("test_dirty", "df = pd.DataFrame({'a': range(1000)})\nother = pd.DataFrame({'b': [1]})")
+    df_manager = executor._dataframes["test_dirty"]
+    assert df_manager.get_version("df") == 1
+    executor.execute("test_dirty", "print(1)")
+    assert df_manager.get_version("df") == 1
+    executor.execute("test_dirty", "df.loc[0, 'a'] = -1")
+    assert df_manager.get_version("df") == 2
+    executor.execute("test_dirty", "df['c'] = 1")
+    assert df_manager.get_version("df") == 3
+    assert df_manager.get_dataframe_info("df")["basic_info"]["列数"] == 2
+    assert df_manager.get_version("other") == 1
+    executor.shutdown()
+
+def test_dataframe_profile_computed_on_demand():
+    """测试DataFrame统计信息按层按需计算，并在DataFrame变更前保持缓存"""
+    executor = NoteExecutor()
+    executor.execute("test_profile", "df = pd.DataFrame({'a': [1.0, None, 3.0], 'b': ['x', 'y', None]})")
+    df_manager = executor._dataframes["test_profile"]
+    info = executor.get_dataframe_info("test_profile", "df", ["basic"])
+    assert info["basic_info"]["行数"] == 3
+    assert "preview" not in info and "null_count" not in info["columns"][0]
+
+    profile = df_manager.get_dataframe_profile("df", ["nulls", "summary"])
+    assert profile["nulls"] == {"a": 1, "b": 1}
+    assert df_manager.get_dataframe_profile("df", ["summary"])["summary"] is profile["summary"]
+
+    executor.execute("test_profile", "df = df.dropna()")
+    info = executor.get_dataframe_info("test_profile", "df")
+    assert info["basic_info"]["行数"] == 1
+    assert [c["null_count"] for c in info["columns"]] == [0, 0]
+    assert info["preview"]["head"] == [{"a": 1.0, "b": "x"}]
+    assert executor.get_dataframe_info("test_profile", "missing") is None
+    executor.shutdown()
+
+def test_dataframe_reads_wait_for_running_cell():
+    """测试inprocess模式下读取DataFrame的接口等待正在执行的单元格结束"""
+    import asyncio
+
+    executor = NoteExecutor()
+    executor.execute("test_read_lock", "df = pd.DataFrame({'a': range(10)})")
+
+    async def run():
+        cell = asyncio.ensure_future(executor.execute_async(
+            "test_read_lock", "import time\ndf['b'] = 0\ntime.sleep(0.3)\ndf['c'] = 1"))
+        await asyncio.sleep(0.1)
+        info = await executor.read_in_session("test_read_lock", executor.get_dataframe_info,
+                                              "test_read_lock", "df", ["basic"])
+        await cell
+        return info
+
+    info = asyncio.run(run())
+    executor.shutdown()
+    assert [c["name"] for c in info["columns"]] == ["a", "b", "c"]
+
+def test_pending_prefetch_cancelled_on_execute():
+    """测试执行单元格前取消尚未开始的DataFrame后台统计"""
+    import threading
+    from app.services.code_executor.dataframe_manager import _get_profile_pool
+
+    executor = NoteExecutor()
+    executor.execute("test_prefetch", "df = pd.DataFrame({'a': range(10)})")
+    df_manager = executor._dataframes["test_prefetch"]
+    df_manager.cancel_prefetches()
+    df_manager._profiles.clear()
+
+    release = threading.Event()
+    blocker = _get_profile_pool().submit(release.wait, 10)
+    df_manager.prefetch_profiles(["df"], ["basic"])
+    (pending,) = df_manager._prefetches
+    executor.execute("test_prefetch", "df['b'] = 1")
+    release.set()
+    blocker.result()
+    assert pending.cancelled()
+    assert not df_manager._prefetches
+    executor.shutdown()
+
+def test_compiled_code_cache():
+    """测试重复执行的代码使用缓存的编译结果，语法错误在执行前返回"""
+    from app.services.code_executor.code_cache import get_code_cache
+
+    cache = get_code_cache()
+    cache.clear()
+    executor = NoteExecutor()
+    for _ in range(3):
+        success = executor.execute("test_code_cache", "x = 1\nprint(x)")
+        assert success["status"] == "success"
+    assert cache.get_stats()["hits"] == 2 and cache.get_stats()["misses"] == 1
+
+    result = executor.execute("test_code_cache", "print('ran')\nx = (")
+    assert result["status"] == "error"
+    # 语法错误的结果与正常执行的结果字段一致
+    assert set(result) == set(success)
+    assert result["output_truncated"] is None and result["reclaimed"]["dataframes"] == []
+    assert "SyntaxError" in result["error"] and "ran" not in result["output"]
+    assert executor.check_syntax("x = (")["line"] == 1
+    assert executor.check_syntax("x = 1") is None
+    executor.shutdown()
+
+def test_analyze_cell_symbols():
+    """测试静态分析单元格定义和使用的变量"""
+    from app.services.code_executor.dependency_graph import analyze_cell
+
+    symbols = analyze_cell("import numpy as np\ndf = load(path)\ndf['b'] = df['a'] * k\nsquares = [x * x for x in df['b']]\ndef f(y):\n    return y + offset")
+    assert symbols.defs == {"np", "df", "squares", "f"}
+    assert symbols.uses == {"load", "path", "k", "offset"}
+    assert analyze_cell("raw.dropna(inplace=True)").defs == {"raw"}
+    assert analyze_cell("x = (") is None
+
+def test_run_stale_only_reruns_downstream_cells():
+    """测试只重新执行代码被修改的单元格及其下游单元格"""
+    import asyncio
+
+    executor = NoteExecutor()
+    cells = [
+        {"cell_id": "load", "code": "loads = globals().get('loads', 0) + 1\ndf = pd.DataFrame({'a': [1, 2, 3]})"},
+        {"cell_id": "scale", "code": "k = 2"},
+        {"cell_id": "plot", "code": "total = df['a'].sum() * k\nprint(total)"},
+        {"cell_id": "other", "code": "y = 1"},
+    ]
+    first = asyncio.run(executor.run_stale("test_stale", cells))
+    assert [item["cell_id"] for item in first["executed"]] == ["load", "scale", "plot", "other"]
+    assert executor.plan_stale("test_stale", cells)[2]["depends_on"] == ["load", "scale"]
+
+    cells[1]["code"] = "k = 10"
+    second = asyncio.run(executor.run_stale("test_stale", cells))
+    assert [item["cell_id"] for item in second["executed"]] == ["scale", "plot"]
+    assert second["executed"][1]["result"]["output"].strip() == "60"
+
+    cells[1]["code"] = "k = undefined_name"
+    third = asyncio.run(executor.run_stale("test_stale", cells))
+    assert [item["cell_id"] for item in third["executed"]] == ["scale"]
+    assert third["skipped"] == ["plot"]
+    assert asyncio.run(executor.run_stale("test_stale", cells))["executed"][0]["cell_id"] == "scale"
+    assert executor.execute("test_stale", "print(loads)")["output"].strip() == "1"
+    executor.shutdown()
+
+def test_figures_isolated_between_concurrent_sessions():
+    """测试并发执行的会话各自捕获自己创建的全部图形"""
+    import asyncio
+
+    executor = NoteExecutor()
+    code = (
+        "import time\n"
+        "for i in range({count}):\n"
+        "    plt.figure()\n"
+        "    plt.plot([1, 2, i])\n"
+        "    time.sleep(0.1)\n"
+        "print(len(plt.get_fignums()))"
+    )
+
+    async def run():
+        return await asyncio.gather(
+            executor.execute_async("figures_a", code.format(count=2)),
+            executor.execute_async("figures_b", code.format(count=3)),
+        )
+
+    result_a, result_b = asyncio.run(run())
+    assert result_a["output"].strip() == "2" and result_a["plot"].count("<img") == 2
+    assert result_b["output"].strip() == "3" and result_b["plot"].count("<img") == 3
+    assert executor.execute("figures_a", "print(plt.get_fignums())")["output"].strip() == "[]"
+    executor.shutdown()
+
+def test_figures_saved_as_artifacts(monkeypatch, tmp_path):
+    """测试图形按内容保存到产物目录，相同的图形只保存一次"""
+    from app.services.code_executor import artifact_store
+    from app.services.code_executor.artifact_store import ArtifactStore
+
+    store = ArtifactStore(tmp_path)
+    monkeypatch.setattr(artifact_store, "_artifact_store", store)
+    monkeypatch.setattr(settings, "FIGURE_FORMAT", "svg")
+    executor = NoteExecutor()
+    code = "plt.plot([1, 2, 3])\nplt.title('a')"
+    first = executor.execute("artifacts", code)["plot"]
+    second = executor.execute("artifacts", code)["plot"]
+    assert first == second and "base64" not in first
+    artifact_id = first.split(artifact_store.ARTIFACT_URL_PREFIX)[1].split('"')[0]
+    assert artifact_id.endswith(".svg")
+    assert store.get_path(artifact_id).read_bytes().lstrip().startswith(b"<?xml")
+    assert len(list(tmp_path.glob("*/*"))) == 1
+    assert store.get_path("../" + artifact_id) is None
+    assert str(tmp_path) in store.to_file_urls(first)
+
+    monkeypatch.setattr(settings, "FIGURE_INLINE", True)
+    assert "data:image/svg+xml;base64," in executor.execute("artifacts", code)["plot"]
+    executor.shutdown()
+
+def test_artifacts_swept_by_age_and_size(monkeypatch, tmp_path):
+    """测试回收任务删除超过保留时间的产物，总大小超出上限时删除最久未使用的产物"""
+    import os
+    import time
+    from app.services.code_executor import artifact_store
+    from app.services.code_executor.artifact_store import ArtifactStore
+
+    store = ArtifactStore(tmp_path)
+    monkeypatch.setattr(artifact_store, "_artifact_store", store)
+    now = time.time()
+    ids = [store.put(bytes([i]) * 1000, "png") for i in range(4)]
+    for age, artifact_id in zip((4000, 300, 200, 100), ids):
+        os.utime(store._path(artifact_id), (now - age, now - age))
+    # 使用产物会更新使用时间
+    store.get_path(ids[1])
+    stale_tmp = tmp_path / ids[0][:2] / "x.tmp"
+    stale_tmp.write_bytes(b"")
+    os.utime(stale_tmp, (now - 4000, now - 4000))
+
+    assert store.sweep(max_bytes=2500, max_age=3600) == 2
+    assert store.get_path(ids[0]) is None and store.get_path(ids[2]) is None
+    assert store.get_path(ids[1]) is not None and store.get_path(ids[3]) is not None
+    assert not stale_tmp.exists()
+
+    # 回收任务使用配置的上限，两者都为0时不删除
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_DAYS", 0)
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_MB", 0)
+    executor = NoteExecutor()
+    assert executor.sweep_artifacts() == 0
+    for artifact_id in (ids[1], ids[3]):
+        os.utime(store._path(artifact_id), (now - 4000, now - 4000))
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_DAYS", 3600 / 86400)
+    assert executor.sweep_artifacts() == 2
+    executor.shutdown()
+
+def test_plotly_figure_serialized_with_typed_arrays():
+    """测试plotly图形序列化为JSON，数值数组编码为类型化数组"""
+    import base64
+    import json
+    import numpy as np
+
+    executor = NoteExecutor()
+    code = (
+        "x = np.arange(1000)\n"
+        "fig = go.Figure(go.Heatmap(z=np.eye(3, dtype='float32')))\n"
+        "fig.add_scatter(x=x, y=x * 0.5, text=['a'] * 1000)\n"
+        "fig.show()"
+    )
+    result = executor.execute("plotly_json", code)
+    assert result["status"] == "success"
+    figure = json.loads(result["plotly_json"])
+    heatmap, scatter = figure["data"]
+    assert heatmap["z"]["dtype"] == "f4" and heatmap["z"]["shape"] == "3,3"
+    assert scatter["x"]["dtype"] == "i4"
+    y = np.frombuffer(base64.b64decode(scatter["y"]["bdata"]), dtype="<f8")
+    assert y.tolist() == (np.arange(1000) * 0.5).tolist()
+    assert scatter["text"] == ["a"] * 1000
+    assert figure["config"]["displaylogo"] is False
+    executor.shutdown()
+
+def test_large_line_plots_downsampled(monkeypatch):
+    """测试点数过多的折线在捕获图形时使用LTTB降采样"""
+    import json
+    import numpy as np
+    from app.services.code_executor.downsampling import lttb_indices
+
+    y = np.zeros(10000)
+    y[1234], y[8765] = 5.0, -5.0
+    indices = lttb_indices(np.arange(10000), y, 100)
+    assert len(indices) == 100 and indices[0] == 0 and indices[-1] == 9999
+    assert 1234 in indices and 8765 in indices
+
+    monkeypatch.setattr(settings, "PLOT_DOWNSAMPLE_THRESHOLD", 1000)
+    monkeypatch.setattr(settings, "PLOT_DOWNSAMPLE_POINTS", 200)
+    executor = NoteExecutor()
+    code = (
+        "t = pd.date_range('2024-01-01', periods=50000, freq='s')\n"
+        "v = np.sin(np.arange(50000) / 500)\n"
+        "plt.plot(t, v, label='sensor')\n"
+        "fig = go.Figure(go.Scatter(x=t, y=v, name='sensor', mode='lines'))\n"
+        "fig.add_scatter(x=t[:500], y=v[:500], name='short')\n"
+        "fig.show()"
+    )
+    result = executor.execute("downsample", code)
+    assert result["status"] == "success"
+    assert {(r["source"], r["name"], r["original_points"], r["points"]) for r in result["downsampled"]} == {
+        ("matplotlib", "sensor", 50000, 200), ("plotly", "sensor", 50000, 200)
+    }
+    figure = json.loads(result["plotly_json"])
+    assert len(figure["data"][0]["x"]) == 200 and len(figure["data"][1]["x"]) == 500
+    assert executor.execute("downsample", "print(len(fig.data[0].y))")["output"].strip() == "50000"
+    executor.shutdown()
+
+def test_sessions_taken_from_warm_pool(monkeypatch):
+    """测试新会话直接使用预热的工作进程，取走后在后台补充"""
+    monkeypatch.setattr(settings, "SESSION_MODE", "process")
+    monkeypatch.setattr(settings, "SESSION_POOL_SIZE", 1)
+    executor = NoteExecutor()
+    try:
+        executor.start_session_pool()
+        assert executor._session_pool.wait_ready(timeout=60)
+        pooled = executor._session_pool._ready[0][1]
+        session = executor.get_or_create_session("pooled")
+        assert session is pooled and session.session_id == "pooled"
+        result = executor.execute("pooled", "import os\nprint(os.getpid())")
+        assert int(result["output"]) == session.worker.pid
+        assert executor._session_pool.wait_ready(timeout=60)
+        assert executor.get_metrics()["session_pool"] == {"size": 1, "ready": 1}
+    finally:
+        executor.shutdown()
+    assert not session.worker.is_alive()
+
+def test_session_pool_not_started_by_constructor(monkeypatch):
+    """测试创建执行器时不预热会话，服务启动时才开始"""
+    monkeypatch.setattr(settings, "SESSION_POOL_SIZE", 1)
+    executor = NoteExecutor()
+    assert executor._session_pool._thread is None
+    assert executor.get_metrics()["session_pool"] == {"size": 1, "ready": 0}
+    executor.shutdown()
+
+def test_long_output_truncated_and_spilled(monkeypatch, tmp_path):
+    """测试过长的输出只保留开头和结尾，完整输出可以分页读取"""
+    monkeypatch.setattr(settings, "TEMP_DIR", tmp_path)
+    monkeypatch.setattr(settings, "OUTPUT_HEAD_CHARS", 1000)
+    monkeypatch.setattr(settings, "OUTPUT_TAIL_CHARS", 1000)
+    executor = NoteExecutor()
+    result = executor.execute("long_output", "for i in range(20000):\n    print(f'第{i}行')")
+    expected = "".join(f"第{i}行\n" for i in range(20000))
+    assert result["status"] == "success"
+    assert result["output"].startswith(expected[:1000]) and result["output"].endswith(expected[-1000:])
+    assert len(result["output"]) < 2100
+    truncated = result["output_truncated"]["stdout"]
+    assert truncated["total_chars"] == len(expected) and truncated["omitted_chars"] == len(expected) - 2000
+
+    text, offset, done = "", 0, False
+    while not done:
+        page = executor.read_output("long_output", truncated["output_id"], offset, 4099)
+        text, offset, done = text + page["text"], page["next_offset"], page["done"]
+    assert text == expected
+    assert executor.read_output("long_output", "../../etc/passwd") is None
+    assert executor.execute("long_output", "print('ok')")["output_truncated"] is None
+    executor.reset_session("long_output")
+    assert executor.read_output("long_output", truncated["output_id"]) is None
+    executor.shutdown()
+
+def test_spilled_output_pages_split_on_character_boundary(tmp_path):
+    """测试分页读取完整输出时页边界落在多字节字符中间也不会丢失或重复字符"""
+    import uuid
+    from app.services.code_executor.output_capture import read_spilled_output
+
+    expected = "".join(f"第{i}行：数据😀\n" for i in range(200))
+    output_id = uuid.uuid4().hex
+    (tmp_path / f"{output_id}.txt").write_bytes(expected.encode("utf-8"))
+    for limit in (4, 5, 7, 4096):
+        text, offset, done = "", 0, False
+        while not done:
+            page = read_spilled_output(tmp_path, output_id, offset, limit)
+            assert "\ufffd" not in page["text"]
+            assert page["next_offset"] > offset
+            text, offset, done = text + page["text"], page["next_offset"], page["done"]
+        assert text == expected
+
+def test_streamed_output_bounded(monkeypatch, tmp_path):
+    """测试流式推送的输出只包含开头和结尾部分"""
+    from app.services.code_executor.output_capture import STREAM_TRUNCATED_MARKER
+
+    monkeypatch.setattr(settings, "TEMP_DIR", tmp_path)
+    monkeypatch.setattr(settings, "OUTPUT_HEAD_CHARS", 1000)
+    monkeypatch.setattr(settings, "OUTPUT_TAIL_CHARS", 1000)
+    executor = NoteExecutor()
+    events = []
+    result = executor.execute("streamed_output", "for i in range(200000):\n    print(i)", on_output=events.append)
+    executor.shutdown()
+    expected = "".join(f"{i}\n" for i in range(200000))
+    assert result["output_truncated"]["stdout"]["total_chars"] == len(expected)
+    markers = [e for e in events if e.get("truncated")]
+    assert len(markers) == 1 and markers[0]["text"] == STREAM_TRUNCATED_MARKER
+    assert sum(len(e["text"]) for e in events) == 2000 + len(STREAM_TRUNCATED_MARKER)
+    assert "".join(e["text"] for e in events if not e.get("truncated")) == expected[:1000] + expected[-1000:]
+
+    # 超出开头部分但没有超出开头和结尾的总长度时，不推送截断提示，推送的内容与结果相同
+    executor = NoteExecutor()
+    events = []
+    result = executor.execute("streamed_output", "print('x' * 1500)", on_output=events.append)
+    executor.shutdown()
+    assert result["output_truncated"] is None
+    assert not any(e.get("truncated") for e in events)
+    assert "".join(e["text"] for e in events) == result["output"] == "x" * 1500 + "\n"
+
+def test_data_files_shared_between_sessions(monkeypatch, tmp_path):
+    """测试多个会话通过 load_data 读取同一个数据文件时共享解析后的数据"""
+    import numpy as np
+    from app.services.code_executor import data_cache
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(settings, "DATA_DIR", data_dir)
+    monkeypatch.setattr(data_cache, "_data_cache", data_cache.DataFileCache(64))
+    (data_dir / "sensor.csv").write_text("a,b\n1,2.5\n3,4.5\n")
+    executor = NoteExecutor()
+    assert executor.execute("data1", "df = load_data('sensor.csv')\ndf['c'] = df['a'] * 2")["status"] == "success"
+    assert executor.execute("data2", "df = load_data('data/sensor.csv', copy=False)")["status"] == "success"
+    (cached, _), = data_cache.get_data_cache()._cache.values()
+    first = executor.get_dataframe("data1", "df")
+    second = executor.get_dataframe("data2", "df")
+    assert np.shares_memory(cached["b"].to_numpy(), second["b"].to_numpy())
+    assert not np.shares_memory(cached["b"].to_numpy(), first["b"].to_numpy())
+    assert list(second.columns) == ["a", "b"]
+    assert executor.get_metrics()["data_cache"]["hits"] == 1
+
+    # 默认返回的拷贝可以原地修改，不影响缓存
+    result = executor.execute("data1", "df.loc[0, 'a'] = 100\nprint(df['a'][0], load_data('sensor.csv')['a'][0])")
+    assert result["status"] == "success" and result["output"].strip() == "100 1"
+    assert executor.execute("data2", "load_data('../secret.csv')")["status"] == "error"
+
+    (data_dir / "sensor.csv").write_text("a,b\n7,8.5\n")
+    assert executor.execute("data1", "print(len(load_data('sensor.csv')))")["output"].strip() == "1"
+    # 读取失败后不残留正在读取的记录
+    assert executor.execute("data1", "load_data('sensor.csv', usecols=['missing'])")["status"] == "error"
+    assert not data_cache.get_data_cache()._loading
+    executor.shutdown()
+
+def test_deleted_dataframes_released():
+    """测试变量被删除后DataFrame不再被跟踪，内存被释放"""
+    executor = NoteExecutor()
+    code = "big = pd.DataFrame({'a': np.arange(1_000_000)})\nalias = pd.DataFrame({'b': [1]})\nkeep = alias"
+    assert executor.execute("reclaim", code)["reclaimed"]["dataframes"] == []
+    executor.get_dataframe_info("reclaim", "big")
+    result = executor.execute("reclaim", "del big\ndel alias")
+    assert sorted(result["reclaimed"]["dataframes"]) == ["alias", "big"]
+    # alias 指向的DataFrame仍被 keep 引用，只有 big 的内存被释放
+    assert 7.5 < result["reclaimed"]["memory_mb"] < 8
+    assert executor.get_dataframes_names("reclaim") == ["keep"]
+    assert executor.get_dataframe_info("reclaim", "big") is None
+    session = next(s for s in executor.get_metrics()["sessions"] if s["session_id"] == "reclaim")
+    assert session["reclaimed"]["dataframes"] == 2 and session["memory_mb"] < 0.01
+    executor.shutdown()
+
+def test_artifacts_referenced_by_notebooks_kept(monkeypatch, tmp_path):
+    """测试回收任务保留已保存的笔记本和笔记本数据引用的产物"""
+    import json
+    import os
+    import pickle
+    import time
+    from app.services.code_executor import artifact_store
+    from app.services.code_executor.artifact_store import ArtifactStore
+
+    store = ArtifactStore(tmp_path / "artifacts")
+    monkeypatch.setattr(artifact_store, "_artifact_store", store)
+    for name in ("NOTEBOOKS_DIR", "NOTEDATAS_DIR", "EXPORT_DIR"):
+        (tmp_path / name).mkdir()
+        monkeypatch.setattr(settings, name, tmp_path / name)
+    now = time.time()
+    ids = [store.put(bytes([i]) * 1000, "png") for i in range(3)]
+    for artifact_id in ids:
+        os.utime(store._path(artifact_id), (now - 4000, now - 4000))
+    notebook = {"cells": [{"outputs": [{"data": {"text/html": f'<img src="{store.url(ids[0])}">'}}]}]}
+    (tmp_path / "NOTEBOOKS_DIR" / "a.ipynb").write_text(json.dumps(notebook))
+    (tmp_path / "NOTEDATAS_DIR" / "a.dat").write_bytes(pickle.dumps({"html": store.image_tag(bytes([1]) * 1000, "png")}))
+
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_DAYS", 3600 / 86400)
+    executor = NoteExecutor()
+    assert executor.sweep_artifacts() == 1
+    assert store.get_path(ids[0]) is not None and store.get_path(ids[1]) is not None
+    assert store.get_path(ids[2]) is None
+
+    # 笔记本不再引用产物后，产物可以被回收
+    (tmp_path / "NOTEBOOKS_DIR" / "a.ipynb").write_text(json.dumps({"cells": []}))
+    os.utime(store._path(ids[0]), (now - 4000, now - 4000))
+    assert executor.sweep_artifacts() == 1
+    assert store.get_path(ids[0]) is None
+    executor.shutdown()
+
+def test_artifacts_of_live_sessions_kept(monkeypatch, tmp_path):
+    """测试回收任务保留尚未删除的会话生成的产物（笔记本可能还没有保存）"""
+    import os
+    import time
+    from app.services.code_executor import artifact_store
+    from app.services.code_executor.artifact_store import ArtifactStore, artifact_ids
+
+    store = ArtifactStore(tmp_path / "artifacts")
+    monkeypatch.setattr(artifact_store, "_artifact_store", store)
+    for name in ("NOTEBOOKS_DIR", "NOTEDATAS_DIR", "EXPORT_DIR"):
+        monkeypatch.setattr(settings, name, tmp_path / name)
+    monkeypatch.setattr(settings, "FIGURE_INLINE", False)
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_DAYS", 3600 / 86400)
+    executor = NoteExecutor()
+    (produced,) = artifact_ids(executor.execute("live_artifacts", "plt.plot([1, 2, 3])")["plot"])
+    other = store.put(b"other", "png")
+    for artifact_id in (produced, other):
+        old = time.time() - 4000
+        os.utime(store._path(artifact_id), (old, old))
+
+    assert executor.sweep_artifacts() == 1
+    assert store.get_path(produced) is not None and store.get_path(other) is None
+
+    # 会话删除后产物可以被回收
+    executor.delete_session("live_artifacts")
+    old = time.time() - 4000
+    os.utime(store._path(produced), (old, old))
+    assert executor.sweep_artifacts() == 1
+    executor.shutdown()
+
+def test_overlapping_memory_profiles_marked_process_wide():
+    """测试多个执行同时统计内存分配时，内存分配峰值标明为整个进程的峰值"""
+    from app.services.code_executor.cell_profiler import CellProfiler
+
+    outer = CellProfiler(detailed=True)
+    with outer:
+        inner = CellProfiler(detailed=True)
+        with inner:
+            data = [0] * 100000
+    assert inner.result()["memory_peak_scope"] == "process"
+    assert outer.result()["memory_peak_scope"] == "process"
+
+    alone = CellProfiler(detailed=True)
+    with alone:
+        data = [0] * 100000
+    assert alone.result()["memory_peak_scope"] == "cell" and alone.result()["memory_peak_mb"] > 0
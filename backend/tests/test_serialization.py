@@ -0,0 +1,28 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from app.core import serialization
+
+def test_dumps_same_output_with_and_without_orjson(monkeypatch):
+    """测试 orjson 和标准库 json 对同一数据的编码结果相同"""
+    pytest.importorskip("orjson")
+    times = pd.Series([pd.Timestamp("2024-01-01 08:30:00.5"), pd.NaT, pd.Timestamp("2024-01-02")])
+    frame = pd.DataFrame({"x": [1.5, np.nan, np.inf], "t": times, "n": np.arange(3)})
+    content = {
+        "frame": frame,
+        "columns": dict(zip(frame.columns, serialization.sanitize_columns(frame))),
+        "complete_times": times.dropna().to_numpy(),
+        "scalars": [np.int64(3), np.float64("nan"), np.datetime64("2024-01-01T00:00:00.25"),
+                    pd.Timestamp("2024-01-01 00:00:00.123456789"), datetime.datetime(2024, 1, 1, 0, 0, 0, 500000)],
+        "matrix": np.array([[1.0, np.nan], [np.inf, 2.0]]),
+        "text": "中文",
+    }
+    # 含有 NaT 的 datetime64 数组和标量，各版本 orjson 的编码不同，先转换再编码
+    with_nat = {"times": times.to_numpy(), "nat": np.datetime64("NaT")}
+    fast, fast_nat = serialization.dumps(content), serialization.dumps(with_nat)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(content) == fast
+    assert serialization.dumps(with_nat) == fast_nat
+    assert fast_nat == b'{"times":["2024-01-01T08:30:00.500000",null,"2024-01-02T00:00:00"],"nat":null}'
+    assert b'"2024-01-01T08:30:00.500000"' in fast and b'"2024-01-02T00:00:00"' in fast
@@ -23,11 +23,14 @@ export const listDataFrames = async (session_id) => {
  * 获取指定DataFrame的详细信息
  * @param {string} session_id 会话ID
  * @param {string} name DataFrame名称
+ * @param {Array<string>} tiers 需要的信息层（basic、nulls、summary、preview），为空时返回全部
  * @returns {Promise<Object>} DataFrame的详细信息
  */
-export const getDataFrameInfo = async (session_id, name) => {
+export const getDataFrameInfo = async (session_id, name, tiers = null) => {
   try {
-    const result = await apiCall(API_ENDPOINTS.DATAFRAMES.INFO(session_id, name));
+    const result = await apiCall(API_ENDPOINTS.DATAFRAMES.INFO(session_id, name), {
+      params: tiers ? { tiers: tiers.join(',') } : undefined
+    });
     if (result.status === "success") {
       return result.data;
     } else {
@@ -39,6 +42,57 @@ export const getDataFrameInfo = async (session_id, name) => {
   }
 };
 
+/**
+ * 按位置分页读取DataFrame的行
+ * @param {string} session_id 会话ID
+ * @param {string} name DataFrame名称
+ * @param {number} offset 起始行号
+ * @param {number} limit 读取的行数（最多1000行）
+ * @param {Array<string>} columns 需要的列名，为空时返回全部列
+ * @returns {Promise<Object>} 总行数 total_rows、列名 columns、行索引 index 和按列排列的数据 data
+ */
+export const getDataFrameRows = async (session_id, name, offset = 0, limit = 100, columns = null) => {
+  try {
+    const result = await apiCall(API_ENDPOINTS.DATAFRAMES.ROWS, {
+      params: { session_id, name, offset, limit, columns: columns ? columns.join(',') : undefined }
+    });
+    if (result.status === "success") {
+      return result.data;
+    } else {
+      throw new Error(result.message || '读取DataFrame数据失败');
+    }
+  } catch (error) {
+    console.error('读取DataFrame数据失败:', error);
+    throw error;
+  }
+};
+
+/**
+ * 对DataFrame执行过滤、分组聚合和排序，并分页读取结果
+ * @param {string} session_id 会话ID
+ * @param {string} name DataFrame名称
+ * @param {Object} query 查询 {filters, group_by, aggregations, sort}
+ * @param {number} offset 结果中的起始行号
+ * @param {number} limit 读取的行数（最多1000行）
+ * @returns {Promise<Object>} 格式与 getDataFrameRows 相同，total_rows 为查询结果的总行数
+ */
+export const queryDataFrame = async (session_id, name, query, offset = 0, limit = 100) => {
+  try {
+    const result = await apiCall(API_ENDPOINTS.DATAFRAMES.QUERY, {
+      method: 'POST',
+      body: { session_id, name, query, offset, limit }
+    });
+    if (result.status === "success") {
+      return result.data;
+    } else {
+      throw new Error(result.message || '查询DataFrame失败');
+    }
+  } catch (error) {
+    console.error('查询DataFrame失败:', error);
+    throw error;
+  }
+};
+
 /**
  * 获取指定DataFrame的预览信息
  * @param {string} name DataFrame名称
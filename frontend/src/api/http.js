@@ -57,6 +57,10 @@ export const API_ENDPOINTS = {
   EXECUTION: {
     EXECUTE: '/api/execution/execute',
     RESET_CONTEXT: '/api/execution/reset_context',
+    STREAM: '/api/execution/ws',
+    INTERRUPT: '/api/execution/interrupt',
+    RASTER: '/api/execution/raster',
+    OUTPUT: '/api/execution/output',
   },
 
   // 数据框相关
@@ -64,7 +68,9 @@ export const API_ENDPOINTS = {
     LIST: (session_id) => `/api/dataframes/list?session_id=${session_id}`,
     PREVIEW: (name) => `/api/dataframes/preview/${name}`, // 获取DataFrame预览
     SAVE: (name) => `/api/dataframes/save/${name}`, // 保存DataFrame
-    INFO: (session_id, name) => `/api/dataframes/info?session_id=${session_id}&name=${name}` // 获取DataFrame信息
+    INFO: (session_id, name) => `/api/dataframes/info?session_id=${session_id}&name=${name}`, // 获取DataFrame信息
+    ROWS: '/api/dataframes/rows', // 分页读取DataFrame的行
+    QUERY: '/api/dataframes/query' // 过滤、分组聚合、排序DataFrame并分页读取结果
   }, 
 
   // 导出相关
@@ -82,6 +88,11 @@ export const getApiUrl = (endpoint) => {
   return `${API_CONFIG.BASE_URL}${endpoint}`
 }
 
+// 将输出HTML中的产物路径（/api/artifacts/...）替换为完整的API URL
+export const resolveArtifactUrls = (html) => {
+  return html ? html.replace(/src="\/api\/artifacts\//g, `src="${getApiUrl('/api/artifacts/')}`) : html
+}
+
 // 构建WebSocket URL
 export const getWsUrl = (endpoint) => {
   return `${API_CONFIG.WS_BASE_URL}${endpoint}`
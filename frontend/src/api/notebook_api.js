@@ -1,4 +1,9 @@
-import { apiCall, API_ENDPOINTS } from '@/api/http'
+import { apiCall, API_ENDPOINTS, API_CONFIG, getWsUrl } from '@/api/http'
+
+// 每次读取的完整输出大小（字节）
+const FULL_OUTPUT_PAGE_SIZE = 256 * 1024
+// 运行过程中显示的输出的最大字符数
+const STREAM_OUTPUT_MAX_CHARS = 200000
 
 /**
  * 获取笔记本列表
@@ -132,3 +137,136 @@ export const resetNotebook = async (session_id) => {
   }
 }
 
+/**
+ * 中断笔记本中正在执行的代码
+ * @param {string} session_id 会话ID
+ * @returns {Promise<Object>} 中断结果，interrupted 表示是否有代码被中断
+ */
+export const interruptNotebook = async (session_id) => {
+  try {
+    const result = await apiCall(API_ENDPOINTS.EXECUTION.INTERRUPT, {
+      method: 'POST',
+      body: { session_id: session_id }
+    })
+    if (result.status === 'success') {
+      return result
+    } else {
+      throw new Error(result.message || '中断执行失败')
+    }
+  } catch (error) {
+    console.error('中断执行失败:', error)
+    throw error
+  }
+}
+
+/**
+ * 按缩放后的坐标范围重新聚合被聚合为热力图的散点
+ * @param {Object} raster 热力图轨迹 meta.raster 中的 session_id 和 raster_id
+ * @param {Array|null} x_range 横坐标范围，为空时使用数据的范围
+ * @param {Array|null} y_range 纵坐标范围，为空时使用数据的范围
+ * @returns {Promise<Object>} 热力图的 z、x0、dx、y0、dy
+ */
+export const aggregateRaster = async (raster, x_range, y_range) => {
+  const result = await apiCall(API_ENDPOINTS.EXECUTION.RASTER, {
+    method: 'POST',
+    body: { ...raster, x_range, y_range }
+  })
+  if (result.status === 'success') {
+    return result.data
+  }
+  throw new Error(result.message || '重新聚合图形失败')
+}
+
+/**
+ * 分页读取执行结果中被截断的完整输出
+ * @param {string} session_id 会话ID
+ * @param {string} output_id 输出ID，位于执行结果的 output_truncated 中
+ * @param {number} offset 起始位置（字节），之后的页使用上一页返回的 next_offset
+ * @returns {Promise<Object>} 本页的 text、next_offset、size 和 done
+ */
+export const readFullOutput = async (session_id, output_id, offset = 0) => {
+  const result = await apiCall(API_ENDPOINTS.EXECUTION.OUTPUT, {
+    params: { session_id, output_id, offset, limit: FULL_OUTPUT_PAGE_SIZE }
+  })
+  if (result.status === 'success') {
+    return result.data
+  }
+  throw new Error(result.message || '读取完整输出失败')
+}
+
+/**
+ * 追加运行中推送的输出文本，只保留最后 STREAM_OUTPUT_MAX_CHARS 个字符，
+ * 执行结束后由执行结果中的输出（超长时已截断）替换
+ * @param {string} output 已显示的输出
+ * @param {string} text 新推送的文本
+ * @returns {string} 追加后的输出
+ */
+export const appendStreamOutput = (output, text) => {
+  const combined = output + text
+  return combined.length > STREAM_OUTPUT_MAX_CHARS ? combined.slice(-STREAM_OUTPUT_MAX_CHARS) : combined
+}
+
+/**
+ * 通过WebSocket执行代码，执行过程中实时接收输出
+ * @param {string} session_id 会话ID
+ * @param {string} code 要执行的代码
+ * @param {Function} onEvent 输出事件回调，事件类型为 stream（输出文本）或 display（图形）
+ * @param {string} cell_id 可选的单元格ID，用于服务端判断哪些单元格需要重新执行
+ * @returns {Promise<Object>} 执行结果，格式与 /api/execution/execute 的返回值相同
+ */
+export const executeCodeStream = (session_id, code, onEvent, cell_id = null) => {
+  return _streamExecution({ session_id, code, cell_id }, onEvent)
+}
+
+/**
+ * 通过WebSocket按顺序批量执行单元格，一次请求完成“全部运行”
+ * @param {string} session_id 会话ID
+ * @param {Array<{cell_id: string, code: string}>} cells 按笔记本顺序排列的代码单元格
+ * @param {Function} onEvent 事件回调：cell_start、stream、display、cell_result，均附带 cell_id
+ * @param {Object} options stop_on_error 单元格失败后是否停止（默认 true），stale_only 是否只执行过期的单元格
+ * @returns {Promise<Object>} executed 为已执行单元格的执行结果，skipped 为因前面的单元格失败而未执行的单元格
+ */
+export const executeCellsStream = (session_id, cells, onEvent, options = {}) => {
+  const { stop_on_error = true, stale_only = false } = options
+  return _streamExecution({ session_id, cells, stop_on_error, stale_only }, onEvent)
+}
+
+const _streamExecution = (payload, onEvent) => {
+  return new Promise((resolve, reject) => {
+    const url = API_CONFIG.WS_BASE_URL
+      ? getWsUrl(API_ENDPOINTS.EXECUTION.STREAM)
+      : `ws://127.0.0.1:8000${API_ENDPOINTS.EXECUTION.STREAM}`
+    const socket = new WebSocket(url)
+    let finished = false
+
+    socket.onopen = () => {
+      socket.send(JSON.stringify(payload))
+    }
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data)
+      if (event.type === 'result') {
+        finished = true
+        socket.close()
+        resolve(event.data)
+      } else if (event.type === 'error') {
+        finished = true
+        socket.close()
+        reject(new Error(event.message || '执行代码失败'))
+      } else if (onEvent) {
+        onEvent(event)
+      }
+    }
+    socket.onerror = () => {
+      if (!finished) {
+        finished = true
+        reject(new Error('执行连接异常'))
+      }
+    }
+    socket.onclose = () => {
+      if (!finished) {
+        finished = true
+        reject(new Error('执行连接已断开'))
+      }
+    }
+  })
+}
@@ -4,6 +4,7 @@ import { useNotebookStore } from '@/stores/notebookStore'
 import { useTabsStore } from '@/stores/tabsStore'
 import { v4 as uuidv4 } from 'uuid'
 import { useDataFrameStore } from '@/stores/dataframeStore'
+import { executeCellsStream, appendStreamOutput } from '@/api/notebook_api'
 
 export function useNotebook() {
   const store = useNotebookStore()
@@ -108,7 +109,7 @@ export function useNotebook() {
       store.setCellOutput(newCellId, {
         output: '',
         plot: '',
-        plotly_html: '',
+        plotly_json: '',
         status: 'idle'
       })
     } else if (type === 'markdown') {
@@ -126,6 +127,58 @@ export function useNotebook() {
     }
   }
 
+  // 通过一个WebSocket请求批量执行单元格，运行过程中逐个更新单元格输出
+  const _runCells = async (staleOnly) => {
+    const sessionId = store.session_id
+    const cells = store.cells
+      .filter(cellId => store.cellTypes[cellId] === 'code' && (store.cellContents[cellId] || '').trim())
+      .map(cellId => ({ cell_id: cellId, code: store.cellContents[cellId] }))
+    if (!cells.length) return null
+
+    const outputs = {}
+    const onEvent = (event) => {
+      const current = outputs[event.cell_id] || (outputs[event.cell_id] = { output: '', plot: '', plotly_json: '' })
+      if (event.type === 'stream') {
+        current.output = appendStreamOutput(current.output, event.text)
+      } else if (event.type === 'display') {
+        current.plot += event.plot || ''
+        current.plotly_json = event.plotly_json || current.plotly_json
+      } else if (event.type === 'cell_result') {
+        store.setCellOutput(event.cell_id, {
+          output: event.data.output || '',
+          plot: current.plot + (event.data.plot || ''),
+          plotly_json: event.data.plotly_json || current.plotly_json,
+          downsampled: event.data.downsampled || [],
+          output_truncated: event.data.output_truncated || null,
+          status: event.data.status || 'idle'
+        })
+        return
+      }
+      store.setCellOutput(event.cell_id, { ...current, status: 'running' })
+    }
+
+    try {
+      const result = await executeCellsStream(sessionId, cells, onEvent, { stale_only: staleOnly })
+      if (result.skipped.length) {
+        ElMessage.warning(`单元格执行失败，之后的 ${result.skipped.length} 个单元格未执行`)
+      }
+      if (result.executed.some(({ result: cellResult }) => cellResult.has_dataframes)) {
+        await _refreshDataFrame(sessionId)
+      }
+      return result
+    } catch (error) {
+      console.error('执行单元格失败:', error)
+      ElMessage.error('执行单元格失败: ' + error.message)
+      return null
+    }
+  }
+
+  // 全部运行
+  const runAll = () => _runCells(false)
+
+  // 只重新执行过期的单元格，上方未受影响的单元格（例如加载数据）不会重新执行
+  const runStale = () => _runCells(true)
+
   // 更改单元格类型
   const changeCellType = (cellId, newType) => {
     if (!cellId || store.cellTypes[cellId] === newType) return
@@ -140,7 +193,7 @@ export function useNotebook() {
       store.setCellOutput(cellId, {
         output: '',
         plot: '',
-        plotly_html: '',
+        plotly_json: '',
         status: 'idle'
       })
     } else if (newType === 'markdown') {
@@ -245,7 +298,7 @@ export function useNotebook() {
     store.setCellOutput(newCellId, {
       output: '',
       plot: '',
-      plotly_html: '',
+      plotly_json: '',
       status: 'idle'
     })
     
@@ -268,7 +321,7 @@ export function useNotebook() {
     store.setCellOutput(newCellId, {
       output: '',
       plot: '',
-      plotly_html: '',
+      plotly_json: '',
       status: 'idle'
     })
     
@@ -309,7 +362,7 @@ export function useNotebook() {
       store.setCellOutput(newCellId, {
         output: '',
         plot: '',
-        plotly_html: '',
+        plotly_json: '',
         status: 'idle'
       })
     } else if (cellType === 'markdown') {
@@ -361,6 +414,8 @@ export function useNotebook() {
     openNotebook,
     addCell,
     handleExecutionComplete,
+    runAll,
+    runStale,
     changeCellType,
     moveCellUp,
     moveCellDown,
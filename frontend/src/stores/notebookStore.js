@@ -136,7 +136,7 @@ export const useNotebookStore = defineStore('notebook', {
             output: notebook.cellTypes[cellId] === 'code' ? (notebook.cellOutputs[cellId] || {
               output: '',
               plot: '',
-              plotly_html: '',
+              plotly_json: '',
               status: 'idle'
             }) : null
           }))
@@ -185,6 +185,8 @@ export const useNotebookStore = defineStore('notebook', {
                 notebook.cellOutputs[cell.id] = {
                   output: cell.output?.output || '',
                   plot: cell.output?.plot || '',
+                  plotly_json: cell.output?.plotly_json || '',
+                  // 旧版本保存的plotly图形
                   plotly_html: cell.output?.plotly_html || '',
                   status: cell.output?.status || 'idle'
                 }
@@ -0,0 +1,107 @@
+// plotly图形的解码和绘制
+// 后端将轨迹中的数值数组编码为类型化数组 {dtype, bdata, shape}，这里解码为 TypedArray 后交给 Plotly 绘制
+import { aggregateRaster } from '@/api/notebook_api'
+
+const TYPED_ARRAYS = {
+  i1: Int8Array,
+  u1: Uint8Array,
+  i2: Int16Array,
+  u2: Uint16Array,
+  i4: Int32Array,
+  u4: Uint32Array,
+  f4: Float32Array,
+  f8: Float64Array
+}
+
+// 显示时覆盖的布局属性
+const LAYOUT_OVERRIDES = {
+  autosize: true,
+  margin: { t: 30, r: 10, b: 30, l: 60 },
+  height: null
+}
+
+const isTypedArraySpec = (value) => {
+  return value && typeof value === 'object' && typeof value.bdata === 'string' && TYPED_ARRAYS[value.dtype]
+}
+
+// 将base64编码的类型化数组解码为 TypedArray，二维数组解码为按行排列的 TypedArray 数组
+const decodeTypedArray = ({ dtype, bdata, shape }) => {
+  const binary = atob(bdata)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i)
+  }
+  const array = new TYPED_ARRAYS[dtype](bytes.buffer)
+  if (!shape || !String(shape).includes(',')) {
+    return array
+  }
+  const [rows, cols] = String(shape).split(',').map(Number)
+  return Array.from({ length: rows }, (_, row) => array.subarray(row * cols, (row + 1) * cols))
+}
+
+// 递归解码对象中的所有类型化数组
+export const decodeTypedArrays = (value) => {
+  if (isTypedArraySpec(value)) {
+    return decodeTypedArray(value)
+  }
+  if (Array.isArray(value)) {
+    return value.map(decodeTypedArrays)
+  }
+  if (value && typeof value === 'object') {
+    return Object.fromEntries(Object.entries(value).map(([key, item]) => [key, decodeTypedArrays(item)]))
+  }
+  return value
+}
+
+// 坐标轴当前的显示范围，自动范围时返回null（使用数据的范围）
+const axisRange = (container, axis) => {
+  const layoutAxis = container.layout[axis] || {}
+  return layoutAxis.autorange === false || (layoutAxis.range && layoutAxis.autorange !== true)
+    ? layoutAxis.range.map(Number)
+    : null
+}
+
+// 散点过多时后端将其聚合为热力图，缩放后按新的坐标范围重新聚合
+const bindRasterZoom = (container, data) => {
+  const rasters = data
+    .map((trace, index) => ({ index, trace }))
+    .filter(({ trace }) => trace.meta && trace.meta.raster)
+  if (!rasters.length) return
+  let sequence = 0
+  container.on('plotly_relayout', async (event) => {
+    // 只在坐标轴范围变化（缩放、平移、还原）时重新聚合
+    if (!Object.keys(event || {}).some(key => key.startsWith('xaxis') || key.startsWith('yaxis'))) return
+    const current = ++sequence
+    for (const { index, trace } of rasters) {
+      const xaxis = 'xaxis' + (trace.xaxis || 'x').slice(1)
+      const yaxis = 'yaxis' + (trace.yaxis || 'y').slice(1)
+      try {
+        const grid = await aggregateRaster(trace.meta.raster, axisRange(container, xaxis), axisRange(container, yaxis))
+        // 只应用最近一次缩放的结果
+        if (current !== sequence) return
+        await window.Plotly.restyle(container, {
+          z: [decodeTypedArrays(grid.z)],
+          x0: grid.x0,
+          dx: grid.dx,
+          y0: grid.y0,
+          dy: grid.dy
+        }, [index])
+      } catch (e) {
+        console.error('[Plotly] 重新聚合失败:', e)
+      }
+    }
+  })
+}
+
+// 在容器中绘制后端序列化的plotly图形（JSON字符串）
+export const renderPlotlyFigure = (container, figureJson) => {
+  if (!window.Plotly || !container || !figureJson) return Promise.resolve()
+  const figure = typeof figureJson === 'string' ? JSON.parse(figureJson) : figureJson
+  const data = decodeTypedArrays(figure.data || [])
+  const layout = { ...(figure.layout || {}), ...LAYOUT_OVERRIDES }
+  return window.Plotly.newPlot(container, data, layout, figure.config || {})
+    .then(() => {
+      bindRasterZoom(container, data)
+      window.dispatchEvent(new Event('resize'))
+    })
+}